@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+""" Micro-benchmark of the per-call overhead of QGConnector.request(), without any network I/O.
+
+The session is replaced by a stub returning a canned response, so the timings only cover
+call routing, payload formatting, logging and response handling.
+
+Usage: python benchmarks/bench_request_overhead.py [iterations]
+"""
+import logging
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import qualysapi.connector
+
+
+class StubResponse(object):
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+        self.headers = {'x-ratelimit-remaining': '300'}
+
+    def raise_for_status(self):
+        pass
+
+
+class StubSession(object):
+    def __init__(self, content):
+        self.response = StubResponse(content)
+
+    def get(self, url, **kwargs):
+        return self.response
+
+    def post(self, url, **kwargs):
+        return self.response
+
+
+def connector(content, plans=True):
+    qgc = qualysapi.connector.QGConnector(('username', 'password'), rate_limiter=False)
+    qgc.session = StubSession(content)
+    if not plans:
+        # Resolve the call plan on every request, like before plans were cached.
+        qgc.max_call_plans = 0
+    return qgc
+
+
+def bench(label, qgc, api_call, data, iterations):
+    seconds = min(timeit.repeat(lambda: qgc.request(api_call, data), number=iterations, repeat=3))
+    print('%-45s %8.1f us/call' % (label, seconds / iterations * 1e6))
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    # Debug logging disabled, as in production.
+    logging.basicConfig(level=logging.WARNING)
+    small = b'<SIMPLE_RETURN><RESPONSE><TEXT>OK</TEXT></RESPONSE></SIMPLE_RETURN>'
+    large = b'<HOST_LIST_OUTPUT>' + b'<HOST><ID>1</ID></HOST>' * 500000 + b'</HOST_LIST_OUTPUT>'
+    for api_call, data in (('/api/2.0/fo/asset/host/', {'action': 'list', 'ips': '10.0.0.1'}),
+                           ('asset_group_list.php', 'title=Servers'),
+                           ('search/am/tag', '<ServiceRequest/>')):
+        bench('%s, plan resolved every call' % api_call, connector(small, plans=False), api_call, data, iterations)
+        bench('%s, cached plan' % api_call, connector(small), api_call, data, iterations)
+    bench('%d MB response, cached plan' % (len(large) // 2 ** 20), connector(large), '/api/2.0/fo/asset/host/',
+          {'action': 'list'}, iterations // 100)
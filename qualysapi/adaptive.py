@@ -0,0 +1,216 @@
+""" Module that adapts how hard a connector drives the QualysGuard API to how the platform copes.
+
+AIMDLimiter grows the number of calls in flight while calls succeed at a steady latency, and halves it on
+409, 503 or rising latency. CircuitBreaker fails calls fast while the platform is degraded. Controller
+combines both with jittered retries of idempotent calls, honoring Retry-After and X-RateLimit-ToWait-Sec.
+"""
+import logging
+import random
+import threading
+import time
+
+import requests
+
+import qualysapi.exceptions as exceptions
+
+__author__ = 'Parag Baxi <parag.baxi@gmail.com>'
+__copyright__ = 'Copyright 2013, Parag Baxi'
+__license__ = 'Apache License 2.0'
+
+# Setup module level logging.
+logger = logging.getLogger(__name__)
+
+# Errors which mean the platform is overloaded: back off.
+overload_errors = (exceptions.RateLimited, exceptions.ConcurrencyLimit, exceptions.ServerError)
+# Errors which mean the platform is failing, counted by the circuit breaker.
+failure_errors = (exceptions.ServerError, requests.ConnectionError, requests.Timeout)
+
+
+class AIMDLimiter(object):
+    """ Thread-safe limit of calls in flight, additive increase & multiplicative decrease.
+
+    initial, minimum, maximum: Limit of calls in flight to start with, and its bounds (maximum None for none).
+    increase: Added to the limit once per limit successful calls, while the limit is in use.
+    decrease: Factor applied to the limit on overload, at most once per average latency.
+    latency_tolerance: A call is slow, and counts as overload, when its latency is above latency_tolerance times
+        the average latency of its api_call and action.
+    smoothing: Weight of a new latency in the average latency of its api_call and action.
+
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=None, increase=1, decrease=0.5, latency_tolerance=2.0,
+                 smoothing=0.1):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.in_flight = 0
+        # Average latency by (api_call, action), calls differ by orders of magnitude, e.g. a report list and
+        # fetch share their api_call.
+        self.latencies = {}
+        self._last_decrease = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """ Block until a call may be made within the limit.
+
+        """
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def cancel(self):
+        """ Give back the slot of an acquire() whose call was not made.
+
+        """
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def release(self, api_call, latency, overload=False, action=None):
+        """ Mark a call as finished after latency seconds, overload if the platform pushed back.
+
+        """
+        now = time.time()
+        key = (api_call, action)
+        with self._condition:
+            in_flight = self.in_flight
+            self.in_flight -= 1
+            average = self.latencies.get(key)
+            if latency is not None:
+                self.latencies[key] = latency if average is None else average + self.smoothing * (latency - average)
+            if latency is not None and average is not None and latency > self.latency_tolerance * average:
+                logger.debug('Latency of %s %s rose to %.2f seconds (average %.2f).', api_call, action, latency,
+                             average)
+                overload = True
+            if overload:
+                # One decrease per episode: calls in flight at the same time fail together.
+                if now - self._last_decrease >= (average or latency or 0):
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._last_decrease = now
+                    logger.info('Concurrency lowered to %d.', int(self.limit))
+            elif in_flight >= int(self.limit):
+                # Only grow a limit which is actually used.
+                limit = self.limit + float(self.increase) / self.limit
+                if self.maximum is not None:
+                    limit = min(limit, self.maximum)
+                if int(limit) > int(self.limit):
+                    logger.debug('Concurrency raised to %d.', int(limit))
+                self.limit = limit
+            self._condition.notify_all()
+
+
+class CircuitBreaker(object):
+    """ Thread-safe circuit breaker failing calls fast after failure_threshold consecutive failures.
+
+    Once open, calls raise CircuitOpen for reset_timeout seconds, then a single trial call is let through
+    (half open): its success closes the circuit, its failure opens it again.
+
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        # closed, open or half open.
+        self.state = 'closed'
+        self.opened = None
+        self._lock = threading.Lock()
+
+    def before(self):
+        """ Raise CircuitOpen unless a call may be made now.
+
+        """
+        with self._lock:
+            if self.state == 'closed':
+                return
+            if time.time() - self.opened >= self.reset_timeout:
+                # Also when a trial call never reported back.
+                logger.info('Circuit half open, trying a call.')
+                self.state = 'half open'
+                self.opened = time.time()
+                return
+            wait = max(0, self.opened + self.reset_timeout - time.time())
+            raise exceptions.CircuitOpen('Circuit open after %d failures, failing fast.' % self.failures,
+                                         retry_after=int(wait + 0.5) or None)
+
+    def success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info('Circuit closed.')
+            self.state = 'closed'
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+                logger.warning('Circuit open for %s seconds after %d failures.', self.reset_timeout, self.failures)
+                self.state = 'open'
+                self.opened = time.time()
+
+
+class Controller(object):
+    """ Adaptive control of a connector's calls (see QGConnector controller): an AIMDLimiter, a
+    CircuitBreaker, and retries of idempotent calls.
+
+    limiter, breaker: Defaults to an AIMDLimiter and a CircuitBreaker, None values of them to disable it.
+    retries: Number of times an idempotent (read) call is repeated on RateLimited, ConcurrencyLimit or
+        ServerError.
+    base_delay, max_delay: Retry n waits a random time up to min(max_delay, base_delay * 2 ** n) seconds,
+        or the time the API asks to wait (Retry-After, X-RateLimit-ToWait-Sec) plus up to base_delay.
+
+    """
+
+    def __init__(self, limiter=True, breaker=True, retries=3, base_delay=1, max_delay=60):
+        self.limiter = AIMDLimiter() if limiter is True else limiter
+        self.breaker = CircuitBreaker() if breaker is True else breaker
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def acquire(self):
+        """ Block until a call may be made, raise CircuitOpen if it may not be made at all.
+
+        """
+        if self.breaker:
+            self.breaker.before()
+        if self.limiter:
+            self.limiter.acquire()
+
+    def cancel(self):
+        """ Give back the slot of an acquire() whose call was not made, e.g. the rate limiter failed.
+
+        """
+        if self.limiter:
+            self.limiter.cancel()
+
+    def release(self, api_call, latency, error=None, action=None):
+        """ Record the outcome of a call made after acquire(): its latency in seconds (None if there was no
+        response), the exception it raised, if any, and its API v2 action.
+
+        """
+        if self.limiter:
+            self.limiter.release(api_call, latency, isinstance(error, overload_errors), action)
+        if self.breaker:
+            if isinstance(error, failure_errors):
+                self.breaker.failure()
+            elif error is None or isinstance(error, exceptions.QualysAPIError):
+                # The platform answered.
+                self.breaker.success()
+
+    def retry_delay(self, attempt, error):
+        """ Return seconds to wait before retry attempt (1 for the first) of a call which raised error, None
+        if it should not be retried.
+
+        """
+        if attempt > self.retries or not isinstance(error, overload_errors):
+            return None
+        if error.retry_after:
+            return error.retry_after + random.uniform(0, self.base_delay)
+        # Full jitter, so that callers which failed together do not retry together.
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
@@ -0,0 +1,188 @@
+""" Module that contains an asyncio connector for the QualysGuard API.
+
+Requires Python 3.5+ and aiohttp (http://aiohttp.readthedocs.io).
+"""
+import asyncio
+import logging
+import time
+
+import qualysapi.connector as qcconn
+import qualysapi.exceptions
+
+__author__ = 'Parag Baxi <parag.baxi@gmail.com>'
+__copyright__ = 'Copyright 2013, Parag Baxi'
+__license__ = 'Apache License 2.0'
+
+# Setup module level logging.
+logger = logging.getLogger(__name__)
+
+try:
+    import aiohttp
+except ImportError as e:
+    aiohttp = None
+    logger.warning('Warning: Cannot use AsyncQGConnector without aiohttp.')
+
+
+class AsyncQGConnector(qcconn.QGConnectorBase):
+    """ Qualys Connection class which allows asyncio requests to the QualysGuard API using HTTP-Basic
+    Authentication (over SSL).
+
+    Call routing is identical to QGConnector. Use it as an async context manager, or await close() when done:
+
+        async with AsyncQGConnector(auth) as qgc:
+            responses = await asyncio.gather(*[qgc.request(call, data) for call, data in calls])
+
+    max_connections: Maximum number of simultaneous connections (requests in flight).
+
+    The adaptive controller of QGConnector (qualysapi.adaptive) is not supported: it blocks threads, use
+    max_connections and the rate limiter to bound the load instead.
+
+    """
+    # Seconds between checks of the rate limiter while waiting for a call to be released.
+    limiter_poll_interval = 0.1
+
+
+    def __init__(self, auth, server='qualysapi.qualys.com', proxies=None, max_retries=3, max_connections=100,
+                 rate_limiter=None):
+        if aiohttp is None:
+            raise ImportError('AsyncQGConnector requires aiohttp.')
+        super(AsyncQGConnector, self).__init__(auth, server, proxies, rate_limiter)
+        # aiohttp does not retry failed connections, do it here.
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        # Session is created on first request so that it is bound to the running event loop.
+        self.session = None
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+    async def close(self):
+        """ Close the underlying aiohttp session.
+
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+    def _get_session(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self.session = aiohttp.ClientSession(connector=connector, auth=aiohttp.BasicAuth(*self.auth))
+        return self.session
+
+
+    def _form_items(self, data):
+        """ Return data as a list of (key, value) string pairs, expanding list values like requests does.
+
+        """
+        if data is None or not isinstance(data, dict):
+            return data
+        items = []
+        for key, value in data.items():
+            if isinstance(value, (list, tuple)):
+                items.extend((key, str(v)) for v in value)
+            else:
+                items.append((key, str(value)))
+        return items
+
+
+    async def _send(self, http_method, url, data, headers):
+        """ Return (response, text) of the request, retrying failed connections up to max_retries times.
+
+        """
+        session = self._get_session()
+        proxy = self.proxies.get('https') if self.proxies else None
+        data = self._form_items(data)
+        attempt = 0
+        while True:
+            try:
+                if http_method == 'get':
+                    logger.debug('GET request.')
+                    request = session.get(url, params=data, headers=headers, proxy=proxy)
+                else:
+                    logger.debug('POST request.')
+                    request = session.post(url, data=data, headers=headers, proxy=proxy)
+                async with request as response:
+                    text = await response.text()
+                    return response, text
+            except aiohttp.ClientConnectionError as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning('Connection failed (%s), retry #%d.', e, attempt)
+
+
+    async def request(self, api_call, data=None, api_version=None, http_method=None, concurrent_scans_retries=0,
+                      concurrent_scans_retry_delay=0):
+        """ Return QualysGuard API response text.
+
+        Error responses raise the matching qualysapi.exceptions.QualysAPIError, as with QGConnector.request().
+
+        """
+        logger.debug('api_call =\n%s', api_call)
+        logger.debug('api_version =\n%s', api_version)
+        logger.debug('data %s =\n %s', type(data), data)
+        logger.debug('http_method =\n%s', http_method)
+        concurrent_scans_retries = int(concurrent_scans_retries)
+        concurrent_scans_retry_delay = int(concurrent_scans_retry_delay)
+        api_call, api_version, http_method, url, headers, data = self.prepare_request(api_call, data, api_version,
+                                                                                      http_method)
+        # Make request at least once (more if concurrent_retry is enabled).
+        retries = 0
+        while retries <= concurrent_scans_retries:
+            logger.debug('url =\n%s', url)
+            if self.rate_limiter:
+                # Poll the limiter rather than block an executor thread in it: a task cancelled while waiting
+                # holds no lease, and the loop's default executor stays free.
+                while True:
+                    delay = self.rate_limiter.try_acquire(api_call)
+                    if delay == 0:
+                        break
+                    await asyncio.sleep(self.limiter_poll_interval if delay is None else delay)
+            start = time.time()
+            try:
+                request, response = await self._send(http_method, url, data, headers)
+            except Exception:
+                self.metrics.record(api_call, time.time() - start, 'error')
+                raise
+            finally:
+                if self.rate_limiter:
+                    self.rate_limiter.release(api_call)
+            self.metrics.record(api_call, time.time() - start, request.status, len(response), request.headers)
+            logger.debug('response headers =\n%s', request.headers)
+            # Remember how many times left user can make against api_call.
+            self.remember_rate_limit(api_call, request.headers)
+            if self.rate_limiter:
+                self.rate_limiter.update(api_call, request.headers)
+            logger.debug('response text =\n%s', response)
+            # Keep track of how many retries.
+            retries += 1
+            # Classify the response from its status, content type and head, whatever the size of the body.
+            try:
+                qualysapi.exceptions.check_response(request.status, request.headers, response, request)
+            except qualysapi.exceptions.ConcurrentScanLimit:
+                # Hit concurrent scan limit.
+                logger.critical(response)
+                if retries <= concurrent_scans_retries:
+                    self.metrics.record_retry(api_call)
+                    # Delay next try by concurrent_scans_retry_delay without blocking the event loop.
+                    logger.warning('Waiting %d seconds until next try.', concurrent_scans_retry_delay)
+                    await asyncio.sleep(concurrent_scans_retry_delay)
+                    logger.critical('Retry #%d', retries)
+                    continue
+                logger.critical('Alert! Ran out of concurrent_scans_retries!')
+                raise
+            except qualysapi.exceptions.QualysAPIError as e:
+                logger.error('Error! %s', e)
+                logger.error('Content = \n%s', response[:qualysapi.exceptions.HEAD_SIZE])
+                logger.error('Headers = \n%s', request.headers)
+                raise
+            break
+        return response
@@ -1,107 +1,103 @@
-from lxml import objectify
 import qualysapi.api_objects
+import qualysapi.parsers as parsers
+import qualysapi.stream as stream
+import qualysapi.tables as tables
 from qualysapi.api_objects import *
 
 class QGActions(object):  
-    def getHost(host):
+    def getHost(self, host):
         call = '/api/2.0/fo/asset/host/'
         parameters = {'action': 'list', 'ips': host, 'details': 'All'}
-        hostData = objectify.fromstring(self.request(call, parameters)).RESPONSE
+        hostData = stream.parse_response(self.request(call, parameters), objectified=True).RESPONSE
         try:
-            hostData = hostData.HOST_LIST.HOST
-            return Host(hostData.DNS, hostData.ID, hostData.IP, hostData.LAST_VULN_SCAN_DATETIME, hostData.NETBIOS, hostData.OS, hostData.TRACKING_METHOD)
+            # Hosts never scanned have no LAST_VULN_SCAN_DATETIME, from_element leaves their last_scan None.
+            return Host.from_element(hostData.HOST_LIST.HOST)
         except AttributeError:
             return Host("", "", host, "never", "", "", "")
         
     def getHostRange(self, start, end):
         call = '/api/2.0/fo/asset/host/'
         parameters = {'action': 'list', 'ips': start+'-'+end}
-        hostData = objectify.fromstring(self.request(call, parameters))
-        hostArray = []
-        for host in hostData.RESPONSE.HOST_LIST.HOST:
-            hostArray.append(Host(host.DNS, host.ID, host.IP, host.LAST_VULN_SCAN_DATETIME, host.NETBIOS, host.OS, host.TRACKING_METHOD))
-            
-        return hostArray
+        return Host.from_elements(self.paginate(call, parameters, 'HOST'))
+        
+    def iterHostRange(self, start, end):
+        # Streaming variant of getHostRange, yields one Host at a time.
+        call = '/api/2.0/fo/asset/host/'
+        parameters = {'action': 'list', 'ips': start+'-'+end}
+        for host in self.iter_records(call, parameters, 'HOST', parsers.host_fields):
+            yield Host.from_element(host)
+        
+    def getHostTable(self, **parameters):
+        # Columnar variant of getHostRange, parameters are host list API parameters (ips, details, etc).
+        call = '/api/2.0/fo/asset/host/'
+        parameters['action'] = 'list'
+        return tables.HostTable.from_elements(self.iter_records(call, parameters, 'HOST', tables.host_fields))
+        
+    def getDetectionTable(self, **parameters):
+        # Parameters are host detection list API parameters (ips, qids, severities, status, etc).
+        call = '/api/2.0/fo/asset/host/vm/detection/'
+        parameters['action'] = 'list'
+        return tables.DetectionTable.from_elements(self.iter_records(call, parameters, 'HOST',
+                                                                     tables.detection_fields))
         
     def listAssetGroups(self, groupName=''):
         call = 'asset_group_list.php'
         if groupName == '':
-            agData = objectify.fromstring(self.request(call))
+            agData = stream.parse_response(self.request(call))
         else:
-            agData = objectify.fromstring(self.request(call, 'title='+groupName)).RESPONSE
-            
-        groupsArray = []
-        scanipsArray = []
-        scandnsArray = []
-        scannersArray = []
-        for group in agData.ASSET_GROUP:
-            try:
-                for scanip in group.SCANIPS:
-                    scanipsArray.append(scanip.IP)
-            except AttributeError:
-                scanipsArray = [] # No IPs defined to scan.
-                
-            try:
-                for scanner in group.SCANNER_APPLIANCES.SCANNER_APPLIANCE:
-                    scannersArray.append(scanner.SCANNER_APPLIANCE_NAME)
-            except AttributeError:
-                scannersArray = [] # No scanner appliances defined for this group.
-                
-            try:
-                for dnsName in group.SCANDNS:
-                    scandnsArray.append(dnsName.DNS)
-            except AttributeError:
-                scandnsArray = [] # No DNS names assigned to group.
-                
-            groupsArray.append(AssetGroup(group.BUSINESS_IMPACT, group.ID, group.LAST_UPDATE, scanipsArray, scandnsArray, scannersArray, group.TITLE))
-            
-        return groupsArray
+            agData = stream.parse_response(self.request(call, 'title='+groupName))
+        return AssetGroup.from_elements(agData.iter('ASSET_GROUP'))
         
        
     def listReportTemplates(self):
         call = 'report_template_list.php'
-        rtData = objectify.fromstring(self.request(call))
-        templatesArray = []
-        
-        for template in rtData.REPORT_TEMPLATE:
-            templatesArray.append(ReportTemplate(template.GLOBAL, template.ID, template.LAST_UPDATE, template.TEMPLATE_TYPE, template.TITLE, template.TYPE, template.USER))
-        
-        return templatesArray
+        rtData = stream.parse_response(self.request(call))
+        return ReportTemplate.from_elements(rtData.iter('REPORT_TEMPLATE'))
         
     def listReports(self, id=0):
         call = '/api/2.0/fo/report'
         
         if id == 0:
             parameters = {'action': 'list'}
-            
-            repData = objectify.fromstring(self.request(call, parameters)).RESPONSE
-            reportsArray = []
-        
-            for report in repData.REPORT_LIST.REPORT:
-                reportsArray.append(Report(report.EXPIRATION_DATETIME, report.ID, report.LAUNCH_DATETIME, report.OUTPUT_FORMAT, report.SIZE, report.STATUS, report.TYPE, report.USER_LOGIN))
-        
-            return reportsArray
+            repData = stream.parse_response(self.request(call, parameters))
+            return Report.from_elements(repData.iterfind('RESPONSE/REPORT_LIST/REPORT'))
             
         else:
             parameters = {'action': 'list', 'id': id}
-            repData = objectify.fromstring(self.request(call, parameters)).RESPONSE.REPORT_LIST.REPORT
-            return Report(repData.EXPIRATION_DATETIME, repData.ID, repData.LAUNCH_DATETIME, repData.OUTPUT_FORMAT, repData.SIZE, repData.STATUS, repData.TYPE, repData.USER_LOGIN)
+            repData = stream.parse_response(self.request(call, parameters))
+            return Report.from_element(repData.find('RESPONSE/REPORT_LIST/REPORT'))
+        
+    def iterReports(self):
+        # Streaming variant of listReports, yields one Report at a time.
+        call = '/api/2.0/fo/report'
+        parameters = {'action': 'list'}
+        for report in self.iter_records(call, parameters, 'REPORT', parsers.report_fields):
+            yield Report.from_element(report)
         
         
     def notScannedSince(self, days):
         call = '/api/2.0/fo/asset/host/'
         parameters = {'action': 'list', 'details': 'All'}
-        hostData = objectify.fromstring(self.request(call, parameters))
         hostArray = []
         today = datetime.date.today()
-        for host in hostData.RESPONSE.HOST_LIST.HOST:
-            last_scan = str(host.LAST_VULN_SCAN_DATETIME).split('T')[0]
-            last_scan = datetime.date(int(last_scan.split('-')[0]), int(last_scan.split('-')[1]), int(last_scan.split('-')[2]))
-            if (today - last_scan).days >= days:
-                hostArray.append(Host(host.DNS, host.ID, host.IP, host.LAST_VULN_SCAN_DATETIME, host.NETBIOS, host.OS, host.TRACKING_METHOD))
+        for host in self.paginate(call, parameters, 'HOST'):
+            host = Host.from_element(host)
+            # Hosts never scanned have no last_scan.
+            if host.last_scan is None or (today - host.last_scan.date()).days >= days:
+                hostArray.append(host)
         
         return hostArray
         
+    def iterNotScannedSince(self, days):
+        # Streaming variant of notScannedSince, yields one Host at a time.
+        call = '/api/2.0/fo/asset/host/'
+        parameters = {'action': 'list', 'details': 'All'}
+        today = datetime.date.today()
+        for host in self.iter_records(call, parameters, 'HOST', parsers.host_fields):
+            host = Host.from_element(host)
+            if host.last_scan is None or (today - host.last_scan.date()).days >= days:
+                yield host
+        
     def addIP(self, ips, vmpc):
         #'ips' parameter accepts comma-separated list of IP addresses.
         #'vmpc' parameter accepts 'vm', 'pc', or 'both'. (Vulnerability Managment, Policy Compliance, or both)
@@ -118,13 +114,12 @@ class QGActions(object):
         parameters = {'action': 'add', 'ips': ips, 'enable_vm': enablevm, 'enable_pc': enablepc}
         self.request(call, parameters)
         
-    def listScans(self, launched_after="", state="", target="", type="", user_login=""):
+    def _scanListParameters(self, launched_after="", state="", target="", type="", user_login=""):
         #'launched_after' parameter accepts a date in the format: YYYY-MM-DD
         #'state' parameter accepts "Running", "Paused", "Canceled", "Finished", "Error", "Queued", and "Loading".
         #'title' parameter accepts a string
         #'type' parameter accepts "On-Demand", and "Scheduled".
         #'user_login' parameter accepts a user name (string)
-        call = '/api/2.0/fo/scan/'
         parameters = {'action': 'list', 'show_ags': 1, 'show_op': 1, 'show_status': 1}
         if launched_after != "":
             parameters['launched_after_datetime'] = launched_after
@@ -141,7 +136,12 @@ class QGActions(object):
         if user_login != "":
             parameters['user_login'] = user_login
             
-        scanlist = objectify.fromstring(self.request(call, parameters))
+        return parameters
+        
+    def listScans(self, launched_after="", state="", target="", type="", user_login=""):
+        call = '/api/2.0/fo/scan/'
+        parameters = self._scanListParameters(launched_after, state, target, type, user_login)
+        scanlist = stream.parse_response(self.request(call, parameters), objectified=True)
         scanArray = []
         for scan in scanlist.RESPONSE.SCAN_LIST.SCAN:
             try:
@@ -155,6 +155,13 @@ class QGActions(object):
             
         return scanArray
         
+    def iterScans(self, launched_after="", state="", target="", type="", user_login=""):
+        # Streaming variant of listScans, yields one Scan at a time.
+        call = '/api/2.0/fo/scan/'
+        parameters = self._scanListParameters(launched_after, state, target, type, user_login)
+        for scan in self.iter_records(call, parameters, 'SCAN', parsers.scan_fields):
+            yield Scan.from_element(scan)
+        
     def launchScan(self, title, option_title, iscanner_name, asset_groups="", ip=""):
         # TODO: Add ability to scan by tag.
         call = '/api/2.0/fo/scan/'
@@ -165,12 +172,12 @@ class QGActions(object):
         if asset_groups == "":
             parameters.pop("asset_groups")
             
-        scan_ref = objectify.fromstring(self.request(call, parameters)).RESPONSE.ITEM_LIST.ITEM[1].VALUE
+        scan_ref = stream.parse_response(self.request(call, parameters), objectified=True).RESPONSE.ITEM_LIST.ITEM[1].VALUE
         
         call = '/api/2.0/fo/scan/'
         parameters = {'action': 'list', 'scan_ref': scan_ref, 'show_status': 1, 'show_ags': 1, 'show_op': 1}
         
-        scan = objectify.fromstring(self.request(call, parameters)).RESPONSE.SCAN_LIST.SCAN
+        scan = stream.parse_response(self.request(call, parameters), objectified=True).RESPONSE.SCAN_LIST.SCAN
         try:
             agList = []
             for ag in scan.ASSET_GROUP_TITLE_LIST.ASSET_GROUP_TITLE:
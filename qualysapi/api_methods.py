@@ -61,6 +61,26 @@ api_methods['1 post'] = set([
     'user.php',
     'user_list.php',
 ])
+# API v1 methods that only read data (safe to cache).
+api_methods['1 read'] = set([
+    'about.php',
+    'asset_domain_list.php',
+    'asset_group_list.php',
+    'asset_ip_list.php',
+    'asset_range_info.php',
+    'asset_search.php',
+    'get_host_info.php',
+    'iscanner_list.php',
+    'map_report_list.php',
+    'report_template_list.php',
+    'scan_report_list.php',
+    'scan_running_list.php',
+    'scan_target_history.php',
+    'ticket_list.php',
+    'ticket_list_deleted.php',
+    'time_zone_code.php',
+    'user_list.php',
+])
 # API v2 methods (they're all POST).
 api_methods['2'] = set([
     'api/2.0/fo/appliance/',
@@ -100,6 +120,10 @@ for auth_type in set([
     'windows',
 ]):
     api_methods['2'].add('api/2.0/fo/auth/%s/' % auth_type)
+# API v2 actions that only read data (safe to cache).
+api_methods['2 read actions'] = set([
+    'list',
+])
 # WAS GET methods when no POST data.
 api_methods['was no data get'] = set([
     'count/was/report',
@@ -1,83 +1,253 @@
 import datetime
-from lxml import objectify
+import gzip
+import os
+import tempfile
+
+import qualysapi.stream
+
+try:
+    intern
+except NameError:
+    # Python 3.
+    from sys import intern
+
+
+def _intern(value):
+    """ Return value as a str shared by all records with the same value, e.g. OS names & statuses.
+
+    """
+    value = str(value)
+    try:
+        return intern(value)
+    except TypeError:
+        return value
+
+
+def parse_datetime(value):
+    """ Return datetime of QualysGuard ISO-8601 timestamp value ('2013-07-03T10:31:57Z'), None if there is none.
+
+    """
+    value = str(value)
+    if len(value) < 10 or value[4] != '-':
+        # Empty, 'never', etc.
+        return None
+    if len(value) < 19:
+        return datetime.datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+    return datetime.datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                             int(value[11:13]), int(value[14:16]), int(value[17:19]))
+
 
 class Host(object):
+    __slots__ = ('dns', 'id', 'ip', 'last_scan', 'netbios', 'os', 'tracking_method')
+
     def __init__(self, dns, id, ip, last_scan, netbios, os, tracking_method):
         self.dns = str(dns)
         self.id = int(id)
         self.ip = str(ip)
-        last_scan = str(last_scan).replace('T', ' ').replace('Z', '').split(' ')
-        date = last_scan[0].split('-')
-        time = last_scan[1].split(':')
-        self.last_scan = datetime.datetime(int(date[0]), int(date[1]), int(date[2]), int(time[0]), int(time[1]), int(time[2]))
+        self.last_scan = parse_datetime(last_scan)
         self.netbios = str(netbios)
-        self.os = str(os)
-        self.tracking_method = str(tracking_method)
+        self.os = _intern(os)
+        self.tracking_method = _intern(tracking_method)
+
+    @classmethod
+    def from_element(cls, host):
+        """ Return Host built from a HOST element (lxml.etree or objectify).
+
+        """
+        return cls(host.findtext('DNS', ''), host.findtext('ID'), host.findtext('IP'),
+                   host.findtext('LAST_VULN_SCAN_DATETIME', ''), host.findtext('NETBIOS', ''),
+                   host.findtext('OS', ''), host.findtext('TRACKING_METHOD', ''))
+
+    @classmethod
+    def from_elements(cls, hosts):
+        """ Return list of Host built from an iterable of HOST elements, e.g. root.iter('HOST').
+
+        """
+        from_element = cls.from_element
+        return [from_element(host) for host in hosts]
         
 class AssetGroup(object):
+    __slots__ = ('business_impact', 'id', 'last_update', 'scanips', 'scandns', 'scanner_appliances', 'title')
+
     def __init__(self, business_impact, id, last_update, scanips, scandns, scanner_appliances, title):
-        self.business_impact = str(business_impact)
+        self.business_impact = _intern(business_impact)
         self.id = int(id)
         self.last_update = str(last_update)
         self.scanips = scanips
         self.scandns = scandns
         self.scanner_appliances = scanner_appliances
         self.title = str(title)
+
+    @classmethod
+    def from_element(cls, group):
+        """ Return AssetGroup built from an ASSET_GROUP element (lxml.etree or objectify).
+
+        """
+        return cls(group.findtext('BUSINESS_IMPACT', ''), group.findtext('ID'), group.findtext('LAST_UPDATE', ''),
+                   [ip.text for ip in group.iterfind('SCANIPS/IP')],
+                   [dns.text for dns in group.iterfind('SCANDNS/DNS')],
+                   [name.text for name in
+                    group.iterfind('SCANNER_APPLIANCES/SCANNER_APPLIANCE/SCANNER_APPLIANCE_NAME')],
+                   group.findtext('TITLE', ''))
+
+    @classmethod
+    def from_elements(cls, groups):
+        """ Return list of AssetGroup built from an iterable of ASSET_GROUP elements.
+
+        """
+        from_element = cls.from_element
+        return [from_element(group) for group in groups]
         
-    def addAsset(conn, ip):
+    def addAsset(self, conn, ip):
         call = '/api/2.0/fo/asset/group/'
         parameters = {'action': 'edit', 'id': self.id, 'add_ips': ip}
         conn.request(call, parameters)
         self.scanips.append(ip)
         
-    def setAssets(conn, ips):
+    def setAssets(self, conn, ips):
         call = '/api/2.0/fo/asset/group/'
         parameters = {'action': 'edit', 'id': self.id, 'set_ips': ips}
         conn.request(call, parameters)
         
 class ReportTemplate(object):
+    __slots__ = ('isGlobal', 'id', 'last_update', 'template_type', 'title', 'type', 'user')
+
     def __init__(self, isGlobal, id, last_update, template_type, title, type, user):
         self.isGlobal = int(isGlobal)
         self.id = int(id)
-        self.last_update = str(last_update).replace('T', ' ').replace('Z', '').split(' ')
-        self.template_type = template_type
-        self.title = title
-        self.type = type
-        self.user = user.LOGIN
+        self.last_update = parse_datetime(last_update)
+        self.template_type = _intern(template_type)
+        self.title = str(title)
+        self.type = _intern(type)
+        # Objectified USER element, or its LOGIN text.
+        self.user = _intern(getattr(user, 'LOGIN', user))
+
+    @classmethod
+    def from_element(cls, template):
+        """ Return ReportTemplate built from a REPORT_TEMPLATE element (lxml.etree or objectify).
+
+        """
+        return cls(template.findtext('GLOBAL'), template.findtext('ID'), template.findtext('LAST_UPDATE', ''),
+                   template.findtext('TEMPLATE_TYPE'), template.findtext('TITLE'), template.findtext('TYPE'),
+                   template.findtext('USER/LOGIN'))
+
+    @classmethod
+    def from_elements(cls, templates):
+        """ Return list of ReportTemplate built from an iterable of REPORT_TEMPLATE elements.
+
+        """
+        from_element = cls.from_element
+        return [from_element(template) for template in templates]
         
 class Report(object):
+    __slots__ = ('expiration_datetime', 'id', 'launch_datetime', 'output_format', 'size', 'status', 'type',
+                 'user_login')
+
     def __init__(self, expiration_datetime, id, launch_datetime, output_format, size, status, type, user_login):
-        self.expiration_datetime = str(expiration_datetime).replace('T', ' ').replace('Z', '').split(' ')
+        self.expiration_datetime = parse_datetime(expiration_datetime)
         self.id = int(id)
-        self.launch_datetime = str(launch_datetime).replace('T', ' ').replace('Z', '').split(' ')
-        self.output_format = output_format
-        self.size = size
-        self.status = status.STATE
-        self.type = type
-        self.user_login = user_login
+        self.launch_datetime = parse_datetime(launch_datetime)
+        self.output_format = _intern(output_format)
+        self.size = str(size)
+        # Objectified STATUS element, or its STATE text.
+        self.status = _intern(getattr(status, 'STATE', status))
+        self.type = _intern(type)
+        self.user_login = _intern(user_login)
+
+    @classmethod
+    def from_element(cls, report):
+        """ Return Report built from a REPORT element (lxml.etree or objectify).
+
+        """
+        return cls(report.findtext('EXPIRATION_DATETIME', ''), report.findtext('ID'),
+                   report.findtext('LAUNCH_DATETIME', ''),
+                   report.findtext('OUTPUT_FORMAT'), report.findtext('SIZE'), report.findtext('STATUS/STATE'),
+                   report.findtext('TYPE'), report.findtext('USER_LOGIN'))
+
+    @classmethod
+    def from_elements(cls, reports):
+        """ Return list of Report built from an iterable of REPORT elements.
+
+        """
+        from_element = cls.from_element
+        return [from_element(report) for report in reports]
         
-    def download(self, conn):
+    def download(self, conn, path=None, compress=False):
+        """ Return fetched report, or if path is given, stream it to path and return path. Nothing is returned
+        unless the report is Finished.
+
+        The report is written to a temporary file next to path first and renamed when complete, so path never
+        holds a partial report. If compress, the file is gzip compressed on the fly.
+
+        """
         call = '/api/2.0/fo/report'
         parameters = {'action': 'fetch', 'id': self.id}
-        if self.status == 'Finished':
+        if self.status != 'Finished':
+            return None
+        if path is None:
             return conn.request(call, parameters)
+        response = conn.request(call, parameters, stream=True)
+        directory, filename = os.path.split(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.%s.' % filename)
+        renamed = False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                out = gzip.GzipFile(filename, 'wb', fileobj=f) if compress else f
+                try:
+                    for chunk in response:
+                        out.write(chunk)
+                finally:
+                    if compress:
+                        out.close()
+            try:
+                os.rename(temp_path, path)
+            except OSError:
+                # Windows does not replace existing files.
+                os.remove(path)
+                os.rename(temp_path, path)
+            renamed = True
+        finally:
+            response.close()
+            # Also when interrupted, e.g. KeyboardInterrupt: never leave a partial report behind.
+            if not renamed and os.path.exists(temp_path):
+                os.remove(temp_path)
+        return path
         
 class Scan(object):
+    __slots__ = ('assetgroups', 'duration', 'launch_datetime', 'option_profile', 'processed', 'ref', 'status',
+                 'target', 'title', 'type', 'user_login')
+
     def __init__(self, assetgroups, duration, launch_datetime, option_profile, processed, ref, status, target, title, type, user_login):
-        self.assetgroups = assetgroups
+        self.assetgroups = [_intern(ag) for ag in assetgroups]
         self.duration = str(duration)
-        launch_datetime = str(launch_datetime).replace('T', ' ').replace('Z', '').split(' ')
-        date = launch_datetime[0].split('-')
-        time = launch_datetime[1].split(':')
-        self.launch_datetime = datetime.datetime(int(date[0]), int(date[1]), int(date[2]), int(time[0]), int(time[1]), int(time[2]))
-        self.option_profile = str(option_profile)
+        self.launch_datetime = parse_datetime(launch_datetime)
+        self.option_profile = _intern(option_profile)
         self.processed = int(processed)
         self.ref = str(ref)
-        self.status = str(status.STATE)
+        self.status = _intern(getattr(status, 'STATE', status))
         self.target = str(target).split(', ')
         self.title = str(title)
-        self.type = str(type)
-        self.user_login = str(user_login)
+        self.type = _intern(type)
+        self.user_login = _intern(user_login)
+
+    @classmethod
+    def from_element(cls, scan):
+        """ Return Scan built from a SCAN element (lxml.etree or objectify).
+
+        """
+        asset_groups = [ag.text for ag in scan.iterfind('ASSET_GROUP_TITLE_LIST/ASSET_GROUP_TITLE')]
+        return cls(asset_groups, scan.findtext('DURATION'), scan.findtext('LAUNCH_DATETIME'),
+                   scan.findtext('OPTION_PROFILE/TITLE'), scan.findtext('PROCESSED'), scan.findtext('REF'),
+                   scan.findtext('STATUS/STATE'), scan.findtext('TARGET'), scan.findtext('TITLE'),
+                   scan.findtext('TYPE'), scan.findtext('USER_LOGIN'))
+
+    @classmethod
+    def from_elements(cls, scans):
+        """ Return list of Scan built from an iterable of SCAN elements.
+
+        """
+        from_element = cls.from_element
+        return [from_element(scan) for scan in scans]
         
     def cancel(self, conn):
         cancelled_statuses = ['Cancelled', 'Finished', 'Error']
@@ -89,7 +259,7 @@ class Scan(object):
             conn.request(call, parameters)
             
             parameters = {'action': 'list', 'scan_ref': self.ref, 'show_status': 1}
-            self.status = objectify.fromstring(conn.request(call, parameters)).RESPONSE.SCAN_LIST.SCAN.STATUS.STATE
+            self.status = _intern(qualysapi.stream.parse_response(conn.request(call, parameters), objectified=True).RESPONSE.SCAN_LIST.SCAN.STATUS.STATE)
             
     def pause(self, conn):
         if self.status != "Running":
@@ -100,7 +270,7 @@ class Scan(object):
             conn.request(call, parameters)
             
             parameters = {'action': 'list', 'scan_ref': self.ref, 'show_status': 1}
-            self.status = objectify.fromstring(conn.request(call, parameters)).RESPONSE.SCAN_LIST.SCAN.STATUS.STATE
+            self.status = _intern(qualysapi.stream.parse_response(conn.request(call, parameters), objectified=True).RESPONSE.SCAN_LIST.SCAN.STATUS.STATE)
             
     def resume(self, conn):
         if self.status != "Paused":
@@ -111,4 +281,4 @@ class Scan(object):
             conn.request(call, parameters)
             
             parameters = {'action': 'list', 'scan_ref': self.ref, 'show_status': 1}
-            self.status = objectify.fromstring(conn.request(call, parameters)).RESPONSE.SCAN_LIST.SCAN.STATUS.STATE
\ No newline at end of file
+            self.status = _intern(qualysapi.stream.parse_response(conn.request(call, parameters), objectified=True).RESPONSE.SCAN_LIST.SCAN.STATUS.STATE)
\ No newline at end of file
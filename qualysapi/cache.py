@@ -0,0 +1,177 @@
+""" Module that contains an opt-in cache for responses of read-only QualysGuard API calls.
+
+Responses are kept in an in-memory LRU in front of an optional on-disk store of
+zlib compressed files, and expire after a per-call time to live. Only calls with a time to live are
+cached, and a write call drops the cached responses of its endpoint.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+__author__ = 'Parag Baxi <parag.baxi@gmail.com>'
+__copyright__ = 'Copyright 2013, Parag Baxi'
+__license__ = 'Apache License 2.0'
+
+# Setup module level logging.
+logger = logging.getLogger(__name__)
+
+# Time to live in seconds for calls which rarely change, keyed by formatted api_call.
+default_ttls = {
+    'asset_group_list.php': 15 * 60,
+    'iscanner_list.php': 60 * 60,
+    'report_template_list.php': 60 * 60,
+    'api/2.0/fo/knowledge_base/vuln/': 24 * 60 * 60,
+    'api/2.0/fo/subscription/option_profile/': 60 * 60,
+}
+
+
+def endpoint_key(api_call):
+    """ Return the prefix of the cache keys of the calls to api_call.
+
+    """
+    return hashlib.sha1(repr(api_call).encode('utf-8')).hexdigest()[:12]
+
+
+def cache_key(api_version, api_call, data):
+    """ Return a normalized key for the call, independent of the order of data parameters. Keys of the same
+    api_call share its endpoint_key() prefix.
+
+    """
+    if isinstance(data, dict):
+        items = []
+        for name in sorted(data):
+            value = data[name]
+            if not isinstance(value, (list, tuple)):
+                value = [value]
+            items.append((str(name), tuple(str(v) for v in value)))
+        data = tuple(items)
+    return '%s-%s' % (endpoint_key(api_call),
+                      hashlib.sha1(repr((api_version, api_call, data)).encode('utf-8')).hexdigest())
+
+
+class ResponseCache(object):
+    """ Thread-safe cache of API responses.
+
+    directory: Where to store compressed responses on disk, None to keep them in memory only.
+    max_entries: Number of responses kept in memory, least recently used are evicted first.
+    max_bytes: Total size of the responses kept in memory. Larger responses are only stored on disk.
+    default_ttl: Time to live in seconds for calls not found in ttls. The default, 0, only caches the calls
+        listed in ttls: most list calls (scans, reports, detections) report state which changes at any time.
+    ttls: Dict of time to live in seconds by api_call, defaults to default_ttls.
+
+    """
+
+    def __init__(self, directory=None, max_entries=128, max_bytes=64 * 2 ** 20, default_ttl=0, ttls=None):
+        self.directory = directory
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Total size of the responses in memory.
+        self.size = 0
+        self.default_ttl = default_ttl
+        self.ttls = default_ttls.copy() if ttls is None else ttls
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ttl(self, api_call):
+        """ Return time to live in seconds of responses to api_call.
+
+        """
+        return self.ttls.get(api_call, self.default_ttl)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.z')
+
+    def get(self, key):
+        """ Return cached response for key, None if missing or expired.
+
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                expires, response = entry
+                if expires > now:
+                    # Most recently used goes last.
+                    self._entries[key] = entry
+                    return response
+                self.size -= len(response)
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires, response = zlib.decompress(f.read()).split(b'\n', 1)
+        except (IOError, OSError, zlib.error, ValueError):
+            return None
+        if float(expires) <= now:
+            self._remove(key)
+            return None
+        self._remember(key, float(expires), response)
+        return response
+
+    def set(self, key, api_call, response):
+        """ Cache response for key for the time to live of api_call.
+
+        """
+        ttl = self.ttl(api_call)
+        if ttl <= 0:
+            return
+        expires = time.time() + ttl
+        self._remember(key, expires, response)
+        if self.directory:
+            # Write to a temporary file first so readers never see a partial entry.
+            fd, temp_path = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(zlib.compress(('%f\n' % expires).encode('ascii') + response))
+            try:
+                os.rename(temp_path, self._path(key))
+            except OSError:
+                # Windows does not replace existing files.
+                self._remove(key)
+                os.rename(temp_path, self._path(key))
+
+    def _remember(self, key, expires, response):
+        with self._lock:
+            self._forget(key)
+            if len(response) > self.max_bytes:
+                return
+            self._entries[key] = (expires, response)
+            self.size += len(response)
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                key, (expires, response) = self._entries.popitem(last=False)
+                self.size -= len(response)
+
+    def _forget(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def _remove(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def invalidate(self, api_call):
+        """ Remove the cached responses of api_call, from memory and disk, e.g. after a write call to it.
+
+        """
+        self.clear(endpoint_key(api_call) + '-')
+
+    def clear(self, prefix=''):
+        """ Remove all cached responses (those whose key starts with prefix), from memory and disk.
+
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                self._forget(key)
+        if self.directory:
+            for filename in os.listdir(self.directory):
+                if filename.endswith('.z') and filename.startswith(prefix):
+                    self._remove(filename[:-2])
@@ -0,0 +1,164 @@
+""" Module that contains resumable exports of QualysGuard API v2 list calls.
+
+Each page is appended to a local output file, then the cursor of every shard (the next page to fetch) and
+the length of the output are saved to a checkpoint file. A restarted export truncates the output back to the
+checkpointed length and carries on from the saved cursors instead of starting from zero. If the output is
+missing or shorter than the checkpointed length, the checkpoint is discarded and the export starts over.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+from multiprocessing.pool import ThreadPool
+
+try:
+    import urlparse
+except ImportError:
+    # Python 3.
+    import urllib.parse as urlparse
+
+import qualysapi.export as export
+
+__author__ = 'Parag Baxi <parag.baxi@gmail.com>'
+__copyright__ = 'Copyright 2013, Parag Baxi'
+__license__ = 'Apache License 2.0'
+
+# Setup module level logging.
+logger = logging.getLogger(__name__)
+
+
+class ExportCheckpoint(object):
+    """ JSON checkpoint file of an export, replaced atomically on every save.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """ Return saved state, None if there is no checkpoint.
+
+        """
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError):
+            return None
+
+    def save(self, state):
+        # Write to a temporary file first so a crash never leaves a partial checkpoint.
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.rename(temp_path, self.path)
+        except OSError:
+            # Windows does not replace existing files.
+            self.remove()
+            os.rename(temp_path, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class ResumableExport(export.ShardedExport):
+    """ ShardedExport written to the output file, resumable after a crash from its checkpoint.
+
+    output: Path of the file the transformed records (bytes) are appended to.
+    checkpoint: Path of the checkpoint file, defaults to output + '.checkpoint'. It is removed once the
+        export is complete.
+    sharded: Split the export in host ID shards (see ShardedExport). Use False for calls which do not select
+        hosts, e.g. the KnowledgeBase, to page through them on a single cursor.
+
+    Other arguments are those of ShardedExport.
+
+    """
+
+    def __init__(self, conn, api_call, data=None, output=None, checkpoint=None, record_tag='HOST', fields=None,
+                 transform=export.serialize, sharded=True, shards=None, max_workers=None):
+        super(ResumableExport, self).__init__(conn, api_call, data, record_tag, fields, transform, shards,
+                                              max_workers)
+        self.output = output
+        self.checkpoint = ExportCheckpoint(checkpoint or output + '.checkpoint')
+        self.sharded = sharded
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ Return state of a new export, with a cursor (first page) per shard.
+
+        """
+        if self.sharded:
+            cursors = dict(('%d-%d' % shard, {'api_call': self.api_call, 'data': self.shard_data(shard)})
+                           for shard in self.plan())
+        else:
+            cursors = {'all': {'api_call': self.api_call, 'data': self.data}}
+        return {'api_call': self.api_call, 'offset': 0, 'records': 0, 'cursors': cursors}
+
+    def run(self):
+        """ Run the export, resuming it if a checkpoint exists, and return the number of records exported.
+
+        """
+        state = self.checkpoint.load()
+        if state is not None and state.get('api_call') != self.api_call:
+            raise ValueError('Checkpoint %s is for %s, not %s.' % (self.checkpoint.path, state.get('api_call'),
+                                                                   self.api_call))
+        if state is not None:
+            try:
+                size = os.path.getsize(self.output)
+            except OSError:
+                size = None
+            if size is None or size < state['offset']:
+                # Output lost or cut short since the checkpoint, the saved cursors no longer match it.
+                logger.warning('Output %s is missing or shorter than its checkpoint, restarting export of %s.',
+                               self.output, self.api_call)
+                state = None
+        if state is None:
+            state = self.start()
+            mode = 'wb'
+        else:
+            logger.info('Resuming export of %s at %d records.', self.api_call, state['records'])
+            mode = 'r+b'
+        with open(self.output, mode) as output:
+            # Drop whatever was written after the last checkpoint, it is fetched again.
+            output.truncate(state['offset'])
+            output.seek(state['offset'])
+            self.checkpoint.save(state)
+            pending = sorted(key for key, cursor in state['cursors'].items() if cursor is not None)
+            if pending:
+                pool = ThreadPool(min(self.workers(), len(pending)))
+                try:
+                    for key in pool.imap_unordered(lambda key: self.resume(key, state, output), pending):
+                        logger.debug('Shard %s done.', key)
+                finally:
+                    pool.terminate()
+        self.checkpoint.remove()
+        return state['records']
+
+    def resume(self, key, state, output):
+        """ Export shard key from its cursor in state, checkpointing after every page.
+
+        """
+        cursor = state['cursors'][key]
+        for api_call, data, records in self.conn.iter_pages(cursor['api_call'], cursor['data'], self.record_tag,
+                                                             self.fields):
+            chunk = [self.transform(record) for record in records]
+            cursor = None
+            if records.next_url:
+                next_url = urlparse.urlparse(records.next_url)
+                cursor = {'api_call': next_url.path, 'data': urlparse.parse_qs(next_url.query)}
+            with self._lock:
+                output.write(b''.join(chunk))
+                output.flush()
+                os.fsync(output.fileno())
+                state['offset'] = output.tell()
+                state['records'] += len(chunk)
+                state['cursors'][key] = cursor
+                self.checkpoint.save(state)
+        return key
@@ -1,6 +1,8 @@
 """ Module providing a single class (QualysConnectConfig) that parses a config
 file and provides the information required to build QualysGuard sessions.
 """
+from __future__ import print_function
+
 import os
 import stat
 import getpass
@@ -9,7 +11,17 @@ import logging
 # Setup module level logging.
 logger = logging.getLogger(__name__)
 
-from ConfigParser import *
+try:
+    from ConfigParser import *
+except ImportError:
+    # Python 3.
+    from configparser import *
+
+try:
+    input = raw_input
+except NameError:
+    # Python 3.
+    pass
 # try:
 #    from requests_ntlm import HttpNtlmAuth
 #except ImportError, e:
@@ -74,11 +86,27 @@ class QualysConnectConfig:
                 self.max_retries = int(self.max_retries)
             except Exception:
                 logger.error('Value max_retries must be an integer.')
-                print 'Value max_retries must be an integer.'
+                print('Value max_retries must be an integer.')
                 exit(1)
             self._cfgparse.set('info', 'max_retries', str(self.max_retries))
         self.max_retries = int(self.max_retries)
 
+        # Connection pool settings (defaults in settings.defaults).
+        try:
+            self.pool_connections = self._cfgparse.getint('info', 'pool_connections')
+            self.pool_maxsize = self._cfgparse.getint('info', 'pool_maxsize')
+        except ValueError:
+            logger.error('Values pool_connections and pool_maxsize must be integers.')
+            print('Values pool_connections and pool_maxsize must be integers.')
+            exit(1)
+        try:
+            self.pool_block = self._cfgparse.getboolean('info', 'pool_block')
+            self.keep_alive = self._cfgparse.getboolean('info', 'keep_alive')
+        except ValueError:
+            logger.error('Values pool_block and keep_alive must be booleans.')
+            print('Values pool_block and keep_alive must be booleans.')
+            exit(1)
+
         # Proxy support
         proxy_config = proxy_url = proxy_protocol = proxy_port = proxy_username = proxy_password = None
         # User requires proxy?
@@ -151,7 +179,7 @@ class QualysConnectConfig:
 
         # ask username (if one doesn't exist)
         if not self._cfgparse.has_option('info', 'username'):
-            username = raw_input('QualysGuard Username: ')
+            username = input('QualysGuard Username: ')
             self._cfgparse.set('info', 'username', username)
 
         # ask password (if one doesn't exist)
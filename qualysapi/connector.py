@@ -1,3 +1,5 @@
+from __future__ import print_function
+
 __author__ = 'Parag Baxi <parag.baxi@gmail.com>'
 __copyright__ = 'Copyright 2013, Parag Baxi'
 __license__ = 'Apache License 2.0'
@@ -6,56 +8,87 @@ __license__ = 'Apache License 2.0'
 and requesting data from it.
 """
 import logging
+import os
+import socket
+import threading
 import time
-import urlparse
 from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+
+try:
+    import urlparse
+except ImportError:
+    # Python 3.
+    import urllib.parse as urlparse
 
 import requests
+from requests.packages.urllib3.connection import HTTPConnection
 
 import qualysapi.version
 import qualysapi.api_methods
 
 import qualysapi.api_actions
 import qualysapi.api_actions as api_actions
+import qualysapi.cache
+import qualysapi.exceptions
+import qualysapi.metrics
+import qualysapi.parsers
+import qualysapi.ratelimit
+import qualysapi.singleflight
+import qualysapi.stream
 
 # Setup module level logging.
 logger = logging.getLogger(__name__)
 
 try:
-    from lxml import etree
-except ImportError, e:
+    from lxml import etree, objectify
+except ImportError as e:
     logger.warning(
         'Warning: Cannot consume lxml.builder E objects without lxml. Send XML strings for AM & WAS API calls.')
 
 
-class QGConnector(api_actions.QGActions):
-    """ Qualys Connection class which allows requests to the QualysGuard API using HTTP-Basic Authentication (over SSL).
+def call_action(data):
+    """ Return the API v2 action of call parameters data, None if there is not a single one.
 
     """
+    action = data.get('action') if isinstance(data, dict) else None
+    if isinstance(action, list):
+        action = action[0] if len(action) == 1 else None
+    return action
+
 
+class QGConnectorBase(object):
+    """ Call routing shared by the QualysGuard connectors: API version, url, http method, call and payload.
 
-    def __init__(self, auth, server='qualysapi.qualys.com', proxies=None, max_retries=3):
+    """
+
+
+    def __init__(self, auth, server='qualysapi.qualys.com', proxies=None, rate_limiter=None):
         # Read username & password from file, if possible.
         self.auth = auth
         # Remember QualysGuard API server.
         self.server = server
         # Remember rate limits per call.
         self.rate_limit_remaining = defaultdict(int)
+        # Pace calls by the rate & concurrency limits reported by the API. Pass a RateLimiter to share it
+        # between connectors (with a FileBackend or SocketBackend, between processes and hosts), or False to
+        # disable pacing.
+        if rate_limiter is None:
+            rate_limiter = qualysapi.ratelimit.RateLimiter()
+        self.rate_limiter = rate_limiter
+        # Live metrics per api_call, see stats().
+        self.metrics = qualysapi.metrics.MetricsRegistry()
         # api_methods: Define method algorithm in a dict of set.
         # Naming convention: api_methods[api_version optional_blah] due to api_methods_with_trailing_slash testing.
         self.api_methods = qualysapi.api_methods.api_methods
         #
         # Keep track of methods with ending slashes to autocorrect user when they forgot slash.
         self.api_methods_with_trailing_slash = qualysapi.api_methods.api_methods_with_trailing_slash
+        # Resolved call plans, see call_plan(). Set max_call_plans to 0 to disable.
+        self._call_plans = {}
+        self.max_call_plans = 1024
         self.proxies = proxies
-        logger.debug('proxies = \n%s' % proxies)
-        # Set up requests max_retries.
-        logger.debug('max_retries = \n%s' % max_retries)
-        self.session = requests.Session()
-        http_max_retries = requests.adapters.HTTPAdapter(max_retries=max_retries)
-        https_max_retries = requests.adapters.HTTPAdapter(max_retries=max_retries)
-        self.session.mount('http://', http_max_retries)
-        self.session.mount('https://', https_max_retries)
+        logger.debug('proxies = \n%s', proxies)
 
 
     def __call__(self):
@@ -132,7 +165,7 @@ class QGConnector(api_actions.QGActions):
             url = "https://%s/qps/rest/2.0/" % (self.server,)
         else:
             raise Exception("Unknown QualysGuard API Version Number (%s)" % (api_version,))
-        logger.debug("Base url =\n%s" % (url))
+        logger.debug("Base url =\n%s", url)
         return url
 
 
@@ -184,7 +217,7 @@ class QGConnector(api_actions.QGActions):
         api_call_formatted = api_call_formatted.rstrip('?')
         if api_call != api_call_formatted:
             # Show difference
-            logger.debug('api_call post strip =\n%s' % api_call_formatted)
+            logger.debug('api_call post strip =\n%s', api_call_formatted)
         return api_call_formatted
 
 
@@ -195,7 +228,7 @@ class QGConnector(api_actions.QGActions):
         # Remove possible starting slashes or trailing question marks in call.
         api_call = api_call.lstrip('/')
         api_call = api_call.rstrip('?')
-        logger.debug('api_call post strip =\n%s' % api_call)
+        logger.debug('api_call post strip =\n%s', api_call)
         # Make sure call always ends in slash for API v2 calls.
         if (api_version == 2 and api_call[-1] != '/'):
             # Add slash.
@@ -217,34 +250,56 @@ class QGConnector(api_actions.QGActions):
             # Check if string type.
             if type(data) == str:
                 # Convert to dictionary.
-                logger.debug('Converting string to dict:\n%s' % data)
+                logger.debug('Converting string to dict:\n%s', data)
                 # Remove possible starting question mark & ending ampersands.
                 data = data.lstrip('?')
                 data = data.rstrip('&')
                 # Convert to dictionary.
                 data = urlparse.parse_qs(data)
-                logger.debug('Converted:\n%s' % str(data))
+                logger.debug('Converted:\n%s', data)
         elif api_version in ('am', 'was','am2'):
             if type(data) == etree._Element:
                 logger.debug('Converting lxml.builder.E to string')
                 data = etree.tostring(data)
-                logger.debug('Converted:\n%s' % data)
+                logger.debug('Converted:\n%s', data)
         return data
 
 
-    def request(self, api_call, data=None, api_version=None, http_method=None, concurrent_scans_retries=0,
-                concurrent_scans_retry_delay=0):
-        """ Return QualysGuard API response.
+    def stats(self):
+        """ Return snapshot of the metrics of each api_call made: request count, latency percentiles,
+        bytes received, concurrent scan retries, controller retries, cache hits, coalesced calls, HTTP status
+        codes and last rate limit headers.
 
         """
-        logger.debug('api_call =\n%s' % api_call)
-        logger.debug('api_version =\n%s' % api_version)
-        logger.debug('data %s =\n %s' % (type(data), str(data)))
-        logger.debug('http_method =\n%s' % http_method)
-        logger.debug('concurrent_scans_retries =\n%s' % str(concurrent_scans_retries))
-        logger.debug('concurrent_scans_retry_delay =\n%s' % str(concurrent_scans_retry_delay))
-        concurrent_scans_retries = int(concurrent_scans_retries)
-        concurrent_scans_retry_delay = int(concurrent_scans_retry_delay)
+        return self.metrics.snapshot()
+
+
+    def is_read_call(self, api_version, api_call, http_method, data):
+        """ Return True if api_call only reads data, so its response may be cached.
+
+        """
+        if api_version == 1:
+            return api_call in self.api_methods['1 read']
+        elif api_version == 2:
+            # All API v2 requests are POST methods, look at the action instead.
+            return call_action(data) in self.api_methods['2 read actions']
+        else:
+            # Portal API: Reads are GET, search & count calls.
+            return http_method == 'get' or api_call.startswith(('search/', 'count/'))
+
+
+    def call_plan(self, api_call, data=None, api_version=None, http_method=None):
+        """ Return tuple of (api_call, api_version, http_method, url, headers) for api_call.
+
+        Plans are resolved once per distinct call and then reused. Treat the headers dict as read-only.
+
+        """
+        # The http method of WAS calls depends on whether there is any data.
+        key = (api_call, api_version, http_method, bool(data))
+        try:
+            return self._call_plans[key]
+        except KeyError:
+            pass
         #
         # Determine API version.
         # Preformat call.
@@ -261,7 +316,7 @@ class QGConnector(api_actions.QGActions):
         #
         # Set up headers.
         headers = {"X-Requested-With": "Parag Baxi QualysAPI (python) v%s" % (qualysapi.version.__version__,)}
-        logger.debug('headers =\n%s' % (str(headers)))
+        logger.debug('headers =\n%s', headers)
         # Portal API takes in XML text, requiring custom header.
         if api_version in ('am', 'was','am2'):
             headers['Content-type'] = 'text/xml'
@@ -269,97 +324,539 @@ class QGConnector(api_actions.QGActions):
         # Set up http request method, if not specified.
         if not http_method:
             http_method = self.format_http_method(api_version, api_call, data)
-        logger.debug('http_method =\n%s' % http_method)
+        logger.debug('http_method =\n%s', http_method)
         #
         # Format API call.
         api_call = self.format_call(api_version, api_call)
-        logger.debug('api_call =\n%s' % (api_call))
+        logger.debug('api_call =\n%s', api_call)
         # Append api_call to url.
         url += api_call
+        plan = (api_call, api_version, http_method, url, headers)
+        if self.max_call_plans:
+            if len(self._call_plans) >= self.max_call_plans:
+                # Calls with resource ids in them (WAS, AM) could grow the cache without bound.
+                self._call_plans.clear()
+            self._call_plans[key] = plan
+        return plan
+
+
+    def prepare_request(self, api_call, data=None, api_version=None, http_method=None):
+        """ Return tuple of (api_call, api_version, http_method, url, headers, data) ready to be sent.
+
+        """
+        api_call, api_version, http_method, url, headers = self.call_plan(api_call, data, api_version, http_method)
         #
         # Format data, if applicable.
         if data is not None:
             data = self.format_payload(api_version, data)
+        return api_call, api_version, http_method, url, headers, data
+
+
+    def remember_rate_limit(self, api_call, headers, rate_warn_threshold=10):
+        """ Remember how many calls are left against api_call from the response headers.
+
+        """
+        try:
+            self.rate_limit_remaining[api_call] = int(headers['x-ratelimit-remaining'])
+            logger.debug('rate limit for api_call, %s = %s', api_call, self.rate_limit_remaining[api_call])
+            if (self.rate_limit_remaining[api_call] > rate_warn_threshold):
+                logger.debug('rate limit for api_call, %s = %s', api_call, self.rate_limit_remaining[api_call])
+            elif (self.rate_limit_remaining[api_call] <= rate_warn_threshold) and (self.rate_limit_remaining[api_call] > 0):
+                logger.warning('Rate limit is about to being reached (remaining api calls = %s)', self.rate_limit_remaining[api_call])
+            elif self.rate_limit_remaining[api_call] <= 0:
+                logger.critical('ATTENTION! RATE LIMIT HAS BEEN REACHED (remaining api calls = %s)!', self.rate_limit_remaining[api_call])
+        except KeyError as e:
+            # Likely a bad api_call.
+            logger.debug(e)
+            pass
+        except TypeError as e:
+            # Likely an asset search api_call.
+            logger.debug(e)
+            pass
+
+
+    def concurrent_scan_limit_reached(self, response):
+        """ Return True if response reports that the maximum number of concurrent running scans was reached.
+
+        """
+        return ('<responseCode>INVALID_REQUEST</responseCode>' in response and \
+                '<errorMessage>You have reached the maximum number of concurrent running scans' in response and \
+                '<errorResolution>Please wait until your previous scans have completed</errorResolution>' in response)
+
+
+class QGHTTPAdapter(requests.adapters.HTTPAdapter):
+    """ HTTPAdapter which optionally enables TCP keep-alive probes on pooled connections, so idle
+    connections are not silently dropped by firewalls and NAT devices.
+
+    """
+    __attrs__ = requests.adapters.HTTPAdapter.__attrs__ + ['keep_alive']
+
+    def __init__(self, keep_alive=True, **kwargs):
+        self.keep_alive = keep_alive
+        super(QGHTTPAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.keep_alive:
+            kwargs['socket_options'] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        super(QGHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+
+
+class QGConnector(QGConnectorBase, api_actions.QGActions):
+    """ Qualys Connection class which allows requests to the QualysGuard API using HTTP-Basic Authentication (over SSL).
+
+    A connector may be shared by many threads. Its connections are pooled: pool_connections is the number
+    of hosts pooled, pool_maxsize the number of connections kept per host (set it to at least the number of
+    threads), and pool_block makes threads wait for a free connection instead of opening extra ones.
+    keep_alive reuses connections between calls and enables TCP keep-alive on them; set it to False to
+    close each connection after its call.
+
+    After os.fork(), the child process builds its own session on first use, as connections cannot be
+    shared between processes.
+
+    session_auth: Log in once to an API v2 session (api/2.0/fo/session/) and authenticate v2 calls with its
+    QualysSession cookie instead of HTTP-Basic on every call. The session is shared by all threads, logged in
+    again when it expires, and logged out by close().
+
+    memory_budget: Maximum size in bytes of a response held in memory. Larger responses are spooled to a
+    temporary file and returned as a qualysapi.stream.SpooledResponse handle instead of a string.
+
+    controller: A qualysapi.adaptive.Controller adapting the number of calls in flight to the latency and
+    push back of the platform, failing calls fast while it is degraded and retrying idempotent calls on
+    RateLimited, ConcurrencyLimit and ServerError. Streamed calls hold their slot until headers are received.
+
+    single_flight: Make concurrent identical read calls (same normalized call, see qualysapi.cache.cache_key)
+    share one request and its response, or its exception. Streamed calls are never shared.
+
+    """
+
+
+    def __init__(self, auth, server='qualysapi.qualys.com', proxies=None, max_retries=3, rate_limiter=None,
+                 cache=None, pool_connections=10, pool_maxsize=10, pool_block=False, keep_alive=True,
+                 session_auth=False, memory_budget=None, controller=None, single_flight=False):
+        super(QGConnector, self).__init__(auth, server, proxies, rate_limiter)
+        # Optional qualysapi.cache.ResponseCache for responses to read-only calls.
+        self.cache = cache
+        # Responses larger than memory_budget bytes are spooled to disk, see request().
+        self.memory_budget = memory_budget
+        # Optional qualysapi.adaptive.Controller, see request().
+        self.controller = controller
+        # Coalesces identical read calls in flight, see request().
+        self.single_flight = qualysapi.singleflight.SingleFlight() if single_flight else None
+        # Set up requests max_retries.
+        logger.debug('max_retries = \n%s', max_retries)
+        self.max_retries = max_retries
+        logger.debug('pool_connections = %s, pool_maxsize = %s, pool_block = %s, keep_alive = %s',
+                     pool_connections, pool_maxsize, pool_block, keep_alive)
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.session = self.new_session()
+        self.session_auth = session_auth
+        # Serializes session logins. Incremented with each login to detect logins by other threads.
+        self._login_lock = threading.Lock()
+        self._login_generation = 0
+
+
+    def new_session(self):
+        """ Return a requests session set up with this connector's retry, pool & keep-alive settings.
+
+        """
+        session = requests.Session()
+        for prefix in ('http://', 'https://'):
+            session.mount(prefix, QGHTTPAdapter(keep_alive=self.keep_alive,
+                                                max_retries=self.max_retries,
+                                                pool_connections=self.pool_connections,
+                                                pool_maxsize=self.pool_maxsize,
+                                                pool_block=self.pool_block))
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+
+    @property
+    def session(self):
+        """ Requests session of the current process.
+
+        """
+        if self._session_pid != os.getpid():
+            # Forked: Pooled connections belong to the parent process, leave them alone.
+            logger.debug('Process forked, building new session.')
+            self._session = self.new_session()
+            self._session_pid = os.getpid()
+        return self._session
+
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+        self._session_pid = os.getpid()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def close(self):
+        """ Log out of the API v2 session, if any, and close pooled connections.
+
+        """
+        if self.session_auth:
+            self.logout()
+        self.session.close()
+
+
+    def login(self, expired=None):
+        """ Log in to an API v2 session unless already logged in, and return the login generation.
+
+        expired: Login generation whose session expired. No new login is made if another thread already
+                 logged in again since.
+
+        """
+        with self._login_lock:
+            if 'QualysSession' in self.session.cookies and self._login_generation != expired:
+                return self._login_generation
+            logger.debug('Logging in to QualysGuard API session.')
+            api_call, api_version, http_method, url, headers = self.call_plan('api/2.0/fo/session/')
+            request = self.session.post(url, data={'action': 'login', 'username': self.auth[0],
+                                                   'password': self.auth[1]},
+                                        headers=headers, proxies=self.proxies)
+            request.raise_for_status()
+            if 'QualysSession' not in self.session.cookies:
+                logger.error('Content = \n%s', request.content)
+                raise requests.HTTPError('Could not log in to QualysGuard API session.', response=request)
+            self._login_generation += 1
+            return self._login_generation
+
+
+    def logout(self):
+        """ Log out of the API v2 session, if logged in.
+
+        """
+        with self._login_lock:
+            if 'QualysSession' not in self.session.cookies:
+                return
+            logger.debug('Logging out of QualysGuard API session.')
+            api_call, api_version, http_method, url, headers = self.call_plan('api/2.0/fo/session/')
+            try:
+                self.session.post(url, data={'action': 'logout'}, headers=headers, proxies=self.proxies)
+            finally:
+                del self.session.cookies['QualysSession']
+
+
+    def _stream_closed(self, api_call):
+        """ Return callback finishing the bookkeeping of a streamed call to api_call once it is closed.
+
+        """
+        def closed(stream):
+            self.metrics.record_bytes(api_call, stream.bytes_read)
+            if self.rate_limiter:
+                self.rate_limiter.release(api_call)
+        return closed
+
+
+    def request(self, api_call, data=None, api_version=None, http_method=None, concurrent_scans_retries=0,
+                concurrent_scans_retry_delay=0, stream=False, chunk_size=qualysapi.stream.DEFAULT_CHUNK_SIZE):
+        """ Return QualysGuard API response as bytes (str on Python 2), or a qualysapi.stream.SpooledResponse
+        if it is larger than memory_budget. qualysapi.stream.parse_response() parses either.
+
+        stream: Return a QGResponseStream (file-like, iterable of byte chunks) instead of the
+                response text, so large responses are never held in memory at once.
+        chunk_size: Number of bytes read at a time when stream is True, or when spooling responses
+                    larger than memory_budget.
+
+        Error responses raise the matching qualysapi.exceptions.QualysAPIError (IPNotAllowlisted,
+        RateLimited, ConcurrencyLimit, ConcurrentScanLimit once concurrent_scans_retries ran out, etc).
+
+        """
+        logger.debug('api_call =\n%s', api_call)
+        logger.debug('api_version =\n%s', api_version)
+        logger.debug('data %s =\n %s', type(data), data)
+        logger.debug('http_method =\n%s', http_method)
+        logger.debug('concurrent_scans_retries =\n%s', concurrent_scans_retries)
+        logger.debug('concurrent_scans_retry_delay =\n%s', concurrent_scans_retry_delay)
+        logger.debug('stream =\n%s', stream)
+        concurrent_scans_retries = int(concurrent_scans_retries)
+        concurrent_scans_retry_delay = int(concurrent_scans_retry_delay)
+        api_call, api_version, http_method, url, headers, data = self.prepare_request(api_call, data, api_version,
+                                                                                      http_method)
+        cache_key = None
+        read_call = not stream and self.is_read_call(api_version, api_call, http_method, data)
+        if self.cache is not None and read_call:
+            cache_key = qualysapi.cache.cache_key(api_version, api_call, data)
+            response = self.cache.get(cache_key)
+            if response is not None:
+                logger.debug('Cached response for api_call %s.', api_call)
+                self.metrics.record_cache_hit(api_call)
+                return response
+        call = (api_call, api_version, http_method, url, headers, data, concurrent_scans_retries,
+                concurrent_scans_retry_delay, stream, chunk_size)
+        if self.cache is not None and not self.is_read_call(api_version, api_call, http_method, data):
+            try:
+                return self._request(*call)
+            finally:
+                # The write may have changed what reads of the endpoint return.
+                self.cache.invalidate(api_call)
+        if self.single_flight is None or not read_call:
+            response = self._request(*call)
+        else:
+            # Identical read calls in flight share the response of the first one.
+            response, shared = self.single_flight.do(cache_key or qualysapi.cache.cache_key(api_version, api_call,
+                                                                                         data),
+                                                     self._request, *call)
+            if shared:
+                self.metrics.record_coalesced(api_call)
+                if not isinstance(response, qualysapi.stream.SpooledResponse):
+                    # Already cached by the first caller.
+                    return response
+                # A spooled response is a file handle of the first caller, make the call again.
+                response = self._request(*call)
+        if cache_key and not isinstance(response, qualysapi.stream.SpooledResponse):
+            self.cache.set(cache_key, api_call, response)
+        return response
+
+
+    def _request(self, api_call, api_version, http_method, url, headers, data, concurrent_scans_retries,
+                 concurrent_scans_retry_delay, stream, chunk_size):
+        """ Return QualysGuard API response of a prepared call, see request().
+
+        """
+        # Read the body in chunks, spooling it to disk if it turns out larger than memory_budget.
+        spool = self.memory_budget is not None and not stream
+        # API v2 calls authenticate with the session cookie when session_auth is on.
+
+        use_session = self.session_auth and api_version == 2 and api_call != 'api/2.0/fo/session/'
+        auth = None if use_session else self.auth
+        logged_in_again = False
+        # Only calls which read data are repeated by the controller.
+        idempotent = self.controller is not None and self.is_read_call(api_version, api_call, http_method, data)
+        # The controller tracks latency per action, e.g. a report list is much faster than a report fetch.
+        action = call_action(data) if self.controller is not None else None
         # Make request at least once (more if concurrent_retry is enabled).
         retries = 0
-        #
-        # set a warning threshold for the rate limit
-        rate_warn_threshold = 10
-        while retries <= concurrent_scans_retries:
+        # Retries by the controller, counted apart from the concurrent scan retries and bounded by its retries.
+        attempts = 0
+        while True:
             # Make request.
-            logger.debug('url =\n%s' % (str(url)))
-            logger.debug('data =\n%s' % (str(data)))
-            logger.debug('headers =\n%s' % (str(headers)))
-            if http_method == 'get':
-                # GET
-                logger.debug('GET request.')
-                request = self.session.get(url, params=data, auth=self.auth, headers=headers, proxies=self.proxies)
-            else:
-                # POST
-                logger.debug('POST request.')
-                # Make POST request.
-                request = self.session.post(url, data=data, auth=self.auth, headers=headers, proxies=self.proxies)
-            logger.debug('response headers =\n%s' % (str(request.headers)))
-            #
-            # Remember how many times left user can make against api_call.
+            logger.debug('url =\n%s', url)
+            logger.debug('data =\n%s', data)
+            logger.debug('headers =\n%s', headers)
+            if use_session:
+                login_generation = self.login()
+            if self.controller:
+                # Fails fast if the circuit is open, then waits for a slot within the adaptive limit.
+                self.controller.acquire()
+            if self.rate_limiter:
+                # Wait for the rate & concurrency limits to allow the call.
+                try:
+                    self.rate_limiter.acquire(api_call)
+                except Exception:
+                    if self.controller:
+                        self.controller.cancel()
+                    raise
+            start = time.time()
+            request = None
+            response = None
             try:
-                self.rate_limit_remaining[api_call] = int(request.headers['x-ratelimit-remaining'])
-                logger.debug('rate limit for api_call, %s = %s' % (api_call, self.rate_limit_remaining[api_call]))
-                if (self.rate_limit_remaining[api_call] > rate_warn_threshold):
-                    logger.debug('rate limit for api_call, %s = %s' % (api_call, self.rate_limit_remaining[api_call]))
-                elif (self.rate_limit_remaining[api_call] <= rate_warn_threshold) and (self.rate_limit_remaining[api_call] > 0):
-                    logger.warning('Rate limit is about to being reached (remaining api calls = %s)' % self.rate_limit_remaining[api_call])
-                elif self.rate_limit_remaining[api_call] <= 0:
-                    logger.critical('ATTENTION! RATE LIMIT HAS BEEN REACHED (remaining api calls = %s)!' % self.rate_limit_remaining[api_call])
-            except KeyError, e:
-                # Likely a bad api_call.
-                logger.debug(e)
-                pass
-            except TypeError, e:
-                # Likely an asset search api_call.
-                logger.debug(e)
-                pass
-            # Response received.
-            response = str(request.content)
-            logger.debug('response text =\n%s' % (response))
-            # Keep track of how many retries.
-            retries += 1
-            # Check for concurrent scans limit.
-            if not ('<responseCode>INVALID_REQUEST</responseCode>' in response and \
-                                '<errorMessage>You have reached the maximum number of concurrent running scans' in response and \
-                                '<errorResolution>Please wait until your previous scans have completed</errorResolution>' in response):
-                # Did not hit concurrent scan limit.
+                if http_method == 'get':
+                    # GET
+                    logger.debug('GET request.')
+                    request = self.session.get(url, params=data, auth=auth, headers=headers, proxies=self.proxies,
+                                               stream=stream or spool)
+                else:
+                    # POST
+                    logger.debug('POST request.')
+                    # Make POST request.
+                    request = self.session.post(url, data=data, auth=auth, headers=headers, proxies=self.proxies,
+                                                stream=stream or spool)
+                logger.debug('response headers =\n%s', request.headers)
+                #
+                # Remember how many times left user can make against api_call.
+                self.remember_rate_limit(api_call, request.headers)
+                if self.rate_limiter:
+                    self.rate_limiter.update(api_call, request.headers)
+                # Response received.
+                if stream:
+                    # Only the head of the body is read. Error responses are small enough to fit in it.
+                    # The call keeps counting against the concurrency limit until the stream is closed.
+                    response = qualysapi.stream.QGResponseStream(request, chunk_size, self._stream_closed(api_call))
+                    body = response.head
+                    self.metrics.record(api_call, time.time() - start, request.status_code, 0, request.headers)
+                elif spool:
+                    response = qualysapi.stream.read_response(request, self.memory_budget, chunk_size)
+                    body = response.head if isinstance(response, qualysapi.stream.SpooledResponse) else response
+                    self.metrics.record(api_call, time.time() - start, request.status_code, len(response),
+                                        request.headers)
+                else:
+                    response = request.content
+                    body = response
+                    self.metrics.record(api_call, time.time() - start, request.status_code, len(response),
+                                        request.headers)
+                latency = time.time() - start
+            except Exception as e:
+                if request is None:
+                    # No response received.
+                    self.metrics.record(api_call, time.time() - start, 'error')
+                if self.controller:
+                    self.controller.release(api_call, None, e, action)
+                if stream and response is not None:
+                    # Releases the connection and the lease.
+                    response.close()
+                elif stream and request is not None:
+                    request.close()
+                raise
+            finally:
+                # A built stream owns the lease until it is closed.
+                if self.rate_limiter and (not stream or response is None):
+                    self.rate_limiter.release(api_call)
+            logger.debug('response text =\n%s', body)
+            if use_session and request.status_code == 401 and not logged_in_again:
+                # Session expired, log in again and repeat the call.
+                logger.info('QualysGuard API session expired, logging in again.')
+                if stream or isinstance(response, qualysapi.stream.SpooledResponse):
+                    response.close()
+                if self.controller:
+                    self.controller.release(api_call, latency, action=action)
+                self.login(expired=login_generation)
+                logged_in_again = True
+                continue
+            # Classify the response from its status, content type and head, whatever the size of the body.
+            error = None
+            try:
+                qualysapi.exceptions.check_response(request.status_code, request.headers, body, request)
+            except qualysapi.exceptions.QualysAPIError as e:
+                error = e
+            if self.controller:
+                self.controller.release(api_call, latency, error, action)
+            if error is None:
                 break
-            else:
+            # Release the connection of a stream, or the temporary file of a spooled response.
+            if stream or isinstance(response, qualysapi.stream.SpooledResponse):
+                response.close()
+            if isinstance(error, qualysapi.exceptions.ConcurrentScanLimit):
                 # Hit concurrent scan limit.
-                logger.critical(response)
+                logger.critical(body)
+                # Keep track of how many retries.
+                retries += 1
                 # If trying again, delay next try by concurrent_scans_retry_delay.
                 if retries <= concurrent_scans_retries:
-                    logger.warning('Waiting %d seconds until next try.' % concurrent_scans_retry_delay)
+                    self.metrics.record_retry(api_call)
+                    logger.warning('Waiting %d seconds until next try.', concurrent_scans_retry_delay)
                     time.sleep(concurrent_scans_retry_delay)
                     # Inform user of how many retries.
-                    logger.critical('Retry #%d' % retries)
-                else:
-                    # Ran out of retries. Let user know.
-                    print 'Alert! Ran out of concurrent_scans_retries!'
-                    logger.critical('Alert! Ran out of concurrent_scans_retries!')
-                    return False
-        # Check to see if there was an error.
-        try:
-            request.raise_for_status()
-        except requests.HTTPError as e:
-            # Error
-            print 'Error! Received a 4XX client error or 5XX server error response.'
-            print 'Content = \n', response
-            logger.error('Content = \n%s' % response)
-            print 'Headers = \n', request.headers
-            logger.error('Headers = \n%s' % str(request.headers))
-            request.raise_for_status()
-        if '<RETURN status="FAILED" number="2007">' in response:
-            print 'Error! Your IP address is not in the list of secure IPs. Manager must include this IP (QualysGuard VM > Users > Security).'
-            print 'Content = \n', response
-            logger.error('Content = \n%s' % response)
-            print 'Headers = \n', request.headers
-            logger.error('Headers = \n%s' % str(request.headers))
-            return False
+                    logger.critical('Retry #%d', retries)
+                    continue
+                # Ran out of retries. Let user know.
+                logger.critical('Alert! Ran out of concurrent_scans_retries!')
+                raise error
+            # Repeat idempotent calls the platform pushed back on, after a jittered delay.
+            delay = self.controller.retry_delay(attempts + 1, error) if idempotent else None
+            if delay is not None:
+                attempts += 1
+                self.metrics.record_controller_retry(api_call)
+                logger.warning('%s Retry #%d of %s in %.1f seconds.', error, attempts, api_call, delay)
+                time.sleep(delay)
+                continue
+            logger.error('Error! %s', error)
+            logger.error('Content = \n%s', body[:qualysapi.exceptions.HEAD_SIZE])
+            logger.error('Headers = \n%s', request.headers)
+            raise error
         return response
+
+
+    def request_many(self, calls, max_workers=8, **kwargs):
+        """ Yield (api_call, data, response, error) tuples for each (api_call, data) in calls, as they complete.
+
+        Calls run on a pool of max_workers threads sharing this connector's session (see pool_maxsize). An
+        exception raised by a call is returned as error (response is then None) instead of stopping the other
+        calls. Extra keyword arguments are passed on to request().
+
+        """
+        def run(call):
+            api_call, data = call
+            try:
+                return api_call, data, self.request(api_call, data, **kwargs), None
+            except Exception as e:
+                logger.error('Call %s with %s failed: %s', api_call, data, e)
+                return api_call, data, None, e
+        pool = ThreadPool(max_workers)
+        try:
+            for result in pool.imap_unordered(run, calls):
+                yield result
+        finally:
+            # Also stops outstanding calls if the caller stops iterating early.
+            pool.terminate()
+
+
+    def paginate(self, api_call, data=None, record_tag=None, **kwargs):
+        """ Yield every page of an API v2 list call, following the truncation URL of each page.
+
+        Pages are yielded as objectified XML roots, or if record_tag (e.g. 'HOST') is given, the record
+        elements with that tag are yielded instead. The next page is fetched in the background while the
+        current page is consumed. Extra keyword arguments are passed on to request().
+
+        """
+        pool = ThreadPool(1)
+        try:
+            page = pool.apply_async(self.request, (api_call, data), kwargs)
+            while page is not None:
+                response = page.get()
+                root = qualysapi.stream.parse_response(response, objectified=True)
+                del response
+                # Truncated output links to the next page, e.g. <WARNING><URL>...&id_min=1234</URL></WARNING>.
+                next_url = root.findtext('.//WARNING/URL')
+                if next_url:
+                    logger.debug('Fetching next page:\n%s', next_url)
+                    next_url = urlparse.urlparse(next_url)
+                    next_data = urlparse.parse_qs(next_url.query)
+                    page = pool.apply_async(self.request, (next_url.path, next_data), kwargs)
+                else:
+                    page = None
+                if record_tag:
+                    for record in root.iter(record_tag):
+                        yield record
+                else:
+                    yield root
+        finally:
+            pool.terminate()
+
+
+    def iter_pages(self, api_call, data=None, record_tag='HOST', fields=None, **kwargs):
+        """ Yield (api_call, data, records) for every page of an API v2 list call, following truncation URLs.
+
+        records is a streaming qualysapi.parsers.RecordParser of the record_tag elements of the page; iterate it
+        fully before asking for the next page, whose URL it finds at the end of the page. Extra keyword
+        arguments are passed on to request().
+
+        """
+        while api_call:
+            response = self.request(api_call, data, stream=True, **kwargs)
+            records = qualysapi.parsers.RecordParser(response, record_tag, fields)
+            try:
+                yield api_call, data, records
+            finally:
+                response.close()
+            api_call = None
+            if records.next_url:
+                logger.debug('Fetching next page:\n%s', records.next_url)
+                next_url = urlparse.urlparse(records.next_url)
+                api_call, data = next_url.path, urlparse.parse_qs(next_url.query)
+
+
+    def iter_records(self, api_call, data=None, record_tag='HOST', fields=None, **kwargs):
+        """ Yield every record_tag element of an API v2 list call, following truncation URLs.
+
+        Responses are streamed and parsed incrementally (see qualysapi.parsers.RecordParser), so memory use
+        does not grow with the size of the output. Elements are cleared after use; copy what you need before
+        asking for the next one. If fields (set of child tags) is given, other children are dropped. Extra
+        keyword arguments are passed on to request().
+
+        """
+        for api_call, data, records in self.iter_pages(api_call, data, record_tag, fields, **kwargs):
+            for record in records:
+                yield record
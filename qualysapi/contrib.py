@@ -4,12 +4,15 @@ __author__ = 'Parag Baxi <parag.baxi@gmail.com>'
 __license__ = 'Apache License 2.0'
 
 import logging
-import time
-import types
+import re
+import string
 import unicodedata
 from collections import defaultdict
 
-from lxml import etree, objectify
+import lxml.html
+
+import qualysapi.reports
+import qualysapi.stream
 
 
 
@@ -24,36 +27,15 @@ def generate_vm_report(self, report_details, startup_delay=60, polling_delay=30,
     polling_delay: Time in seconds to wait between checks.
     max_checks: Maximum number of times to check for report spooling completion.
 
+    Use qualysapi.reports.ReportPipeline directly to spool many reports at once.
+
     '''
-    # Merge parameters.
-    report_details['action'] = 'launch'
-    logger.debug(report_details)
-    xml_output = qualysapi_instance.request(2, 'report', report_details)
-    report_id = etree.XML(xml_output).find('.//VALUE').text
-    logger.debug('report_id: %s' % (report_id))
-    # Wait for report to finish spooling.
-    # Maximum number of times to check for report.  About 10 minutes.
-    MAX_CHECKS = 10
-    logger.info('Report sent to spooler. Checking for report in %s seconds.' % (startup_delay))
-    time.sleep(startup_delay)
-    for n in range(0, max_checks):
-        # Check to see if report is done.
-        xml_output = qualysapi_instance.request(2, 'report', {'action': 'list', 'id': report_id})
-        tag_status = etree.XML(xml_output).findtext(".//STATE")
-        logger.debug('tag_status: %s' % (tag_status))
-        tag_status = etree.XML(xml_output).findtext(".//STATE")
-        logger.debug('tag_status: %s' % (tag_status))
-        if not type(tag_status) == types.NoneType:
-            # Report is showing up in the Report Center.
-            if tag_status == 'Finished':
-                # Report creation complete.
-                break
-        # Report not finished, wait.
-        logger.info('Report still spooling. Trying again in %s seconds.' % (polling_delay))
-        time.sleep(polling_delay)
-    # We now have to fetch the report.  Use the report id.
-    report_xml = qualysapi_instance.request(2, 'report', {'action': 'fetch', 'id': report_id})
-    return report_xml
+    pipeline = qualysapi.reports.ReportPipeline(self, max_running=1, initial_delay=startup_delay,
+                                                max_delay=polling_delay, backoff=1,
+                                                timeout=startup_delay + polling_delay * max_checks)
+    job = pipeline.run([report_details])[0]
+    logger.debug('report_id: %s, state: %s' % (job.id, job.state))
+    return job.result
 
 
 def qg_html_to_ascii(qg_html_text):
@@ -89,9 +71,12 @@ def qg_html_to_ascii(qg_html_text):
     return text
 
 
-def qg_parse_informational_qids(xml_report):
+def qg_parse_informational_qids(xml_report, knowledge_base=None):
     """Return vulnerabilities of severity 1 and 2 levels due to a restriction of
        QualysGuard's inability to report them in the internal ticketing system.
+
+       knowledge_base: qualysapi.knowledgebase.KnowledgeBase to look QID details up in, instead of
+       parsing and rendering the report's GLOSSARY. QIDs missing from it are still taken from the GLOSSARY.
     """
     # asset_group's vulnerability data map:
     #    {'qid_number': {
@@ -108,7 +93,7 @@ def qg_parse_informational_qids(xml_report):
     # Use defaultdict in case a new QID is encountered.    
     info_vulns = defaultdict(dict)
     # Parse vulnerabilities in xml string.
-    tree = objectify.fromstring(xml_report)
+    tree = qualysapi.stream.parse_response(xml_report, objectified=True)
     # Write IP, DNS, & Result into each QID CSV file.
     logging.debug('Parsing report...')
     # TODO:  Check against c_args.max to prevent creating CSV content for QIDs that we won't use.
@@ -149,9 +134,29 @@ def qg_parse_informational_qids(xml_report):
                                                  # Informational QIDs do not have vuln_id numbers.  This is a flag to write the CSV file.
                                                  'result': '%s' % (result), })
     # All vulnerabilities added.
+    # QIDs to render from the GLOSSARY, None for all of them.
+    missing = None
+    if knowledge_base is not None:
+        # Add all vulnerability information from the already rendered local KnowledgeBase.
+        missing = set()
+        for qid in info_vulns:
+            vuln_details = knowledge_base.get(qid)
+            if vuln_details is None:
+                logging.warning('QID %s not found in KnowledgeBase, sync it. Using the report GLOSSARY.' % (qid))
+                missing.add(qid)
+                continue
+            info_vulns[qid]['title'] = vuln_details['title']
+            info_vulns[qid]['severity'] = str(vuln_details['severity'])
+            info_vulns[qid]['solution'] = vuln_details['solution']
+            info_vulns[qid]['threat'] = vuln_details['threat']
+            info_vulns[qid]['impact'] = vuln_details['impact']
+        if not missing:
+            return info_vulns
     # Add all vulnerabilty information.
     for vuln_details in tree.GLOSSARY.VULN_DETAILS_LIST.VULN_DETAILS:
         qid = unicodedata.normalize('NFKD', unicode(vuln_details.QID)).encode('ascii', 'ignore').strip()
+        if missing is not None and qid not in missing:
+            continue
         info_vulns[qid]['title'] = unicodedata.normalize('NFKD', unicode(vuln_details.TITLE)).encode('ascii',
                                                                                                      'ignore').strip()
         info_vulns[qid]['severity'] = unicodedata.normalize('NFKD', unicode(vuln_details.SEVERITY)).encode('ascii',
@@ -0,0 +1,155 @@
+""" Module that contains the exceptions raised for QualysGuard API error responses, and the classifier
+mapping a response to them.
+
+The classifier only looks at the status code, the content type and a bounded head of the body, so checking
+a response costs the same whatever its size.
+"""
+import logging
+
+import requests
+from lxml import etree
+
+__author__ = 'Parag Baxi <parag.baxi@gmail.com>'
+__copyright__ = 'Copyright 2013, Parag Baxi'
+__license__ = 'Apache License 2.0'
+
+# Setup module level logging.
+logger = logging.getLogger(__name__)
+
+# Number of bytes at the start of a body parsed for error details. Error documents are much smaller.
+HEAD_SIZE = 16 * 1024
+
+
+class QualysAPIError(requests.HTTPError):
+    """ Base class of QualysGuard API errors. An HTTPError, so existing handlers keep catching it.
+
+    code: QualysGuard error code (RESPONSE/CODE, RETURN number or responseCode), None if there is none.
+    text: Error message of the response.
+    retry_after: Seconds to wait before trying again, when the API says so.
+
+    """
+
+    def __init__(self, message, response=None, code=None, text=None, retry_after=None):
+        super(QualysAPIError, self).__init__(message, response=response)
+        self.code = code
+        self.text = text
+        self.retry_after = retry_after
+
+
+class AuthenticationError(QualysAPIError):
+    """ Bad credentials or expired session (HTTP 401). """
+
+
+class IPNotAllowlisted(QualysAPIError):
+    """ The IP address of the caller is not in the secure IPs of the user (error 2007). """
+
+
+class RateLimited(QualysAPIError):
+    """ The rate limit of the call was reached (error 1960, or HTTP 409 with X-RateLimit-ToWait-Sec). """
+
+
+class ConcurrencyLimit(QualysAPIError):
+    """ Too many calls of the user are running (error 1965, or HTTP 409). """
+
+
+class ConcurrentScanLimit(QualysAPIError):
+    """ The maximum number of concurrent running scans was reached. """
+
+
+class ServerError(QualysAPIError):
+    """ The platform failed to handle the call (HTTP 5xx). """
+
+
+class CircuitOpen(QualysAPIError):
+    """ The call was not made: recent calls failed, so the platform is considered degraded for a while (see
+    qualysapi.adaptive.CircuitBreaker). """
+
+
+# Exceptions by QualysGuard error code.
+error_codes = {
+    '1960': RateLimited,
+    '1965': ConcurrencyLimit,
+    '2007': IPNotAllowlisted,
+}
+
+
+def retry_after(headers):
+    """ Return seconds to wait before trying again from X-RateLimit-ToWait-Sec or Retry-After, None if neither
+    holds a number of seconds.
+
+    """
+    for name in ('X-RateLimit-ToWait-Sec', 'Retry-After'):
+        try:
+            return int(headers[name])
+        except (KeyError, TypeError, ValueError):
+            pass
+    return None
+
+
+def parse_head(head):
+    """ Return dict of the error details found in the start of an XML body: root (tag of the root element),
+    code and text (RESPONSE/CODE & TEXT, RETURN number & text, or responseCode & errorMessage).
+
+    """
+    details = {'root': None, 'code': None, 'text': None}
+    parser = etree.XMLPullParser(events=('start', 'end'), recover=True, resolve_entities=False, no_network=True)
+    try:
+        parser.feed(head[:HEAD_SIZE])
+        events = parser.read_events()
+        for event, element in events:
+            tag = element.tag
+            if event == 'start':
+                if details['root'] is None:
+                    details['root'] = tag
+                elif tag == 'RETURN' and details['code'] is None:
+                    # API v1: <RETURN status="FAILED" number="2007">...</RETURN>.
+                    if element.get('status') == 'FAILED':
+                        details['code'] = element.get('number')
+                continue
+            if tag == 'RETURN' and details['code'] == element.get('number') and details['code']:
+                details['text'] = (element.text or '').strip()
+                continue
+            # Only error elements count, not data records which happen to have the same child tags.
+            parent = element.getparent()
+            parent = parent.tag if parent is not None else None
+            if details['code'] is None and (tag, parent) in (('CODE', 'RESPONSE'),
+                                                             ('responseCode', 'ServiceResponse')):
+                details['code'] = (element.text or '').strip()
+            elif details['text'] is None and (tag, parent) in (('TEXT', 'RESPONSE'),
+                                                               ('errorMessage', 'responseErrorDetails')):
+                details['text'] = (element.text or '').strip()
+    except etree.LxmlError as e:
+        logger.debug('Could not parse response head: %s', e)
+    return details
+
+
+def check_response(status_code, headers, head, response=None):
+    """ Raise the QualysAPIError matching a response, from its status code, headers and the start of its body.
+
+    response: The requests response, attached to the exception.
+
+    """
+    content_type = headers.get('Content-Type') or ''
+    if status_code < 400 and content_type and 'xml' not in content_type:
+        # Reports in PDF, CSV, etc.
+        return
+    details = parse_head(head) if head else {'root': None, 'code': None, 'text': None}
+    code, text = details['code'], details['text']
+    wait = retry_after(headers)
+    if details['root'] == 'ServiceResponse' and code == 'INVALID_REQUEST' and text and \
+            text.startswith('You have reached the maximum number of concurrent running scans'):
+        raise ConcurrentScanLimit(text, response, code, text, wait)
+    if code in error_codes:
+        raise error_codes[code]('Error %s: %s' % (code, text), response, code, text, wait)
+    if status_code < 400:
+        return
+    message = '%s error: %s' % (status_code, text or code or 'no details')
+    if status_code == 401:
+        raise AuthenticationError(message, response, code, text, wait)
+    if status_code == 409:
+        if wait:
+            raise RateLimited(message, response, code, text, wait)
+        raise ConcurrencyLimit(message, response, code, text, wait)
+    if status_code >= 500:
+        raise ServerError(message, response, code, text, wait)
+    raise QualysAPIError(message, response, code, text, wait)
@@ -0,0 +1,194 @@
+""" Module that contains a parallel export of QualysGuard host based list calls, sharded by host ID range.
+
+The ID space of the hosts is discovered first, split into id_min/id_max shards of about the same number of
+hosts, and the shards are fetched concurrently, so one export can use the whole concurrency limit of the
+subscription instead of a single connection.
+"""
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+from lxml import etree
+
+__author__ = 'Parag Baxi <parag.baxi@gmail.com>'
+__copyright__ = 'Copyright 2013, Parag Baxi'
+__license__ = 'Apache License 2.0'
+
+# Setup module level logging.
+logger = logging.getLogger(__name__)
+
+# Host list parameters which select hosts, copied from the export parameters to the discovery call.
+host_filters = ('ids', 'ips', 'ag_ids', 'ag_titles', 'network_ids', 'os_pattern', 'use_tags', 'tag_set_by',
+                'tag_include_selector', 'tag_exclude_selector', 'tag_set_include', 'tag_set_exclude',
+                'vm_scan_since', 'no_vm_scan_since', 'compliance_enabled')
+
+
+def shard_ranges(ranges, shards):
+    """ Return list of (id_min, id_max) splitting the sorted (first, last) ID ranges into at most shards
+    ranges holding about the same number of IDs.
+
+    """
+    total = sum(last - first + 1 for first, last in ranges)
+    if not total:
+        return []
+    per_shard = -(-total // max(1, shards))
+    result = []
+    start = None
+    count = 0
+    for first, last in ranges:
+        while first <= last:
+            if start is None:
+                start = first
+            take = min(last - first + 1, per_shard - count)
+            count += take
+            first += take
+            if count == per_shard:
+                result.append((start, first - 1))
+                start = None
+                count = 0
+    if start is not None:
+        result.append((start, ranges[-1][1]))
+    return result
+
+
+def serialize(element):
+    """ Return record element as XML bytes, one record per line.
+
+    """
+    return etree.tostring(element, with_tail=False) + b'\n'
+
+
+class ShardedExport(object):
+    """ Export of a host based API v2 list call (host list, host detection list, etc) in id_min/id_max shards
+    fetched concurrently.
+
+    conn: QGConnector.
+    api_call, data: The list call and its parameters.
+    record_tag, fields: Record elements to export and the children to keep, see QGConnector.iter_records().
+    transform: Called in the worker threads with each record element, returns what is exported. Defaults to
+        serialize().
+    shards: Number of shards, defaults to 4 per worker.
+    max_workers: Number of shards fetched at once, defaults to the concurrency limit reported by the API
+        (calls beyond it would be queued by the connector's rate limiter anyway).
+
+    """
+    discovery_call = '/api/2.0/fo/asset/host/'
+    default_workers = 4
+
+    def __init__(self, conn, api_call, data=None, record_tag='HOST', fields=None, transform=serialize,
+                 shards=None, max_workers=None):
+        self.conn = conn
+        self.api_call = api_call
+        self.data = dict(data or {})
+        self.record_tag = record_tag
+        self.fields = fields
+        self.transform = transform
+        self.shards = shards
+        self.max_workers = max_workers
+
+    def discover(self):
+        """ Return sorted list of (first, last) ranges of the IDs of the hosts selected by the export.
+
+        """
+        data = {'action': 'list', 'details': 'None', 'truncation_limit': 0}
+        for name in host_filters:
+            if name in self.data:
+                data[name] = self.data[name]
+        response = self.conn.request(self.discovery_call, data, stream=True)
+        ranges = []
+        try:
+            # IDs come as <ID_SET><ID>1</ID><ID_RANGE>3-9</ID_RANGE></ID_SET>.
+            for event, element in etree.iterparse(response, events=('end',), tag=('ID', 'ID_RANGE')):
+                if element.getparent() is not None and element.getparent().tag == 'ID_SET':
+                    first, _, last = element.text.partition('-')
+                    ranges.append((int(first), int(last or first)))
+                element.clear()
+        finally:
+            response.close()
+        ranges.sort()
+        logger.debug('Discovered %d host IDs.', sum(last - first + 1 for first, last in ranges))
+        return ranges
+
+    def workers(self):
+        if self.max_workers:
+            return self.max_workers
+        rate_limiter = getattr(self.conn, 'rate_limiter', None)
+        return getattr(rate_limiter, 'concurrency_limit', None) or self.default_workers
+
+    def plan(self):
+        """ Return list of (id_min, id_max) shards of the export.
+
+        """
+        return shard_ranges(self.discover(), self.shards or 4 * self.workers())
+
+    def shard_data(self, shard):
+        data = dict(self.data)
+        data['action'] = data.get('action', 'list')
+        data['id_min'], data['id_max'] = shard
+        return data
+
+    def fetch(self, shard, emit):
+        """ Call emit with every transformed record of shard, return number of records.
+
+        """
+        count = 0
+        for api_call, data, records in self.conn.iter_pages(self.api_call, self.shard_data(shard),
+                                                             self.record_tag, self.fields):
+            for record in records:
+                emit(self.transform(record))
+                count += 1
+        logger.debug('Shard %d-%d exported %d records.', shard[0], shard[1], count)
+        return count
+
+    def _fetch_list(self, shard):
+        records = []
+        self.fetch(shard, records.append)
+        return records
+
+    def records(self, shards=None):
+        """ Yield every transformed record in host ID order, buffering each shard until every shard before
+        it was yielded.
+
+        """
+        if shards is None:
+            shards = self.plan()
+        if not shards:
+            return
+        pool = ThreadPool(min(self.workers(), len(shards)))
+        try:
+            for records in pool.imap(self._fetch_list, shards):
+                for record in records:
+                    yield record
+        finally:
+            pool.terminate()
+
+    __iter__ = records
+
+    def run(self, sink, ordered=False, shards=None):
+        """ Export every record to sink, a callable, and return the number of records.
+
+        Unordered, sink is called from the worker threads as records arrive (serialized with a lock), so
+        memory use does not depend on the size of the export. Ordered, sink gets the records in host ID
+        order, see records().
+
+        """
+        if ordered:
+            count = 0
+            for record in self.records(shards):
+                sink(record)
+                count += 1
+            return count
+        if shards is None:
+            shards = self.plan()
+        if not shards:
+            return 0
+        lock = threading.Lock()
+
+        def emit(record):
+            with lock:
+                sink(record)
+        pool = ThreadPool(min(self.workers(), len(shards)))
+        try:
+            return sum(pool.imap_unordered(lambda shard: self.fetch(shard, emit), shards))
+        finally:
+            pool.terminate()
@@ -0,0 +1,195 @@
+""" Module that contains a local, incrementally synced copy of the QualysGuard KnowledgeBase.
+
+QIDs are kept in an SQLite store with their SOLUTION, THREAT and IMPACT already rendered to ASCII, so report
+processing can look QID details up locally instead of parsing and rendering the GLOSSARY of every report.
+"""
+import datetime
+import logging
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import qualysapi.contrib as contrib
+from qualysapi.sync import qualys_timestamp
+
+__author__ = 'Parag Baxi <parag.baxi@gmail.com>'
+__copyright__ = 'Copyright 2013, Parag Baxi'
+__license__ = 'Apache License 2.0'
+
+# Setup module level logging.
+logger = logging.getLogger(__name__)
+
+# Child tags of VULN kept while parsing the KnowledgeBase output.
+vuln_fields = frozenset(['QID', 'VULN_TYPE', 'SEVERITY_LEVEL', 'TITLE', 'CATEGORY', 'PATCHABLE',
+                         'LAST_SERVICE_MODIFICATION_DATETIME', 'PUBLISHED_DATETIME', 'CVE_LIST', 'DIAGNOSIS',
+                         'CONSEQUENCE', 'SOLUTION'])
+
+schema = '''
+CREATE TABLE IF NOT EXISTS vuln (
+    qid INTEGER PRIMARY KEY,
+    vuln_type TEXT,
+    severity INTEGER,
+    title TEXT,
+    category TEXT,
+    patchable INTEGER,
+    published TEXT,
+    last_modified TEXT,
+    cve_ids TEXT,
+    threat TEXT,
+    impact TEXT,
+    solution TEXT
+);
+CREATE INDEX IF NOT EXISTS vuln_severity ON vuln (severity);
+CREATE TABLE IF NOT EXISTS sync (
+    name TEXT PRIMARY KEY,
+    synced_until TEXT NOT NULL
+);
+'''
+
+
+def ascii_string(text):
+    """ Return text normalized to stripped ASCII, as the report GLOSSARY is rendered, '' if there is none.
+
+    """
+    if not text:
+        return ''
+    if isinstance(text, bytes):
+        text = text.decode('utf-8')
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').strip()
+
+
+def ascii_text(text):
+    """ Return QualysGuard quasi HTML text rendered as stripped ASCII text, '' if there is none.
+
+    """
+    text = ascii_string(text)
+    if not text:
+        return ''
+    return contrib.qg_html_to_ascii(text)
+
+
+class KnowledgeBase(object):
+    """ SQLite store of KnowledgeBase QIDs, synced incrementally from /api/2.0/fo/knowledge_base/vuln/.
+
+    conn: QGConnector, only needed to sync.
+    path: SQLite database file, ':memory:' for a throwaway store.
+    cache_size: Number of QIDs kept in memory after lookup.
+
+    """
+    api_call = '/api/2.0/fo/knowledge_base/vuln/'
+
+    def __init__(self, conn, path, cache_size=10000, batch_size=500):
+        self.conn = conn
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        with self._lock:
+            self.db.executescript(schema)
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def watermark(self):
+        """ Return timestamp up to which the store is synced, None if it never was.
+
+        """
+        with self._lock:
+            row = self.db.execute("SELECT synced_until FROM sync WHERE name = 'vuln'").fetchone()
+        return row[0] if row else None
+
+    def row(self, vuln):
+        """ Return row dict of a VULN element, with rendered text.
+
+        """
+        return {
+            'qid': int(vuln.findtext('QID')),
+            'vuln_type': vuln.findtext('VULN_TYPE'),
+            'severity': int(vuln.findtext('SEVERITY_LEVEL') or 0),
+            'title': ascii_string(vuln.findtext('TITLE')),
+            'category': vuln.findtext('CATEGORY'),
+            'patchable': int(vuln.findtext('PATCHABLE') or 0),
+            'published': vuln.findtext('PUBLISHED_DATETIME'),
+            'last_modified': vuln.findtext('LAST_SERVICE_MODIFICATION_DATETIME'),
+            'cve_ids': ','.join(cve.text for cve in vuln.iterfind('CVE_LIST/CVE/ID')),
+            'threat': ascii_text(vuln.findtext('DIAGNOSIS')),
+            'impact': ascii_text(vuln.findtext('CONSEQUENCE')),
+            'solution': ascii_text(vuln.findtext('SOLUTION')),
+        }
+
+    def upsert(self, rows):
+        with self._lock:
+            self.db.executemany('INSERT OR REPLACE INTO vuln VALUES (:qid, :vuln_type, :severity, :title, '
+                                ':category, :patchable, :published, :last_modified, :cve_ids, :threat, :impact, '
+                                ':solution)', rows)
+            self.db.commit()
+            for row in rows:
+                self._cache.pop(row['qid'], None)
+
+    def sync(self, full=False, **parameters):
+        """ Sync QIDs modified since the last successful sync (every QID if full) and return the number of
+        QIDs stored. Extra keyword arguments are KnowledgeBase API parameters.
+
+        If a request fails (an exception from qualysapi.exceptions), the watermark is left as it was.
+
+        """
+        # Taken before the first request so that changes made during the sync are picked up next time.
+        started = qualys_timestamp(datetime.datetime.utcnow())
+        watermark = None if full else self.watermark()
+        logger.info('Syncing KnowledgeBase since %s.', watermark or 'the beginning')
+        data = {'action': 'list', 'details': 'All'}
+        if watermark:
+            data['last_modified_after'] = watermark
+        data.update(parameters)
+        count = 0
+        for api_call, data, records in self.conn.iter_pages(self.api_call, data, 'VULN', vuln_fields):
+            batch = []
+            for vuln in records:
+                batch.append(self.row(vuln))
+                if len(batch) >= self.batch_size:
+                    self.upsert(batch)
+                    count += len(batch)
+                    batch = []
+            self.upsert(batch)
+            count += len(batch)
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO sync VALUES ('vuln', ?)", (started,))
+            self.db.commit()
+        logger.info('Synced %d QIDs.', count)
+        return count
+
+    def get(self, qid):
+        """ Return dict of QID details, None if qid is not in the store.
+
+        """
+        qid = int(qid)
+        with self._lock:
+            row = self._cache.pop(qid, None)
+            if row is None:
+                row = self.db.execute('SELECT * FROM vuln WHERE qid = ?', (qid,)).fetchone()
+                if row is None:
+                    return None
+                row = dict(zip(row.keys(), row))
+            # Most recently used goes last.
+            self._cache[qid] = row
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return row
+
+    def __getitem__(self, qid):
+        row = self.get(qid)
+        if row is None:
+            raise KeyError(qid)
+        return row
+
+    def __contains__(self, qid):
+        return self.get(qid) is not None
+
+    def __len__(self):
+        with self._lock:
+            return self.db.execute('SELECT COUNT(*) FROM vuln').fetchone()[0]
@@ -0,0 +1,173 @@
+""" Module that keeps per api_call performance metrics of QualysGuard API requests. """
+import bisect
+import logging
+import threading
+from collections import defaultdict
+
+__author__ = 'Parag Baxi <parag.baxi@gmail.com>'
+__copyright__ = 'Copyright 2013, Parag Baxi'
+__license__ = 'Apache License 2.0'
+
+# Setup module level logging.
+logger = logging.getLogger(__name__)
+
+# Response headers remembered as the last seen rate limits.
+rate_limit_headers = (
+    'X-RateLimit-Limit',
+    'X-RateLimit-Window-Sec',
+    'X-RateLimit-Remaining',
+    'X-RateLimit-ToWait-Sec',
+    'X-Concurrency-Limit-Limit',
+    'X-Concurrency-Limit-Running',
+)
+
+
+class LatencyHistogram(object):
+    """ Histogram of latencies in geometric buckets, from 1 ms to over 10 minutes with at most
+    20% error on percentiles.
+
+    """
+    # Upper bounds of buckets in seconds.
+    bounds = [0.001 * 1.2 ** i for i in range(75)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent):
+        """ Return upper bound in seconds of the bucket holding the percent percentile, None if empty.
+
+        """
+        if not self.count:
+            return None
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+
+class EndpointStats(object):
+    """ Metrics of a single api_call.
+
+    """
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.bytes_received = 0
+        # Retries spent on the concurrent scan limit.
+        self.concurrent_scan_retries = 0
+        # Retries of idempotent calls by the adaptive controller.
+        self.controller_retries = 0
+        self.cache_hits = 0
+        # Calls which shared the response of an identical call in flight.
+        self.coalesced = 0
+        # Counts by HTTP status code, 'error' for requests that got no response.
+        self.status_codes = defaultdict(int)
+        self.rate_limits = {}
+
+    def snapshot(self):
+        return {
+            'requests': self.requests,
+            'bytes_received': self.bytes_received,
+            'concurrent_scan_retries': self.concurrent_scan_retries,
+            'controller_retries': self.controller_retries,
+            'cache_hits': self.cache_hits,
+            'coalesced': self.coalesced,
+            'status_codes': dict(self.status_codes),
+            'rate_limits': dict(self.rate_limits),
+            'latency': {
+                'mean': self.latency.total / self.latency.count if self.latency.count else None,
+                'max': self.latency.max if self.latency.count else None,
+                'p50': self.latency.percentile(50),
+                'p95': self.latency.percentile(95),
+                'p99': self.latency.percentile(99),
+            },
+        }
+
+
+class MetricsRegistry(object):
+    """ Thread-safe registry of EndpointStats by api_call.
+
+    Exporters are callables called after every request with (api_call, sample), where sample is a dict
+    of latency, status, bytes and rate_limits. Use them to feed statsd, Prometheus, logs, etc.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = defaultdict(EndpointStats)
+        self.exporters = []
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+
+    def record(self, api_call, latency, status, bytes_received=0, headers=None):
+        """ Record a request to api_call which took latency seconds.
+
+        """
+        rate_limits = {}
+        if headers is not None:
+            for name in rate_limit_headers:
+                if name in headers:
+                    rate_limits[name] = headers[name]
+        with self._lock:
+            stats = self.endpoints[api_call]
+            stats.requests += 1
+            stats.latency.add(latency)
+            stats.bytes_received += bytes_received
+            stats.status_codes[status] += 1
+            stats.rate_limits.update(rate_limits)
+        if self.exporters:
+            sample = {'latency': latency, 'status': status, 'bytes': bytes_received, 'rate_limits': rate_limits}
+            for exporter in self.exporters:
+                try:
+                    exporter(api_call, sample)
+                except Exception as e:
+                    logger.error('Metrics exporter %r failed: %s', exporter, e)
+
+    def record_bytes(self, api_call, bytes_received):
+        """ Record bytes of a streamed response read after the request was recorded.
+
+        """
+        with self._lock:
+            self.endpoints[api_call].bytes_received += bytes_received
+
+    def record_retry(self, api_call):
+        with self._lock:
+            self.endpoints[api_call].concurrent_scan_retries += 1
+
+    def record_controller_retry(self, api_call):
+        with self._lock:
+            self.endpoints[api_call].controller_retries += 1
+
+    def record_cache_hit(self, api_call):
+        with self._lock:
+            self.endpoints[api_call].cache_hits += 1
+
+    def record_coalesced(self, api_call):
+        with self._lock:
+            self.endpoints[api_call].coalesced += 1
+
+    def snapshot(self):
+        """ Return dict of metrics dicts by api_call.
+
+        """
+        with self._lock:
+            return dict((api_call, stats.snapshot()) for api_call, stats in self.endpoints.items())
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+
@@ -0,0 +1,190 @@
+""" Module that contains streaming parsers of QualysGuard API list output, built on
+lxml.etree.iterparse so that only one record is held in memory at a time, and a
+multiprocess parser of large downloaded reports.
+"""
+import logging
+import mmap
+import multiprocessing
+
+from lxml import etree
+
+__author__ = 'Parag Baxi <parag.baxi@gmail.com>'
+__copyright__ = 'Copyright 2013, Parag Baxi'
+__license__ = 'Apache License 2.0'
+
+# Setup module level logging.
+logger = logging.getLogger(__name__)
+
+# Child tags needed to build each api_objects record.
+host_fields = frozenset(['DNS', 'ID', 'IP', 'LAST_VULN_SCAN_DATETIME', 'NETBIOS', 'OS', 'TRACKING_METHOD'])
+scan_fields = frozenset(['ASSET_GROUP_TITLE_LIST', 'DURATION', 'LAUNCH_DATETIME', 'OPTION_PROFILE', 'PROCESSED',
+                         'REF', 'STATUS', 'TARGET', 'TITLE', 'TYPE', 'USER_LOGIN'])
+report_fields = frozenset(['EXPIRATION_DATETIME', 'ID', 'LAUNCH_DATETIME', 'OUTPUT_FORMAT', 'SIZE', 'STATUS',
+                           'TYPE', 'USER_LOGIN'])
+
+
+class RecordParser(object):
+    """ Iterable over the tag elements of a file-like XML source, e.g. a QGResponseStream.
+
+    Each element is cleared once the next one is requested, so copy what you need out of it. If fields is
+    given, other children of the element are dropped before it is yielded. Once iterated, next_url holds the
+    truncation URL of the output (<WARNING><URL>), None if the output is complete.
+
+    """
+
+    def __init__(self, source, tag, fields=None):
+        self.source = source
+        self.tag = tag
+        self.fields = fields
+        self.next_url = None
+
+    def __iter__(self):
+        for event, element in etree.iterparse(self.source, events=('end',), tag=(self.tag, 'URL'), huge_tree=True):
+            if element.tag == 'URL':
+                parent = element.getparent()
+                if parent is not None and parent.tag == 'WARNING':
+                    self.next_url = element.text
+                continue
+            if self.fields is not None:
+                for child in list(element):
+                    if child.tag not in self.fields:
+                        element.remove(child)
+            yield element
+            # Free the record and the already processed records before it.
+            element.clear()
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+
+
+
+class RangeReader(object):
+    """ File-like object reading the byte range [start, end) of mapped file mm, wrapped in a <CHUNK> root element
+    so that the records it holds parse as one document.
+
+    """
+
+    def __init__(self, mm, start, end):
+        self.mm = mm
+        self.position = start
+        self.end = end
+        self._prefix = b'<CHUNK>'
+        self._suffix = b'</CHUNK>'
+
+    def read(self, size=-1):
+        if self._prefix:
+            data, self._prefix = self._prefix, b''
+            return data
+        if self.position < self.end:
+            if size is None or size < 0:
+                size = self.end - self.position
+            data = self.mm[self.position:min(self.end, self.position + size)]
+            self.position += len(data)
+            return data
+        data, self._suffix = self._suffix, b''
+        return data
+
+
+def record_ranges(mm, tag='HOST', chunks=1):
+    """ Return list of up to chunks (start, end) byte ranges of mapped file mm, each holding whole tag records,
+    together covering every record.
+
+    Records must be siblings, e.g. the HOST elements of a HOST_LIST, and there must be no other tag element
+    between the first and last one.
+
+    """
+    opening = ('<%s>' % tag).encode('ascii')
+    # Records with attributes, e.g. <HOST id="1">.
+    opening_attributes = ('<%s ' % tag).encode('ascii')
+    closing = ('</%s>' % tag).encode('ascii')
+
+    def record_start(position):
+        starts = [i for i in (mm.find(opening, position), mm.find(opening_attributes, position)) if i >= 0]
+        return min(starts) if starts else -1
+    first = record_start(0)
+    last = mm.rfind(closing)
+    if first < 0 or last < first:
+        return []
+    end = last + len(closing)
+    step = max(1, (end - first) // max(1, chunks))
+    boundaries = [first]
+    while True:
+        boundary = record_start(boundaries[-1] + step)
+        if boundary < 0 or boundary >= end:
+            break
+        boundaries.append(boundary)
+    boundaries.append(end)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _parse_range(arguments):
+    """ Return list of handler(element) of the tag records in a byte range of file path, or if table is
+    given, table of the records. Runs in the worker processes of parse_file.
+
+    """
+    path, start, end, tag, fields, handler, table = arguments
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            records = RecordParser(RangeReader(mm, start, end), tag, fields)
+            if table is not None:
+                return table.from_elements(records)
+            if isinstance(handler, type):
+                # Class methods do not pickle on Python 2, so classes are sent instead.
+                handler = handler.from_element
+            return [handler(record) for record in records]
+        finally:
+            mm.close()
+
+
+def _map_ranges(path, tag, fields, handler, table, processes, chunks):
+    """ Yield result of _parse_range for each chunk of file path, in file order.
+
+    """
+    processes = processes or multiprocessing.cpu_count()
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file.
+            return
+        try:
+            ranges = record_ranges(mm, tag, chunks or 4 * processes)
+        finally:
+            mm.close()
+    logger.debug('Parsing %s in %d chunks on %d processes.', path, len(ranges), processes)
+    if not ranges:
+        return
+    pool = multiprocessing.Pool(min(processes, len(ranges)))
+    try:
+        for result in pool.imap(_parse_range, [(path, start, end, tag, fields, handler, table)
+                                               for start, end in ranges]):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+
+
+def parse_file(path, handler, tag='HOST', fields=None, processes=None, chunks=None):
+    """ Yield batches (lists) of handler(element) for every tag record of the XML file path, e.g. a downloaded
+    detection or scan report, in file order.
+
+    The file is split at record boundaries (see record_ranges) through mmap, without reading it, and the
+    chunks are parsed on a pool of processes (defaults to one per CPU). handler must be picklable, e.g. a
+    module level function, or a class with a from_element constructor like api_objects.Host.
+
+    """
+    for batch in _map_ranges(path, tag, fields, handler, None, processes, chunks):
+        yield batch
+
+
+def parse_file_table(path, table, tag='HOST', processes=None, chunks=None):
+    """ Return table (e.g. tables.HostTable or tables.DetectionTable) of every tag record of the XML file
+    path, parsed like parse_file.
+
+    """
+    result = None
+    for chunk in _map_ranges(path, tag, None, None, table, processes, chunks):
+        result = chunk if result is None else result.concatenate(chunk)
+    return result if result is not None else table.from_rows([])
@@ -0,0 +1,468 @@
+""" Module that paces QualysGuard API calls using the rate and concurrency limit headers
+returned with every response:
+
+X-RateLimit-Limit, X-RateLimit-Window-Sec, X-RateLimit-Remaining, X-RateLimit-ToWait-Sec,
+X-Concurrency-Limit-Limit and X-Concurrency-Limit-Running.
+
+The limits are those of the account, so the limiter state lives in a backend: LocalBackend keeps it in the
+process, FileBackend shares it between the processes of one machine and SocketBackend between hosts, through
+a Coordinator server.
+"""
+import errno
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import defaultdict
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+try:
+    import fcntl
+except ImportError:
+    # Windows.
+    fcntl = None
+
+__author__ = 'Parag Baxi <parag.baxi@gmail.com>'
+__copyright__ = 'Copyright 2013, Parag Baxi'
+__license__ = 'Apache License 2.0'
+
+# Setup module level logging.
+logger = logging.getLogger(__name__)
+
+# Response headers the limits are read from.
+limit_headers = ('X-RateLimit-Limit', 'X-RateLimit-Window-Sec', 'X-RateLimit-Remaining', 'X-RateLimit-ToWait-Sec',
+                 'X-Concurrency-Limit-Limit', 'X-Concurrency-Limit-Running')
+
+hostname = socket.gethostname()
+
+
+def _int_header(headers, name):
+    """ Return header name as an int, None if it is missing or not a number.
+
+    """
+    try:
+        return int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket(object):
+    """ Token bucket for a single api_call, refilled at limit calls per window seconds.
+
+    """
+
+    def __init__(self, capacity=None, rate=None, tokens=None, updated=None, wait_until=0):
+        # Unknown until the first response headers are seen.
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = tokens
+        self.updated = time.time() if updated is None else updated
+        # Time before which no call may be made (X-RateLimit-ToWait-Sec).
+        self.wait_until = wait_until
+
+    def as_dict(self):
+        return {'capacity': self.capacity, 'rate': self.rate, 'tokens': self.tokens, 'updated': self.updated,
+                'wait_until': self.wait_until}
+
+    def refill(self, now):
+        if self.rate and self.tokens is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """ Return seconds to wait before a call may be made, 0 if a call may be made now.
+
+        """
+        self.refill(now)
+        if now < self.wait_until:
+            return self.wait_until - now
+        if self.tokens is None or self.tokens >= 1:
+            return 0
+        if self.rate:
+            return (1 - self.tokens) / self.rate
+        # No refill rate known, fall back to letting the API decide.
+        return 0
+
+
+def new_state():
+    """ Return limiter state of an account no call was made to yet.
+
+    Calls running are kept as leases, by lease ID: [host, pid, time acquired, api_call].
+
+    """
+    return {'version': 0, 'buckets': {}, 'leases': {}, 'concurrency_limit': None, 'running_elsewhere': 0}
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _expire_leases(state, lease_timeout, now):
+    """ Drop leases of processes which died on this host, or held on another host for more than lease_timeout
+    seconds, so calls never released do not hold the concurrency limit forever. Leases of live processes on
+    this host are kept however long they run, e.g. a long streamed export.
+
+    """
+    for lease, (host, pid, acquired, api_call) in list(state['leases'].items()):
+        if host == hostname:
+            expired = not _pid_alive(pid)
+        else:
+            # The process cannot be checked from here.
+            expired = now - acquired > lease_timeout
+        if expired:
+            logger.warning('Dropping lease of %s call held by %s:%s since %s.', api_call, host, pid,
+                           time.ctime(acquired))
+            del state['leases'][lease]
+            state['version'] += 1
+
+
+def _acquire(state, api_call, lease, owner, lease_timeout):
+    """ Take a call to api_call as lease if the limits allow it now. Return (granted, delay, version), delay
+    being the seconds to wait before trying again, None to wait for a release.
+
+    """
+    now = time.time()
+    if lease_timeout is not None:
+        _expire_leases(state, lease_timeout, now)
+    bucket = TokenBucket(**state['buckets'].get(api_call, {}))
+    delay = bucket.delay(now)
+    state['buckets'][api_call] = bucket.as_dict()
+    if delay > 0:
+        return False, delay, state['version']
+    # With none of the account's calls running, the count of calls running elsewhere can only be refreshed
+    # by making a call.
+    running = len(state['leases'])
+    if state['concurrency_limit'] and running and \
+            running + state['running_elsewhere'] >= state['concurrency_limit']:
+        return False, None, state['version']
+    if bucket.tokens is not None:
+        bucket.tokens -= 1
+        state['buckets'][api_call] = bucket.as_dict()
+    state['leases'][lease] = [owner[0], owner[1], now, api_call]
+    return True, 0, state['version']
+
+
+def _update(state, api_call, limits):
+    """ Update the limits of api_call from the dict of limit_headers values of a response.
+
+    """
+    now = time.time()
+    bucket = TokenBucket(**state['buckets'].get(api_call, {}))
+    bucket.refill(now)
+    limit, window = limits.get('X-RateLimit-Limit'), limits.get('X-RateLimit-Window-Sec')
+    if limit and window:
+        bucket.capacity = limit
+        bucket.rate = float(limit) / window
+    remaining = limits.get('X-RateLimit-Remaining')
+    if remaining is not None:
+        # The API's count is authoritative.
+        bucket.tokens = remaining
+        if bucket.capacity is None or remaining > bucket.capacity:
+            bucket.capacity = remaining
+    to_wait = limits.get('X-RateLimit-ToWait-Sec')
+    if to_wait:
+        bucket.wait_until = max(bucket.wait_until, now + to_wait)
+    state['buckets'][api_call] = bucket.as_dict()
+    if limits.get('X-Concurrency-Limit-Limit'):
+        state['concurrency_limit'] = limits['X-Concurrency-Limit-Limit']
+    running = limits.get('X-Concurrency-Limit-Running')
+    if running is not None:
+        state['running_elsewhere'] = max(0, running - len(state['leases']))
+    state['version'] += 1
+
+
+def _release(state, lease):
+    if state['leases'].pop(lease, None) is not None:
+        state['version'] += 1
+
+
+def _snapshot(state):
+    return {'concurrency_limit': state['concurrency_limit'], 'running': len(state['leases']),
+            'running_elsewhere': state['running_elsewhere']}
+
+
+# Operations run atomically on the limiter state by the backends, by name.
+operations = {
+    'acquire': _acquire,
+    'update': _update,
+    'release': _release,
+    'snapshot': _snapshot,
+}
+
+
+class LocalBackend(object):
+    """ Limiter state kept in this process, the default. Calls of other processes are only seen through the
+    X-Concurrency-Limit-Running header.
+
+    """
+    # Calls of this process are always released.
+    lease_timeout = None
+
+    def __init__(self):
+        self.state = new_state()
+        self._condition = threading.Condition()
+
+    def execute(self, operation, *args):
+        """ Run operation on the state and return its result.
+
+        """
+        with self._condition:
+            version = self.state['version']
+            result = operations[operation](self.state, *args)
+            if self.state['version'] != version:
+                self._condition.notify_all()
+            return result
+
+    def wait(self, version, timeout):
+        """ Wait up to timeout seconds (forever if None) for the state to change from version.
+
+        """
+        with self._condition:
+            if self.state['version'] == version:
+                self._condition.wait(timeout)
+
+
+class FileBackend(object):
+    """ Limiter state shared by the processes of one machine in a JSON file, locked (flock) around every
+    operation. POSIX only.
+
+    path: State file, one per account. Put it on a tmpfs, e.g. /dev/shm, to keep it in shared memory.
+    poll_interval: Seconds between checks while waiting for a call of another process to be released.
+    lease_timeout: Seconds after which a call never released by a process on another host no longer counts.
+        Calls of processes which died on this host are dropped right away.
+
+    """
+
+    def __init__(self, path, poll_interval=0.5, lease_timeout=3600):
+        if fcntl is None:
+            raise ImportError('FileBackend requires fcntl.')
+        self.path = path
+        self.poll_interval = poll_interval
+        self.lease_timeout = lease_timeout
+
+    def execute(self, operation, *args):
+        with os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600), 'r+') as f:
+            # Released when the file is closed.
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            content = f.read()
+            try:
+                state = json.loads(content) if content else new_state()
+            except ValueError:
+                logger.warning('Limiter state %s is corrupt, starting over.', self.path)
+                state = new_state()
+            result = operations[operation](state, *args)
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+            f.flush()
+        return result
+
+    def wait(self, version, timeout):
+        # Other processes cannot notify us, poll.
+        time.sleep(self.poll_interval if timeout is None else min(timeout, self.poll_interval))
+
+
+class SocketBackend(object):
+    """ Limiter state held by a Coordinator, shared by the connectors of every host using it.
+
+    address: (host, port) of the Coordinator.
+    authkey: Secret shared with the Coordinator, bytes.
+    lease_timeout: Seconds after which a call never released by a process on another host than the Coordinator
+        (e.g. its host died) no longer counts. Calls of processes on the Coordinator's host count until they die.
+
+    """
+
+    def __init__(self, address, authkey, lease_timeout=3600):
+        self.address = tuple(address)
+        self.authkey = authkey
+        self.lease_timeout = lease_timeout
+        # Connections cannot be shared between threads, nor with forked processes.
+        self._local = threading.local()
+
+    def _call(self, *message):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = Client(self.address, authkey=self.authkey)
+            self._local.pid = os.getpid()
+        try:
+            conn.send(message)
+            result = conn.recv()
+        except (EOFError, IOError, OSError):
+            # Connect again on the next call.
+            self._local.conn = None
+            raise
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def execute(self, operation, *args):
+        return self._call('execute', operation, args)
+
+    def wait(self, version, timeout):
+        self._call('wait', version, timeout)
+
+
+class Coordinator(object):
+    """ Server holding the limiter state of an account for the SocketBackend of connectors on any host. Run
+    one per account:
+
+        Coordinator(('0.0.0.0', 7790), authkey=b'secret').serve_forever()
+
+    Clients authenticate with authkey (HMAC challenge), messages are pickled: only listen on trusted networks.
+
+    """
+    # Longest wait of a client, so blocked clients check for expired leases once in a while.
+    max_wait = 5
+
+    def __init__(self, address, authkey):
+        self.backend = LocalBackend()
+        self.listener = Listener(tuple(address), authkey=authkey)
+        self.address = self.listener.address
+        self._closed = False
+
+    def serve_forever(self):
+        """ Serve clients, each on its own thread, until close().
+
+        """
+        while not self._closed:
+            try:
+                conn = self.listener.accept()
+            except AuthenticationError as e:
+                logger.warning('Client refused: %s', e)
+                continue
+            except (EOFError, IOError, OSError) as e:
+                if self._closed:
+                    return
+                logger.warning('Accepting client failed: %s', e)
+                continue
+            thread = threading.Thread(target=self.serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def serve(self, conn):
+        try:
+            while True:
+                message = conn.recv()
+                try:
+                    if message[0] == 'execute':
+                        reply = self.backend.execute(message[1], *message[2])
+                    elif message[0] == 'wait':
+                        timeout = message[2]
+                        self.backend.wait(message[1], self.max_wait if timeout is None else
+                                          min(timeout, self.max_wait))
+                        reply = None
+                    else:
+                        raise ValueError('Unknown message %r.' % (message[0],))
+                except (KeyError, IndexError, TypeError, ValueError) as e:
+                    reply = ValueError('Bad message %r: %s' % (message, e))
+                conn.send(reply)
+        except (EOFError, IOError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def close(self):
+        self._closed = True
+        self.listener.close()
+
+
+class RateLimiter(object):
+    """ Thread-safe scheduler pacing calls per api_call with a token bucket, and all calls with a
+    concurrency limit, both driven by the limits the API reports.
+
+    backend: Where the limiter state lives. The default LocalBackend paces this process; a FileBackend or
+        SocketBackend paces every process using the same state together, enforcing the rate and concurrency
+        limits for the whole account.
+
+    A single RateLimiter may be shared by several connectors using the same account.
+
+    """
+
+    def __init__(self, backend=None):
+        self.backend = LocalBackend() if backend is None else backend
+        # Leases of the calls running in this process, by api_call.
+        self._leases = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @property
+    def concurrency_limit(self):
+        """ Maximum calls running at once (X-Concurrency-Limit-Limit), None until reported.
+
+        """
+        return self.backend.execute('snapshot')['concurrency_limit']
+
+    @property
+    def running(self):
+        """ Calls running through this limiter's state, in every process sharing it.
+
+        """
+        return self.backend.execute('snapshot')['running']
+
+    @property
+    def running_elsewhere(self):
+        """ Calls running on the account outside of this limiter's state (X-Concurrency-Limit-Running).
+
+        """
+        return self.backend.execute('snapshot')['running_elsewhere']
+
+    def _take(self, api_call, lease):
+        granted, delay, version = self.backend.execute('acquire', api_call, lease, (hostname, os.getpid()),
+                                                       self.backend.lease_timeout)
+        if granted:
+            with self._lock:
+                self._leases[api_call].append(lease)
+        return granted, delay, version
+
+    def acquire(self, api_call, blocking=True):
+        """ Block until a call to api_call is allowed by both the rate limit and the concurrency limit. Not
+        blocking, return whether the call was allowed right away.
+
+        """
+        lease = uuid.uuid4().hex
+        while True:
+            granted, delay, version = self._take(api_call, lease)
+            if granted:
+                return True
+            if not blocking:
+                return False
+            if delay:
+                logger.info('Rate limit for %s reached, waiting %.1f seconds.', api_call, delay)
+            else:
+                logger.debug('Concurrency limit reached, waiting.')
+            self.backend.wait(version, delay)
+
+    def try_acquire(self, api_call):
+        """ Take a call to api_call if both limits allow it now. Return 0 if it was taken, else the seconds to
+        wait before trying again, None to wait for a call to be released. For callers which cannot block, e.g.
+        event loops.
+
+        """
+        granted, delay, version = self._take(api_call, uuid.uuid4().hex)
+        return 0 if granted else delay
+
+    def update(self, api_call, headers):
+        """ Update the limits of api_call from the response headers.
+
+        """
+        limits = dict((name, _int_header(headers, name)) for name in limit_headers)
+        self.backend.execute('update', api_call, limits)
+
+    def release(self, api_call):
+        """ Mark a call to api_call as finished.
+
+        """
+        with self._lock:
+            leases = self._leases.get(api_call)
+            lease = leases.pop() if leases else None
+        if lease is None:
+            logger.warning('Release of %s without a running call.', api_call)
+            return
+        self.backend.execute('release', lease)
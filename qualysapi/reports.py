@@ -0,0 +1,290 @@
+""" Module that contains a pipeline launching many QualysGuard reports at once, and a manager downloading
+finished reports to disk.
+
+Launched reports are tracked together: one report list call polls all of them, each report backs off
+exponentially while it spools, at most max_running reports spool at once, and finished reports are fetched
+on a thread pool as soon as they are seen, while the others keep spooling.
+"""
+import logging
+import os
+import time
+from multiprocessing.pool import ThreadPool
+
+import qualysapi.exceptions as exceptions
+import qualysapi.stream
+
+__author__ = 'Parag Baxi <parag.baxi@gmail.com>'
+__copyright__ = 'Copyright 2013, Parag Baxi'
+__license__ = 'Apache License 2.0'
+
+# Setup module level logging.
+logger = logging.getLogger(__name__)
+
+# Report states which will not change anymore, besides Finished.
+failed_states = frozenset(['Canceled', 'Errors', 'Expired'])
+
+
+def fetch_report(conn, job):
+    """ Return the fetched report of job, the default fetch of ReportPipeline.
+
+    """
+    return conn.request(ReportPipeline.api_call, {'action': 'fetch', 'id': job.id})
+
+
+class ReportJob(object):
+    """ A report of a ReportPipeline, from its launch parameters to its fetched result.
+
+    """
+
+    def __init__(self, report_details):
+        self.report_details = report_details
+        self.id = None
+        # Queued, then the report's STATUS/STATE (Submitted, Running, Finished, ...), Fetched or Failed.
+        self.state = 'Queued'
+        self.launched = None
+        self.delay = None
+        self.next_check = None
+        self.checks = 0
+        # Report list calls in a row the report was missing from.
+        self.missing = 0
+        self.result = None
+        self.error = None
+
+    def __repr__(self):
+        return '<ReportJob %s %s>' % (self.id, self.state)
+
+
+class ReportPipeline(object):
+    """ Launch, poll and fetch many reports concurrently.
+
+    conn: QGConnector.
+    max_running: Maximum number of reports spooling at once (the concurrent report limit of the user). If a
+        launch is refused by a limit while other reports are running, no more reports are launched until one of
+        them is done, and max_running applies again once a launch succeeds. If it is refused while none are
+        running (the limit is used elsewhere), the launch is tried again after a back off, or the time the API
+        asks to wait.
+    initial_delay: Seconds before the first check of a report.
+    max_delay: Maximum seconds between checks of a report.
+    backoff: Factor applied to the delay of a report after each check where it was not done.
+    timeout: Seconds after its launch before a report is given up, None to wait forever.
+    fetch: Called with (conn, job) on a fetch worker once a report is Finished, returns job.result.
+    fetch_workers: Number of reports fetched at once.
+    max_missing: Number of report list calls in a row a running report may be missing from before it is given
+        up, e.g. deleted by another user.
+
+    """
+    api_call = '/api/2.0/fo/report/'
+
+    def __init__(self, conn, max_running=8, initial_delay=5, max_delay=300, backoff=2, timeout=None,
+                 fetch=fetch_report, fetch_workers=4, max_missing=3):
+        self.conn = conn
+        self.max_running = max_running
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.timeout = timeout
+        self.fetch = fetch
+        self.fetch_workers = fetch_workers
+        self.max_missing = max_missing
+
+    def launch(self, job):
+        """ Launch job's report. Return True if it was launched, None if the concurrency or rate limit refused
+        it, so it can be launched again later, and False if it failed.
+
+        """
+        data = dict(job.report_details)
+        data['action'] = 'launch'
+        try:
+            response = self.conn.request(self.api_call, data)
+        except (exceptions.ConcurrencyLimit, exceptions.RateLimited) as e:
+            logger.warning('Launch of report %s refused: %s', job.report_details, e)
+            job.error = e
+            return None
+        except exceptions.QualysAPIError as e:
+            logger.error('Launch of report %s failed: %s', job.report_details, e)
+            job.error = e
+            return False
+        report_id = qualysapi.stream.parse_response(response).findtext('.//ITEM/VALUE')
+        if not report_id:
+            logger.error('Launch of report %s returned no report ID.', job.report_details)
+            job.error = response
+            return False
+        job.id = report_id
+        job.state = 'Submitted'
+        job.launched = time.time()
+        job.delay = self.initial_delay
+        job.next_check = job.launched + job.delay
+        job.error = None
+        logger.info('Launched report %s.', report_id)
+        return True
+
+    def states(self, ids):
+        """ Return dict of report STATUS/STATE by report ID of the reports ids, from one report list call. None
+        if it failed.
+
+        """
+        # The report list takes a single report ID, list them all and keep ours.
+        ids = frozenset(ids)
+        states = {}
+        try:
+            for api_call, data, records in self.conn.iter_pages(self.api_call, {'action': 'list'}, 'REPORT',
+                                                                 ('ID', 'STATUS')):
+                for report in records:
+                    report_id = report.findtext('ID')
+                    if report_id in ids:
+                        states[report_id] = report.findtext('STATUS/STATE')
+        except exceptions.QualysAPIError as e:
+            # Transient, the reports are checked again on the next round.
+            logger.warning('Check of the running reports failed: %s', e)
+            return None
+        return states
+
+    def run(self, reports):
+        """ Launch a report for each dict of launch parameters in reports, fetch them as they finish and
+        return the list of ReportJob, in the order of reports.
+
+        """
+        jobs = [ReportJob(report_details) for report_details in reports]
+        queued = list(jobs)
+        running = []
+        fetches = []
+        max_running = self.max_running
+        # Launches refused in a row while none of our reports were running.
+        refusals = 0
+        pool = ThreadPool(self.fetch_workers)
+        try:
+            while queued or running:
+                # Launch as many reports as the concurrent report limit allows.
+                while queued and len(running) < max_running:
+                    job = queued[0]
+                    launched = self.launch(job)
+                    if launched:
+                        running.append(queued.pop(0))
+                        max_running = self.max_running
+                        refusals = 0
+                    elif launched is None and running:
+                        # Refused by a limit, retry once a report finished.
+                        max_running = len(running)
+                        logger.warning('Concurrent report limit reached at %d reports.', max_running)
+                        break
+                    elif launched is None:
+                        # Refused by a limit used up elsewhere, retry later.
+                        refusals += 1
+                        delay = job.error.retry_after or min(self.initial_delay * self.backoff ** (refusals - 1),
+                                                             self.max_delay)
+                        logger.warning('Launch of report %s refused, trying again in %s seconds.',
+                                       job.report_details, delay)
+                        time.sleep(delay)
+                    else:
+                        job.state = 'Failed'
+                        queued.pop(0)
+                if not running:
+                    continue
+                now = time.time()
+                wait = min(job.next_check for job in running) - now
+                if wait > 0:
+                    time.sleep(wait)
+                    now = time.time()
+                # One call checks every running report, due or not.
+                states = self.states([job.id for job in running])
+                for job in list(running):
+                    state = states.get(job.id) if states is not None else None
+                    if state:
+                        job.state = state
+                        job.missing = 0
+                    elif states is not None:
+                        job.missing += 1
+                        if job.missing >= self.max_missing:
+                            running.remove(job)
+                            job.state = 'Failed'
+                            job.error = 'Missing from the report list'
+                            logger.error('Report %s missing from the report list.', job.id)
+                            continue
+                    if state == 'Finished':
+                        running.remove(job)
+                        fetches.append(pool.apply_async(self._fetch, (job,)))
+                    elif state in failed_states:
+                        running.remove(job)
+                        job.error = state
+                        logger.error('Report %s %s.', job.id, state)
+                    elif job.next_check <= now:
+                        job.checks += 1
+                        if self.timeout is not None and now - job.launched >= self.timeout:
+                            running.remove(job)
+                            job.state = 'Failed'
+                            job.error = 'Timed out'
+                            logger.error('Report %s timed out.', job.id)
+                            continue
+                        job.delay = min(job.delay * self.backoff, self.max_delay)
+                        job.next_check = now + job.delay
+                        logger.debug('Report %s still %s, checking again in %s seconds.', job.id, job.state,
+                                     job.delay)
+            for fetch in fetches:
+                fetch.get()
+        finally:
+            pool.terminate()
+        return jobs
+
+    def _fetch(self, job):
+        try:
+            job.result = self.fetch(self.conn, job)
+            job.state = 'Fetched'
+            logger.info('Fetched report %s.', job.id)
+        except Exception as e:
+            logger.error('Fetch of report %s failed: %s', job.id, e)
+            job.state = 'Failed'
+            job.error = e
+
+
+class ReportDownloader(object):
+    """ Download finished reports to directory concurrently, skipping the ones already on disk.
+
+    Reports are streamed to disk (see api_objects.Report.download), as '<id>.<output format>', plus '.gz'
+    if compress.
+
+    """
+
+    def __init__(self, conn, directory, max_workers=4, compress=False):
+        self.conn = conn
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.max_workers = max_workers
+        self.compress = compress
+
+    def path(self, report):
+        """ Return path report is downloaded to.
+
+        """
+        filename = '%s.%s' % (report.id, report.output_format.lower())
+        if self.compress:
+            filename += '.gz'
+        return os.path.join(self.directory, filename)
+
+    def pending(self, reports):
+        """ Return list of Finished reports not yet downloaded.
+
+        """
+        return [report for report in reports
+                if report.status == 'Finished' and not os.path.exists(self.path(report))]
+
+    def _download(self, report):
+        try:
+            return report, report.download(self.conn, self.path(report), self.compress), None
+        except Exception as e:
+            logger.error('Download of report %s failed: %s', report.id, e)
+            return report, None, e
+
+    def run(self, reports):
+        """ Download pending reports of reports (e.g. QGActions.listReports()) and return list of
+        (report, path, error) tuples, path is None if the download failed.
+
+        """
+        reports = self.pending(reports)
+        if not reports:
+            return []
+        pool = ThreadPool(min(self.max_workers, len(reports)))
+        try:
+            return pool.map(self._download, reports)
+        finally:
+            pool.terminate()
@@ -0,0 +1,74 @@
+""" Module that coalesces identical calls in flight, so that concurrent callers asking for the same thing
+share one request instead of making one each.
+"""
+import logging
+import threading
+
+__author__ = 'Parag Baxi <parag.baxi@gmail.com>'
+__copyright__ = 'Copyright 2013, Parag Baxi'
+__license__ = 'Apache License 2.0'
+
+# Setup module level logging.
+logger = logging.getLogger(__name__)
+
+
+class _Call(object):
+    """ A call in flight and its outcome.
+
+    """
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """ Thread-safe group of calls by key, at most one in flight per key.
+
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, *args, **kwargs):
+        """ Return (result, shared) of function(*args, **kwargs). If a call with the same key is in flight,
+        wait for it and return its result (or raise its exception) with shared True, instead of calling
+        function.
+
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = function(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # Calls made from now on get a fresh result.
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                logger.debug('Call %s shared with %d waiters.', key, call.waiters)
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        """ Return number of keys with a call in flight.
+
+        """
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,241 @@
+""" Module that contains a file-like wrapper around streamed QualysGuard API
+responses, and a memory bounded handle of responses spooled to disk.
+"""
+import logging
+import mmap
+import tempfile
+
+from lxml import etree, objectify
+
+__author__ = 'Parag Baxi <parag.baxi@gmail.com>'
+__copyright__ = 'Copyright 2013, Parag Baxi'
+__license__ = 'Apache License 2.0'
+
+# Setup module level logging.
+logger = logging.getLogger(__name__)
+
+# Default number of bytes read from the socket at a time.
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class QGResponseStream(object):
+    """ File-like object backed by a streamed QualysGuard API response.
+
+    The first chunk of the body is read up front (see head) so the connector can
+    check it for error responses. Use read() to feed lxml.etree.iterparse or
+    shutil.copyfileobj, or iterate over the object for chunks of bytes.
+
+    Always close() the stream (or use it in a with statement): until then it holds its connection and its
+    slot of the connector's concurrency limit. A stream garbage collected unclosed is closed then, with a
+    warning, but that may be much later.
+
+    """
+
+    def __init__(self, response, chunk_size=DEFAULT_CHUNK_SIZE, on_close=None):
+        self.response = response
+        # Called once with this stream when it is closed.
+        self.on_close = on_close
+        self.chunk_size = chunk_size
+        self.headers = response.headers
+        self.status_code = response.status_code
+        # Number of body bytes read from the response so far.
+        self.bytes_read = 0
+        # Read first chunk so that errors can be detected without reading the full body.
+        self.head = self._read_raw(chunk_size)
+        self._buffer = self.head
+        self.closed = False
+
+    def _read_raw(self, size):
+        """ Return up to size bytes of the decoded response body.
+
+        """
+        data = self.response.raw.read(size, decode_content=True) or b''
+        self.bytes_read += len(data)
+        return data
+
+    def read(self, size=-1):
+        """ Return up to size bytes of the response body, all remaining bytes if size is negative.
+
+        """
+        if self.closed:
+            return b''
+        if size is None or size < 0:
+            rest = self.response.raw.read(decode_content=True) or b''
+            self.bytes_read += len(rest)
+            data = self._buffer + rest
+            self._buffer = b''
+            return data
+        if self._buffer:
+            # Serve the already read head first.
+            data = self._buffer[:size]
+            self._buffer = self._buffer[size:]
+            return data
+        return self._read_raw(size)
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        """ Release the underlying connection back to the pool.
+
+        """
+        if not self.closed:
+            self.closed = True
+            self._buffer = b''
+            self.response.close()
+            if self.on_close:
+                self.on_close(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        # Return the connection and the rate limiter lease of a stream the caller forgot to close.
+        if getattr(self, 'closed', True):
+            return
+        try:
+            logger.warning('Response stream garbage collected without close(), closing it.')
+            self.close()
+        except Exception:
+            # Interpreter shutdown.
+            pass
+
+
+class SpooledResponse(object):
+    """ Handle of a QualysGuard API response too large for the memory budget, spooled to a temporary file.
+
+    The bytes are exposed through mmap, so substring checks ('<WARNING>' in response, find()) do not load
+    the file, and the handle is file-like (read(), seek()) for lxml parse() / iterparse(). getvalue() loads
+    the whole response as bytes, str() as text. The temporary file is deleted on close().
+
+    """
+
+    def __init__(self, f, head):
+        self.file = f
+        # First bytes of the body, for error checks.
+        self.head = head
+        self.size = f.tell()
+        # Empty files cannot be mapped, an empty body is served from bytes.
+        self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        self.position = 0
+
+    def __len__(self):
+        return self.size
+
+    def find(self, sub, start=0):
+        return self.mm.find(sub, start)
+
+    def __contains__(self, sub):
+        return self.mm.find(sub) >= 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.position
+        data = self.mm[self.position:self.position + size]
+        self.position += len(data)
+        return data
+
+    def seek(self, position, whence=0):
+        if whence == 1:
+            position += self.position
+        elif whence == 2:
+            position += self.size
+        self.position = max(0, min(position, self.size))
+
+    def tell(self):
+        return self.position
+
+    def parse(self, parser=None):
+        """ Return lxml.etree ElementTree of the response.
+
+        """
+        self.seek(0)
+        return etree.parse(self, parser)
+
+    def iterparse(self, **kwargs):
+        """ Return lxml.etree.iterparse iterator over the response, see its keyword arguments.
+
+        """
+        self.seek(0)
+        return etree.iterparse(self, **kwargs)
+
+    def getvalue(self):
+        """ Return the whole response as bytes.
+
+        """
+        return self.mm[:]
+
+    def __str__(self):
+        value = self.getvalue()
+        if bytes is str:
+            return value
+        # Python 3.
+        return value.decode('utf-8')
+
+    def close(self):
+        if self.mm is not None:
+            if self.size:
+                self.mm.close()
+            self.mm = None
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_response(response, memory_budget, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Return body of streamed requests response as bytes, or as a SpooledResponse if it is larger than
+    memory_budget bytes, judging by its Content-Length or, as it is read, by its decoded size.
+
+    """
+    try:
+        length = int(response.headers.get('Content-Length'))
+    except (TypeError, ValueError):
+        length = None
+    chunks = []
+    size = 0
+    f = None
+    for chunk in response.iter_content(chunk_size):
+        if f is not None:
+            f.write(chunk)
+            continue
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > memory_budget or (length is not None and length > memory_budget):
+            logger.debug('Response larger than memory budget of %d bytes, spooling to disk.', memory_budget)
+            f = tempfile.TemporaryFile()
+            for chunk in chunks:
+                f.write(chunk)
+            chunks = None
+    if f is None:
+        return b''.join(chunks)
+    f.flush()
+    f.seek(0)
+    head = f.read(chunk_size)
+    f.seek(0, 2)
+    return SpooledResponse(f, head)
+
+
+def parse_response(response, objectified=False):
+    """ Return root element of a response returned by QGConnector.request(), bytes or a SpooledResponse, as
+    lxml.objectify if objectified. A SpooledResponse is closed once parsed.
+
+    """
+    parser = objectify if objectified else etree
+    if not isinstance(response, SpooledResponse):
+        return parser.fromstring(response)
+    try:
+        response.seek(0)
+        return parser.parse(response).getroot()
+    finally:
+        response.close()
@@ -0,0 +1,265 @@
+""" Module that contains an incremental sync of QualysGuard host detections into a local SQLite store.
+
+Each run only asks for hosts processed since the previous successful run (the watermark) and upserts
+their detections, keyed on (host_id, qid), so nightly pulls do not re-download the whole subscription.
+"""
+import datetime
+import logging
+import sqlite3
+import threading
+
+__author__ = 'Parag Baxi <parag.baxi@gmail.com>'
+__copyright__ = 'Copyright 2013, Parag Baxi'
+__license__ = 'Apache License 2.0'
+
+# Setup module level logging.
+logger = logging.getLogger(__name__)
+
+# Child tags of HOST kept while parsing the host detection list output.
+host_detection_fields = frozenset(['ID', 'IP', 'TRACKING_METHOD', 'OS', 'DNS', 'NETBIOS', 'LAST_SCAN_DATETIME',
+                                   'LAST_VM_SCANNED_DATE', 'DETECTION_LIST'])
+
+schema = '''
+CREATE TABLE IF NOT EXISTS host (
+    id INTEGER PRIMARY KEY,
+    ip TEXT,
+    tracking_method TEXT,
+    os TEXT,
+    dns TEXT,
+    netbios TEXT,
+    last_scan TEXT,
+    last_vm_scanned TEXT
+);
+CREATE INDEX IF NOT EXISTS host_ip ON host (ip);
+CREATE TABLE IF NOT EXISTS detection (
+    host_id INTEGER NOT NULL,
+    qid INTEGER NOT NULL,
+    type TEXT,
+    severity INTEGER,
+    port INTEGER,
+    protocol TEXT,
+    ssl INTEGER,
+    status TEXT,
+    first_found TEXT,
+    last_found TEXT,
+    last_updated TEXT,
+    times_found INTEGER,
+    results TEXT,
+    PRIMARY KEY (host_id, qid)
+);
+CREATE INDEX IF NOT EXISTS detection_qid ON detection (qid);
+CREATE INDEX IF NOT EXISTS detection_severity_status ON detection (severity, status);
+CREATE TABLE IF NOT EXISTS watermark (
+    subscription TEXT PRIMARY KEY,
+    synced_until TEXT NOT NULL,
+    hosts INTEGER,
+    detections INTEGER
+);
+'''
+
+
+def _int(value):
+    return int(value) if value not in (None, '') else None
+
+
+def qualys_timestamp(value):
+    """ Return datetime value in the format of QualysGuard API date parameters ('2013-07-03T10:31:57Z').
+
+    """
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class DetectionStore(object):
+    """ SQLite store of hosts, their detections and the sync watermark of each subscription.
+
+    path: SQLite database file, ':memory:' for a throwaway store.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self.db.executescript(schema)
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def watermark(self, subscription):
+        """ Return timestamp up to which subscription is synced, None if it never was.
+
+        """
+        with self._lock:
+            row = self.db.execute('SELECT synced_until FROM watermark WHERE subscription = ?',
+                                  (subscription,)).fetchone()
+        return row[0] if row else None
+
+    def upsert(self, hosts):
+        """ Insert or replace hosts and their detections, from (host, detections) tuples of row dicts.
+
+        Detections are only ever replaced by (host_id, qid), so ones left out of the rows are kept.
+
+        """
+        host_count = detection_count = 0
+        with self._lock:
+            for host, detections in hosts:
+                self.db.execute('INSERT OR REPLACE INTO host VALUES (:id, :ip, :tracking_method, :os, :dns, '
+                                ':netbios, :last_scan, :last_vm_scanned)', host)
+                self.db.executemany('INSERT OR REPLACE INTO detection VALUES (:host_id, :qid, :type, :severity, '
+                                    ':port, :protocol, :ssl, :status, :first_found, :last_found, :last_updated, '
+                                    ':times_found, :results)', detections)
+                host_count += 1
+                detection_count += len(detections)
+            self.db.commit()
+        return host_count, detection_count
+
+    def set_watermark(self, subscription, synced_until, hosts=None, detections=None):
+        with self._lock:
+            self.db.execute('INSERT OR REPLACE INTO watermark VALUES (?, ?, ?, ?)',
+                            (subscription, synced_until, hosts, detections))
+            self.db.commit()
+
+    def detections(self, host_id=None, ip=None, qid=None, severity=None, min_severity=None, status=None):
+        """ Return list of detection rows (sqlite3.Row, with the ip of the host) matching all given filters.
+
+        status may be a single status or a list of statuses, e.g. ['New', 'Active', 'Re-Opened'].
+
+        """
+        where = []
+        parameters = []
+        for column, value in (('detection.host_id', host_id), ('host.ip', ip), ('detection.qid', qid),
+                              ('detection.severity', severity)):
+            if value is not None:
+                where.append('%s = ?' % column)
+                parameters.append(value)
+        if min_severity is not None:
+            where.append('detection.severity >= ?')
+            parameters.append(min_severity)
+        if status is not None:
+            if not isinstance(status, (list, tuple, set)):
+                status = [status]
+            where.append('detection.status IN (%s)' % ', '.join('?' * len(status)))
+            parameters.extend(status)
+        query = 'SELECT detection.*, host.ip FROM detection LEFT JOIN host ON host.id = detection.host_id'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        with self._lock:
+            return self.db.execute(query, parameters).fetchall()
+
+    def host(self, host_id):
+        """ Return host row of host_id, None if not stored.
+
+        """
+        with self._lock:
+            return self.db.execute('SELECT * FROM host WHERE id = ?', (host_id,)).fetchone()
+
+    def count_by_severity(self, status=('New', 'Active', 'Re-Opened')):
+        """ Return dict of detection counts by severity, only counting detections with one of status.
+
+        """
+        with self._lock:
+            rows = self.db.execute('SELECT severity, COUNT(*) FROM detection WHERE status IN (%s) GROUP BY severity'
+                                   % ', '.join('?' * len(status)), list(status)).fetchall()
+        return dict((row[0], row[1]) for row in rows)
+
+
+class DetectionSync(object):
+    """ Incremental sync of the host detection list API into a DetectionStore.
+
+    The first run pulls every host; later runs pass the watermark of the last successful run as
+    watermark_parameter ('vm_processed_after' for hosts with new scan results, or 'detection_updated_since'
+    for changed detections only). Fixed detections are requested too so that they are updated in the store.
+
+    conn: QGConnector.
+    store: DetectionStore, or path of its SQLite database.
+    subscription: Name of the watermark, defaults to 'username@server' of conn.
+    batch_size: Number of hosts written to the store per transaction.
+
+    """
+    api_call = '/api/2.0/fo/asset/host/vm/detection/'
+
+    def __init__(self, conn, store, subscription=None, watermark_parameter='vm_processed_after',
+                 batch_size=1000):
+        self.conn = conn
+        self.store = store if isinstance(store, DetectionStore) else DetectionStore(store)
+        if subscription is None:
+            subscription = '%s@%s' % (conn.auth[0], conn.server)
+        self.subscription = subscription
+        self.watermark_parameter = watermark_parameter
+        self.batch_size = batch_size
+
+    def parameters(self, watermark=None, **parameters):
+        """ Return data of the host detection list call for a run since watermark.
+
+        """
+        data = {'action': 'list', 'status': 'New,Active,Re-Opened,Fixed', 'show_igs': 1}
+        if watermark:
+            data[self.watermark_parameter] = watermark
+        data.update(parameters)
+        return data
+
+    def rows(self, host):
+        """ Return (host, detections) row dicts of a HOST element.
+
+        """
+        host_id = int(host.findtext('ID'))
+        detections = []
+        for detection in host.iterfind('DETECTION_LIST/DETECTION'):
+            detections.append({
+                'host_id': host_id,
+                'qid': int(detection.findtext('QID')),
+                'type': detection.findtext('TYPE'),
+                'severity': _int(detection.findtext('SEVERITY')),
+                'port': _int(detection.findtext('PORT')),
+                'protocol': detection.findtext('PROTOCOL'),
+                'ssl': _int(detection.findtext('SSL')),
+                'status': detection.findtext('STATUS'),
+                'first_found': detection.findtext('FIRST_FOUND_DATETIME'),
+                'last_found': detection.findtext('LAST_FOUND_DATETIME'),
+                'last_updated': detection.findtext('LAST_UPDATE_DATETIME'),
+                'times_found': _int(detection.findtext('TIMES_FOUND')),
+                'results': detection.findtext('RESULTS'),
+            })
+        return {
+            'id': host_id,
+            'ip': host.findtext('IP'),
+            'tracking_method': host.findtext('TRACKING_METHOD'),
+            'os': host.findtext('OS'),
+            'dns': host.findtext('DNS'),
+            'netbios': host.findtext('NETBIOS'),
+            'last_scan': host.findtext('LAST_SCAN_DATETIME'),
+            'last_vm_scanned': host.findtext('LAST_VM_SCANNED_DATE'),
+        }, detections
+
+    def run(self, full=False, **parameters):
+        """ Sync hosts changed since the last successful run (every host if full) and return
+        (hosts, detections) counts. Extra keyword arguments are host detection list API parameters.
+
+        The watermark only moves forward once every page was stored, so a failed run (an exception from
+        qualysapi.exceptions) is simply repeated.
+
+        """
+        # Taken before the first request so that changes made during the run are picked up next time.
+        started = qualys_timestamp(datetime.datetime.utcnow())
+        watermark = None if full else self.store.watermark(self.subscription)
+        logger.info('Syncing detections of %s since %s.', self.subscription, watermark or 'the beginning')
+        data = self.parameters(watermark, **parameters)
+        host_count = detection_count = 0
+        for api_call, data, records in self.conn.iter_pages(self.api_call, data, 'HOST', host_detection_fields):
+            batch = []
+            for host in records:
+                batch.append(self.rows(host))
+                if len(batch) >= self.batch_size:
+                    hosts, detections = self.store.upsert(batch)
+                    host_count += hosts
+                    detection_count += detections
+                    batch = []
+            hosts, detections = self.store.upsert(batch)
+            host_count += hosts
+            detection_count += detections
+        self.store.set_watermark(self.subscription, started, host_count, detection_count)
+        logger.info('Synced %d hosts, %d detections of %s.', host_count, detection_count, self.subscription)
+        return host_count, detection_count
@@ -0,0 +1,319 @@
+""" Module that contains columnar, NumPy backed tables of QualysGuard hosts and host detections.
+
+Each column is one array, so filters, group-bys and joins over millions of rows run as array
+operations instead of loops over api_objects records. Requires NumPy (http://www.numpy.org).
+"""
+import datetime
+import logging
+import socket
+import struct
+
+__author__ = 'Parag Baxi <parag.baxi@gmail.com>'
+__copyright__ = 'Copyright 2013, Parag Baxi'
+__license__ = 'Apache License 2.0'
+
+# Setup module level logging.
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy
+except ImportError as e:
+    # Only needed by the tables, so do not warn every importer of qualysapi.
+    numpy = None
+
+# Child tags needed to fill each table, for parsers.RecordParser.
+host_fields = frozenset(['DNS', 'ID', 'IP', 'LAST_VULN_SCAN_DATETIME', 'NETBIOS', 'OS', 'TRACKING_METHOD'])
+detection_fields = frozenset(['ID', 'IP', 'DETECTION_LIST'])
+
+
+def ip_to_int(ip):
+    """ Return IPv4 address ip ('10.0.0.1') as an int, 0 if it is not an IPv4 address.
+
+    """
+    try:
+        return struct.unpack('!I', socket.inet_aton(ip))[0]
+    except (socket.error, TypeError):
+        return 0
+
+
+def int_to_ip(value):
+    """ Return IPv4 address string of int value.
+
+    """
+    return socket.inet_ntoa(struct.pack('!I', int(value)))
+
+
+def ip_range(value):
+    """ Return (first, last) ints of IPv4 address or range value ('10.0.0.1' or '10.0.0.1-10.0.0.9').
+
+    """
+    first, _, last = str(value).partition('-')
+    first = ip_to_int(first.strip())
+    return first, ip_to_int(last.strip()) if last else first
+
+
+def _timestamp(value):
+    """ Return QualysGuard ISO-8601 timestamp value as a string numpy.datetime64 accepts, None (NaT) if there
+    is none.
+
+    """
+    if not value or len(value) < 10 or value[4] != '-':
+        # Empty, 'never', etc.
+        return None
+    return value[:19]
+
+
+class Categories(object):
+    """ Dictionary encoder of a categorical string column: each distinct value is stored once and
+    rows hold its int code.
+
+    """
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.codes = dict((value, code) for code, value in enumerate(self.values))
+
+    def encode(self, value):
+        """ Return code of value, adding value if it is new.
+
+        """
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def code(self, value):
+        """ Return code of value, -1 if no row has it.
+
+        """
+        return self.codes.get(value, -1)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class Table(object):
+    """ Base class of columnar tables.
+
+    Subclasses list their columns as (name, dtype) pairs; columns with a dtype of None are dictionary
+    encoded strings, stored as int32 codes with a Categories of their values in categories[name].
+
+    """
+    columns = ()
+
+    def __init__(self, arrays, categories=None):
+        if numpy is None:
+            raise ImportError('%s requires numpy.' % self.__class__.__name__)
+        self.arrays = arrays
+        self.categories = categories or dict((name, Categories()) for name, dtype in self.columns
+                                             if dtype is None)
+
+    @classmethod
+    def from_rows(cls, rows, categories=None):
+        """ Return table of an iterable of row tuples, in the order of columns. Categorical values
+        are given as strings.
+
+        """
+        if numpy is None:
+            raise ImportError('%s requires numpy.' % cls.__name__)
+        if categories is None:
+            categories = dict((name, Categories()) for name, dtype in cls.columns if dtype is None)
+        encoders = [categories[name].encode if dtype is None else None for name, dtype in cls.columns]
+        data = [[] for column in cls.columns]
+        for row in rows:
+            for i, value in enumerate(row):
+                data[i].append(value if encoders[i] is None else encoders[i](value))
+        arrays = {}
+        for (name, dtype), values in zip(cls.columns, data):
+            arrays[name] = numpy.array(values, dtype='int32' if dtype is None else dtype)
+        return cls(arrays, categories)
+
+    def __len__(self):
+        return len(self.arrays[self.columns[0][0]]) if self.columns else 0
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __getattr__(self, name):
+        # Columns read like attributes, e.g. hosts.last_scan.
+        try:
+            return self.__dict__['arrays'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def take(self, selector):
+        """ Return table of the rows selected by a boolean mask or an array of row indexes.
+
+        Categories are shared with this table, so codes stay comparable.
+
+        """
+        return self.__class__(dict((name, array[selector]) for name, array in self.arrays.items()),
+                              self.categories)
+
+    def concatenate(self, other):
+        """ Return table of the rows of this table followed by the rows of other.
+
+        """
+        arrays = dict(self.arrays)
+        for name, dtype in self.columns:
+            values = other.arrays[name]
+            if dtype is None and other.categories[name] is not self.categories[name]:
+                # Re-encode other's codes into this table's categories.
+                encode = self.categories[name].encode
+                mapping = numpy.array([encode(value) for value in other.categories[name].values], dtype='int32')
+                values = mapping[values] if len(mapping) else values
+            arrays[name] = numpy.concatenate((arrays[name], values))
+        return self.__class__(arrays, self.categories)
+
+    def equals(self, name, value):
+        """ Return boolean mask of rows whose categorical column name is value.
+
+        """
+        return self.arrays[name] == self.categories[name].code(value)
+
+    def decode(self, name):
+        """ Return categorical column name as an array of strings.
+
+        """
+        values = numpy.array(self.categories[name].values, dtype=object)
+        return values[self.arrays[name]]
+
+    def count_by(self, name, mask=None):
+        """ Return dict of row counts by value of column name, only counting rows in boolean mask if given.
+
+        """
+        codes = self.arrays[name]
+        if mask is not None:
+            codes = codes[mask]
+        if name in self.categories:
+            counts = numpy.bincount(codes, minlength=len(self.categories[name]))
+            values = self.categories[name].values
+            return dict((values[code], int(count)) for code, count in enumerate(counts) if count)
+        values, counts = numpy.unique(codes, return_counts=True)
+        return dict((value.item(), int(count)) for value, count in zip(values, counts))
+
+    def join(self, name, other, other_name=None):
+        """ Return (rows, other_rows) index arrays of the rows of this table matching a row of other on
+        column name (other_name in other), e.g. detections.join('host_id', hosts, 'id').
+
+        Values of other_name must be unique in other; rows without a match are left out.
+
+        """
+        keys = other.arrays[other_name or name]
+        order = numpy.argsort(keys, kind='mergesort')
+        sorted_keys = keys[order]
+        values = self.arrays[name]
+        positions = numpy.searchsorted(sorted_keys, values)
+        positions[positions == len(sorted_keys)] = 0
+        matched = sorted_keys[positions] == values if len(sorted_keys) else numpy.zeros(len(values), dtype=bool)
+        return numpy.nonzero(matched)[0], order[positions[matched]]
+
+    def in_ranges(self, ranges, name='ip'):
+        """ Return boolean mask of rows whose column name falls in any of the (first, last) ranges.
+
+        """
+        values = self.arrays[name]
+        mask = numpy.zeros(len(values), dtype=bool)
+        for first, last in ranges:
+            mask |= (values >= first) & (values <= last)
+        return mask
+
+    def in_asset_groups(self, asset_groups, name='ip'):
+        """ Return dict of boolean masks by title of the rows whose IP is in each api_objects.AssetGroup.
+
+        """
+        return dict((group.title, self.in_ranges([ip_range(ip) for ip in group.scanips], name))
+                    for group in asset_groups)
+
+    def count_by_asset_group(self, asset_groups, mask=None, name='ip'):
+        """ Return dict of row counts by asset group title, only counting rows in boolean mask if given.
+
+        Rows in several asset groups are counted in each.
+
+        """
+        counts = {}
+        for title, in_group in self.in_asset_groups(asset_groups, name).items():
+            if mask is not None:
+                in_group &= mask
+            counts[title] = int(numpy.count_nonzero(in_group))
+        return counts
+
+
+class HostTable(Table):
+    """ Table of hosts, e.g. from the host list API (/api/2.0/fo/asset/host/).
+
+    """
+    columns = (
+        ('id', 'int64'),
+        ('ip', 'uint32'),
+        ('dns', object),
+        ('netbios', object),
+        ('os', None),
+        ('tracking_method', None),
+        # NaT for hosts never scanned.
+        ('last_scan', 'datetime64[s]'),
+    )
+
+    @classmethod
+    def from_elements(cls, hosts, categories=None):
+        """ Return HostTable of an iterable of HOST elements, e.g. QGConnector.iter_records() output.
+
+        """
+        return cls.from_rows(((int(host.findtext('ID')), ip_to_int(host.findtext('IP')),
+                               host.findtext('DNS', ''), host.findtext('NETBIOS', ''),
+                               host.findtext('OS', ''), host.findtext('TRACKING_METHOD', ''),
+                               _timestamp(host.findtext('LAST_VULN_SCAN_DATETIME')))
+                              for host in hosts), categories)
+
+    @classmethod
+    def from_hosts(cls, hosts, categories=None):
+        """ Return HostTable of an iterable of api_objects.Host.
+
+        """
+        return cls.from_rows(((host.id, ip_to_int(host.ip), host.dns, host.netbios, host.os,
+                               host.tracking_method, host.last_scan)
+                              for host in hosts), categories)
+
+    def not_scanned_since(self, days, now=None):
+        """ Return boolean mask of hosts not scanned for at least days (never scanned hosts included).
+
+        """
+        now = numpy.datetime64(now or datetime.datetime.utcnow(), 's')
+        last_scan = self.arrays['last_scan']
+        return numpy.isnat(last_scan) | (last_scan <= now - numpy.timedelta64(int(days * 86400), 's'))
+
+
+class DetectionTable(Table):
+    """ Table of host detections, one row per host and QID, e.g. from the host detection list API
+    (/api/2.0/fo/asset/host/vm/detection/).
+
+    """
+    columns = (
+        ('host_id', 'int64'),
+        ('ip', 'uint32'),
+        ('qid', 'int32'),
+        ('severity', 'int8'),
+        # Confirmed, Potential or Info.
+        ('type', None),
+        # New, Active, Fixed or Re-Opened.
+        ('status', None),
+        ('first_found', 'datetime64[s]'),
+        ('last_found', 'datetime64[s]'),
+    )
+
+    @classmethod
+    def from_elements(cls, hosts, categories=None):
+        """ Return DetectionTable of an iterable of HOST elements holding a DETECTION_LIST.
+
+        """
+        def rows():
+            for host in hosts:
+                host_id = int(host.findtext('ID'))
+                ip = ip_to_int(host.findtext('IP'))
+                for detection in host.iterfind('DETECTION_LIST/DETECTION'):
+                    yield (host_id, ip, int(detection.findtext('QID')), int(detection.findtext('SEVERITY', 0)),
+                           detection.findtext('TYPE', ''), detection.findtext('STATUS', ''),
+                           _timestamp(detection.findtext('FIRST_FOUND_DATETIME')),
+                           _timestamp(detection.findtext('LAST_FOUND_DATETIME')))
+        return cls.from_rows(rows(), categories)
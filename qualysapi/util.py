@@ -13,9 +13,13 @@ __license__ = 'Apache License 2.0'
 logger = logging.getLogger(__name__)
 
 
-def connect(config_file=qcs.default_filename, remember_me=False, remember_me_always=False):
+def connect(config_file=qcs.default_filename, remember_me=False, remember_me_always=False, pool_connections=None,
+            pool_maxsize=None, pool_block=None, keep_alive=None, session_auth=False, rate_limiter=None):
     """ Return a QGAPIConnect object for v1 API pulling settings from config
     file.
+
+    Connection pool settings not None override those of the config file. See QGConnector for session_auth and
+    rate_limiter.
     """
     # Retrieve login credentials.
     conf = qcconf.QualysConnectConfig(filename=config_file, remember_me=remember_me,
@@ -23,6 +27,12 @@ def connect(config_file=qcs.default_filename, remember_me=False, remember_me_alw
     connect = qcconn.QGConnector(conf.get_auth(),
                                  conf.get_hostname(),
                                  conf.proxies,
-                                 conf.max_retries)
+                                 conf.max_retries,
+                                 pool_connections=conf.pool_connections if pool_connections is None else pool_connections,
+                                 pool_maxsize=conf.pool_maxsize if pool_maxsize is None else pool_maxsize,
+                                 pool_block=conf.pool_block if pool_block is None else pool_block,
+                                 keep_alive=conf.keep_alive if keep_alive is None else keep_alive,
+                                 session_auth=session_auth,
+                                 rate_limiter=rate_limiter)
     logger.info("Finished building connector.")
     return connect
\ No newline at end of file
@@ -44,4 +44,8 @@ setup(name=__pkgname__,
       install_requires=[
           'requests',
       ],
+      extras_require={
+          'async': ['aiohttp'],
+          'tables': ['numpy'],
+      },
      )
@@ -0,0 +1,45 @@
+""" Fake requests session for the tests, answering calls from a handler instead of the network.
+"""
+import io
+
+import requests
+from requests.packages.urllib3.response import HTTPResponse
+
+__author__ = 'Parag Baxi <parag.baxi@gmail.com>'
+__copyright__ = 'Copyright 2013, Parag Baxi'
+__license__ = 'Apache License 2.0'
+
+
+class FakeSession(object):
+    """ Session whose get() and post() return handler(method, url, data) -> (status, body, headers).
+
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls = []
+        self.cookies = requests.cookies.RequestsCookieJar()
+
+    def _response(self, method, url, data, stream):
+        self.calls.append((method, url, data))
+        status, body, headers = self.handler(method, url, data)
+        response = requests.Response()
+        response.raw = HTTPResponse(body=io.BytesIO(body), headers=headers, status=status, preload_content=False)
+        response.status_code = status
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        response.url = url
+        if not stream:
+            response.content
+        return response
+
+    def get(self, url, params=None, stream=False, **kwargs):
+        return self._response('get', url, params, stream)
+
+    def post(self, url, data=None, stream=False, **kwargs):
+        return self._response('post', url, data, stream)
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def close(self):
+        pass
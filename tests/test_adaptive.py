@@ -0,0 +1,117 @@
+import unittest
+
+import qualysapi.adaptive
+import qualysapi.connector
+import qualysapi.exceptions
+
+from fakes import FakeSession
+
+
+class AIMDLimiterTest(unittest.TestCase):
+
+    def test_increase_only_when_limit_in_use(self):
+        limiter = qualysapi.adaptive.AIMDLimiter(initial=2)
+        limiter.acquire()
+        limiter.release('api/2.0/fo/scan/', 1.0)
+        self.assertEqual(limiter.limit, 2)
+        for i in range(4):
+            limiter.acquire()
+            limiter.acquire()
+            limiter.release('api/2.0/fo/scan/', 1.0)
+            limiter.release('api/2.0/fo/scan/', 1.0)
+        self.assertEqual(int(limiter.limit), 3)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_decrease_once_per_episode(self):
+        limiter = qualysapi.adaptive.AIMDLimiter(initial=8)
+        for i in range(3):
+            limiter.acquire()
+        for i in range(3):
+            limiter.release('api/2.0/fo/scan/', 1.0, overload=True)
+        self.assertEqual(limiter.limit, 4)
+        limiter._last_decrease -= 1
+        limiter.acquire()
+        limiter.release('api/2.0/fo/scan/', 1.0, overload=True)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_latency_tracked_per_action(self):
+        limiter = qualysapi.adaptive.AIMDLimiter(initial=8)
+        for latency in (1.0, 1.0):
+            limiter.acquire()
+            limiter.release('api/2.0/fo/report/', latency, action='list')
+        # A fetch is slower than a list of the same api_call, without overload.
+        limiter.acquire()
+        limiter.release('api/2.0/fo/report/', 30.0, action='fetch')
+        self.assertEqual(limiter.limit, 8)
+        limiter.acquire()
+        limiter.release('api/2.0/fo/report/', 3.0, action='list')
+        self.assertEqual(limiter.limit, 4)
+
+    def test_cancel_gives_back_slot(self):
+        limiter = qualysapi.adaptive.AIMDLimiter(initial=1)
+        limiter.acquire()
+        limiter.cancel()
+        self.assertEqual((limiter.in_flight, limiter.limit), (0, 1))
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_open_half_open_close(self):
+        breaker = qualysapi.adaptive.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.before()
+        breaker.failure()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.failure()
+        self.assertEqual(breaker.state, 'open')
+        self.assertRaises(qualysapi.exceptions.CircuitOpen, breaker.before)
+        # After reset_timeout, one trial call is let through.
+        breaker.opened -= 30
+        breaker.before()
+        self.assertEqual(breaker.state, 'half open')
+        self.assertRaises(qualysapi.exceptions.CircuitOpen, breaker.before)
+        # Its failure opens the circuit again, at once.
+        breaker.failure()
+        self.assertEqual(breaker.state, 'open')
+        self.assertRaises(qualysapi.exceptions.CircuitOpen, breaker.before)
+        breaker.opened -= 30
+        breaker.before()
+        breaker.success()
+        self.assertEqual((breaker.state, breaker.failures), ('closed', 0))
+        breaker.before()
+
+
+class BrokenRateLimiter(object):
+
+    def acquire(self, api_call):
+        raise IOError('Coordinator unreachable.')
+
+
+class ControllerTest(unittest.TestCase):
+
+    def test_rate_limiter_failure_releases_slot(self):
+        controller = qualysapi.adaptive.Controller()
+        conn = qualysapi.connector.QGConnector(('user', 'password'), rate_limiter=BrokenRateLimiter(),
+                                               controller=controller)
+        conn.session = FakeSession(lambda method, url, data: (200, b'<SIMPLE_RETURN/>', {}))
+        self.assertRaises(IOError, conn.request, '/api/2.0/fo/scan/', {'action': 'list'})
+        self.assertEqual(controller.limiter.in_flight, 0)
+        self.assertEqual(conn.session.calls, [])
+
+    def test_retries_counted_apart_from_concurrent_scan_retries(self):
+        responses = [(503, b'<SIMPLE_RETURN/>', {}),
+                     (409, b'<ServiceResponse><responseCode>INVALID_REQUEST</responseCode><responseErrorDetails>'
+                           b'<errorMessage>You have reached the maximum number of concurrent running scans.'
+                           b'</errorMessage></responseErrorDetails></ServiceResponse>', {}),
+                     (200, b'<SCAN_LIST_OUTPUT/>', {})]
+        controller = qualysapi.adaptive.Controller(retries=1, base_delay=0)
+        conn = qualysapi.connector.QGConnector(('user', 'password'), rate_limiter=False, controller=controller)
+        conn.session = FakeSession(lambda method, url, data: responses.pop(0))
+        # The controller retry of the 503 does not use up the one concurrent scan retry.
+        self.assertEqual(conn.request('/api/2.0/fo/scan/', {'action': 'list'}, concurrent_scans_retries=1),
+                         b'<SCAN_LIST_OUTPUT/>')
+        stats = conn.stats()['api/2.0/fo/scan/']
+        self.assertEqual((stats['controller_retries'], stats['concurrent_scan_retries']), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+try:
+    import asyncio
+    import qualysapi.aio as aio
+except (ImportError, SyntaxError):
+    # Python 2.
+    aio = None
+
+
+@unittest.skipIf(aio is None or aio.aiohttp is None, 'requires Python 3 and aiohttp')
+class AsyncRateLimiterTest(unittest.TestCase):
+
+    def test_cancelled_request_holds_no_lease(self):
+        loop = asyncio.new_event_loop()
+        try:
+            conn = aio.AsyncQGConnector(('user', 'password'))
+            limiter = conn.rate_limiter
+            limiter.update('api/2.0/fo/asset/host/', {'X-Concurrency-Limit-Limit': '1'})
+            # Another call holds the only slot, the request waits for it.
+            limiter.acquire('api/2.0/fo/asset/host/')
+            task = loop.create_task(conn.request('/api/2.0/fo/asset/host/', {'action': 'list'}))
+            loop.run_until_complete(asyncio.sleep(0.3))
+            self.assertFalse(task.done())
+            task.cancel()
+            loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+            limiter.release('api/2.0/fo/asset/host/')
+            self.assertEqual(limiter.running, 0)
+        finally:
+            loop.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
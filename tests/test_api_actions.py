@@ -0,0 +1,79 @@
+import unittest
+
+import qualysapi.connector
+import qualysapi.stream
+
+from fakes import FakeSession
+
+host_list = b'''<?xml version="1.0" encoding="UTF-8" ?>
+<HOST_LIST_OUTPUT>
+  <RESPONSE>
+    <HOST_LIST>
+      <HOST>
+        <ID>1</ID>
+        <IP>10.0.0.1</IP>
+        <TRACKING_METHOD>IP</TRACKING_METHOD>
+        <LAST_VULN_SCAN_DATETIME>2013-07-03T10:31:57Z</LAST_VULN_SCAN_DATETIME>
+      </HOST>
+      <HOST>
+        <ID>2</ID>
+        <IP>10.0.0.2</IP>
+        <TRACKING_METHOD>IP</TRACKING_METHOD>
+      </HOST>
+      <HOST>
+        <ID>3</ID>
+        <IP>10.0.0.3</IP>
+        <TRACKING_METHOD>IP</TRACKING_METHOD>
+        <LAST_VULN_SCAN_DATETIME>2999-01-01T00:00:00Z</LAST_VULN_SCAN_DATETIME>
+      </HOST>
+    </HOST_LIST>
+  </RESPONSE>
+</HOST_LIST_OUTPUT>'''
+
+
+class NotScannedSinceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = qualysapi.connector.QGConnector(('user', 'password'), rate_limiter=False)
+        self.conn.session = FakeSession(lambda method, url, data: (200, host_list, {}))
+
+    def test_hosts_without_scan_date_match(self):
+        self.assertEqual([host.id for host in self.conn.notScannedSince(30)], [1, 2])
+
+    def test_streaming_hosts_without_scan_date_match(self):
+        self.assertEqual([host.id for host in self.conn.iterNotScannedSince(30)], [1, 2])
+
+
+
+class ReportActionsTest(unittest.TestCase):
+
+    def test_list_reports_and_templates(self):
+        report_list = (b'<REPORT_LIST_OUTPUT><RESPONSE><REPORT_LIST><REPORT><ID>12</ID><TYPE>Scan</TYPE>'
+                       b'<USER_LOGIN>user</USER_LOGIN><LAUNCH_DATETIME>2013-07-03T10:31:57Z</LAUNCH_DATETIME>'
+                       b'<OUTPUT_FORMAT>PDF</OUTPUT_FORMAT><SIZE>1.2 MB</SIZE><STATUS><STATE>Finished</STATE>'
+                       b'</STATUS></REPORT></REPORT_LIST></RESPONSE></REPORT_LIST_OUTPUT>')
+        template_list = (b'<REPORT_TEMPLATE_LIST><REPORT_TEMPLATE><ID>7</ID><TYPE>Auto</TYPE>'
+                         b'<TEMPLATE_TYPE>Scan</TEMPLATE_TYPE><TITLE>Technical Report</TITLE><USER><LOGIN>user</LOGIN>'
+                         b'</USER><LAST_UPDATE>2013-01-02T03:04:05Z</LAST_UPDATE><GLOBAL>1</GLOBAL>'
+                         b'</REPORT_TEMPLATE></REPORT_TEMPLATE_LIST>')
+        conn = qualysapi.connector.QGConnector(('user', 'password'), rate_limiter=False)
+        conn.session = FakeSession(lambda method, url, data: (200, template_list if 'template' in url else
+                                                              report_list, {}))
+        self.assertEqual([(report.id, report.status) for report in conn.listReports()], [(12, 'Finished')])
+        self.assertEqual(conn.listReports(12).id, 12)
+        self.assertEqual([template.title for template in conn.listReportTemplates()], ['Technical Report'])
+
+
+class SpooledResponseActionsTest(unittest.TestCase):
+
+    def test_actions_parse_spooled_responses(self):
+        conn = qualysapi.connector.QGConnector(('user', 'password'), rate_limiter=False, memory_budget=100)
+        conn.session = FakeSession(lambda method, url, data: (200, host_list, {}))
+        with conn.request('/api/2.0/fo/asset/host/', {'action': 'list'}) as response:
+            self.assertIsInstance(response, qualysapi.stream.SpooledResponse)
+        self.assertEqual([host.id for host in conn.getHostRange('10.0.0.1', '10.0.0.3')], [1, 2, 3])
+        self.assertEqual([host.id for host in conn.notScannedSince(30)], [1, 2])
+        self.assertEqual(conn.getHost('10.0.0.2').id, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import datetime
+import unittest
+
+from lxml import etree, objectify
+
+from qualysapi.api_objects import AssetGroup, Host, Report, ReportTemplate
+
+host_list = b'''<HOST_LIST>
+  <HOST>
+    <ID>1</ID>
+    <IP>10.0.0.1</IP>
+    <TRACKING_METHOD>IP</TRACKING_METHOD>
+    <LAST_VULN_SCAN_DATETIME>2013-07-03T10:31:57Z</LAST_VULN_SCAN_DATETIME>
+  </HOST>
+  <HOST>
+    <ID>2</ID>
+    <IP>10.0.0.2</IP>
+    <TRACKING_METHOD>IP</TRACKING_METHOD>
+  </HOST>
+</HOST_LIST>'''
+
+report_list = b'''<REPORT_LIST>
+  <REPORT>
+    <ID>12</ID>
+    <TITLE>Scan report</TITLE>
+    <TYPE>Scan</TYPE>
+    <USER_LOGIN>user</USER_LOGIN>
+    <LAUNCH_DATETIME>2013-07-03T10:31:57Z</LAUNCH_DATETIME>
+    <OUTPUT_FORMAT>PDF</OUTPUT_FORMAT>
+    <SIZE>1.2 MB</SIZE>
+    <STATUS><STATE>Finished</STATE></STATUS>
+    <EXPIRATION_DATETIME>2013-07-10T10:31:57Z</EXPIRATION_DATETIME>
+  </REPORT>
+  <REPORT>
+    <ID>13</ID>
+    <TYPE>Scan</TYPE>
+    <USER_LOGIN>user</USER_LOGIN>
+    <LAUNCH_DATETIME>2013-07-04T00:00:00Z</LAUNCH_DATETIME>
+    <OUTPUT_FORMAT>XML</OUTPUT_FORMAT>
+    <SIZE>0</SIZE>
+    <STATUS><STATE>Running</STATE></STATUS>
+  </REPORT>
+</REPORT_LIST>'''
+
+report_template_list = b'''<REPORT_TEMPLATE_LIST>
+  <REPORT_TEMPLATE>
+    <ID>7</ID>
+    <TYPE>Auto</TYPE>
+    <TEMPLATE_TYPE>Scan</TEMPLATE_TYPE>
+    <TITLE>Technical Report</TITLE>
+    <USER><LOGIN>user</LOGIN></USER>
+    <LAST_UPDATE>2013-01-02T03:04:05Z</LAST_UPDATE>
+    <GLOBAL>1</GLOBAL>
+  </REPORT_TEMPLATE>
+</REPORT_TEMPLATE_LIST>'''
+
+asset_group_list = b'''<ASSET_GROUP_LIST>
+  <ASSET_GROUP>
+    <ID>3</ID>
+    <TITLE>Servers</TITLE>
+    <LAST_UPDATE>2013-01-02T03:04:05Z</LAST_UPDATE>
+    <BUSINESS_IMPACT>High</BUSINESS_IMPACT>
+    <SCANIPS><IP>10.0.0.1</IP><IP>10.0.0.2</IP></SCANIPS>
+    <SCANDNS><DNS>www.example.com</DNS></SCANDNS>
+    <SCANNER_APPLIANCES>
+      <SCANNER_APPLIANCE><SCANNER_APPLIANCE_NAME>scanner1</SCANNER_APPLIANCE_NAME></SCANNER_APPLIANCE>
+    </SCANNER_APPLIANCES>
+  </ASSET_GROUP>
+  <ASSET_GROUP>
+    <ID>4</ID>
+    <TITLE>Empty</TITLE>
+  </ASSET_GROUP>
+</ASSET_GROUP_LIST>'''
+
+
+class HostTest(unittest.TestCase):
+
+    def test_from_element_without_scan_date(self):
+        for parse in (etree.fromstring, objectify.fromstring):
+            scanned, unscanned = Host.from_elements(parse(host_list).iter('HOST'))
+            self.assertEqual(scanned.last_scan, datetime.datetime(2013, 7, 3, 10, 31, 57))
+            self.assertEqual((unscanned.id, unscanned.ip), (2, '10.0.0.2'))
+            self.assertIsNone(unscanned.last_scan)
+
+
+
+class ReportTest(unittest.TestCase):
+
+    def test_from_element(self):
+        for parse in (etree.fromstring, objectify.fromstring):
+            finished, running = Report.from_elements(parse(report_list).iter('REPORT'))
+            self.assertEqual((finished.id, finished.status, finished.output_format), (12, 'Finished', 'PDF'))
+            self.assertEqual(finished.launch_datetime, datetime.datetime(2013, 7, 3, 10, 31, 57))
+            self.assertEqual(finished.expiration_datetime, datetime.datetime(2013, 7, 10, 10, 31, 57))
+            self.assertEqual(running.status, 'Running')
+            self.assertIsNone(running.expiration_datetime)
+
+
+class ReportTemplateTest(unittest.TestCase):
+
+    def test_from_element(self):
+        for parse in (etree.fromstring, objectify.fromstring):
+            template, = ReportTemplate.from_elements(parse(report_template_list).iter('REPORT_TEMPLATE'))
+            self.assertEqual((template.id, template.isGlobal, template.title, template.user),
+                             (7, 1, 'Technical Report', 'user'))
+            self.assertEqual(template.last_update, datetime.datetime(2013, 1, 2, 3, 4, 5))
+
+
+class AssetGroupTest(unittest.TestCase):
+
+    def test_from_element(self):
+        for parse in (etree.fromstring, objectify.fromstring):
+            servers, empty = AssetGroup.from_elements(parse(asset_group_list).iter('ASSET_GROUP'))
+            self.assertEqual((servers.id, servers.title, servers.business_impact), (3, 'Servers', 'High'))
+            self.assertEqual(servers.scanips, ['10.0.0.1', '10.0.0.2'])
+            self.assertEqual(servers.scandns, ['www.example.com'])
+            self.assertEqual(servers.scanner_appliances, ['scanner1'])
+            self.assertEqual((empty.scanips, empty.scandns, empty.scanner_appliances), ([], [], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+import qualysapi.cache
+import qualysapi.connector
+
+from fakes import FakeSession
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def test_calls_without_ttl_are_not_cached(self):
+        cache = qualysapi.cache.ResponseCache()
+        key = qualysapi.cache.cache_key(2, 'api/2.0/fo/scan/', {'action': 'list'})
+        cache.set(key, 'api/2.0/fo/scan/', b'<SCAN_LIST_OUTPUT/>')
+        self.assertIsNone(cache.get(key))
+
+    def test_memory_bounded_by_bytes(self):
+        cache = qualysapi.cache.ResponseCache(max_bytes=250, default_ttl=60)
+        for i in range(5):
+            cache.set(str(i), 'api/2.0/fo/asset/host/', b'x' * 100)
+        self.assertEqual(cache.size, 200)
+        self.assertIsNone(cache.get('0'))
+        self.assertEqual(cache.get('4'), b'x' * 100)
+        # Too large to keep in memory at all.
+        cache.set('5', 'api/2.0/fo/asset/host/', b'x' * 300)
+        self.assertIsNone(cache.get('5'))
+        self.assertEqual(cache.size, 200)
+
+    def test_write_invalidates_endpoint(self):
+        states = {'x': 'Running'}
+
+        def handler(method, url, data):
+            data = dict((name, value[0] if isinstance(value, list) else value) for name, value in data.items())
+            if data['action'] == 'cancel':
+                states[data['scan_ref']] = 'Canceled'
+                return 200, b'<SIMPLE_RETURN/>', {}
+            return 200, ('<SCAN_LIST_OUTPUT><STATE>%s</STATE></SCAN_LIST_OUTPUT>' %
+                         states[data['scan_ref']]).encode('ascii'), {}
+        cache = qualysapi.cache.ResponseCache(ttls={'api/2.0/fo/scan/': 60})
+        conn = qualysapi.connector.QGConnector(('user', 'password'), rate_limiter=False, cache=cache)
+        conn.session = FakeSession(handler)
+        first = conn.request('/api/2.0/fo/scan/', {'action': 'list', 'scan_ref': 'x'})
+        self.assertEqual(conn.request('/api/2.0/fo/scan/', {'action': 'list', 'scan_ref': 'x'}), first)
+        conn.request('/api/2.0/fo/scan/', {'action': 'cancel', 'scan_ref': 'x'})
+        self.assertIn(b'Canceled', conn.request('/api/2.0/fo/scan/', {'action': 'list', 'scan_ref': 'x'}))
+        actions = [data['action'] for method, url, data in conn.session.calls]
+        self.assertEqual(actions, ['list', 'cancel', 'list'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import qualysapi.checkpoint
+import qualysapi.connector
+
+from fakes import FakeSession
+
+kb = b'''<?xml version="1.0" encoding="UTF-8" ?>
+<KNOWLEDGE_BASE_VULN_LIST_OUTPUT>
+  <RESPONSE>
+    <VULN_LIST>
+      <VULN><QID>1</QID></VULN>
+      <VULN><QID>2</QID></VULN>
+    </VULN_LIST>
+  </RESPONSE>
+</KNOWLEDGE_BASE_VULN_LIST_OUTPUT>'''
+
+
+class ResumableExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, 'kb.xml')
+        conn = qualysapi.connector.QGConnector(('user', 'password'), rate_limiter=False)
+        conn.session = FakeSession(lambda method, url, data: (200, kb, {}))
+        self.export = qualysapi.checkpoint.ResumableExport(conn, '/api/2.0/fo/knowledge_base/vuln/',
+                                                           {'action': 'list'}, self.output, record_tag='VULN',
+                                                           sharded=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_short_output_restarts_export(self):
+        # Checkpoint of a finished page whose output was since cut short.
+        state = self.export.start()
+        state.update(offset=1000, records=50, cursors={'all': None})
+        self.export.checkpoint.save(state)
+        with open(self.output, 'wb') as f:
+            f.write(b'<VULN>')
+        self.assertEqual(self.export.run(), 2)
+        with open(self.output, 'rb') as f:
+            self.assertEqual(f.read(), b'<VULN><QID>1</QID></VULN>\n<VULN><QID>2</QID></VULN>\n')
+        self.assertFalse(os.path.exists(self.export.checkpoint.path))
+
+    def test_missing_output_restarts_export(self):
+        state = self.export.start()
+        state.update(offset=1000, records=50, cursors={'all': None})
+        self.export.checkpoint.save(state)
+        self.assertEqual(self.export.run(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
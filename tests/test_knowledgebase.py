@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import sys
+import unittest
+
+from lxml import etree
+
+if sys.version_info[0] < 3:
+    import qualysapi.contrib
+    import qualysapi.knowledgebase
+
+vuln = u'''<VULN>
+  <QID>38170</QID>
+  <VULN_TYPE>Information Gathered</VULN_TYPE>
+  <SEVERITY_LEVEL>2</SEVERITY_LEVEL>
+  <TITLE>SSL Certificate - Subject Common Name Does Not Match Server FQDN – Café</TITLE>
+  <DIAGNOSIS>The certificate does not match.</DIAGNOSIS>
+  <CONSEQUENCE>Clients warn.</CONSEQUENCE>
+  <SOLUTION>Replace it.</SOLUTION>
+</VULN>'''.encode('utf-8')
+
+report = u'''<ASSET_DATA_REPORT>
+  <HOST_LIST>
+    <HOST>
+      <IP>10.0.0.1</IP>
+      <DNS>host1</DNS>
+      <VULN_INFO_LIST>
+        <VULN_INFO><QID>38170</QID><RESULT>CN=other</RESULT></VULN_INFO>
+        <VULN_INFO><QID>45017</QID><RESULT>Linux</RESULT></VULN_INFO>
+      </VULN_INFO_LIST>
+    </HOST>
+  </HOST_LIST>
+  <GLOSSARY>
+    <VULN_DETAILS_LIST>
+      <VULN_DETAILS>
+        <QID>38170</QID>
+        <TITLE>SSL Certificate - Subject Common Name Does Not Match Server FQDN – Café</TITLE>
+        <SEVERITY>2</SEVERITY>
+        <THREAT>The certificate does not match.</THREAT>
+        <IMPACT>Clients warn.</IMPACT>
+        <SOLUTION>Replace it.</SOLUTION>
+      </VULN_DETAILS>
+      <VULN_DETAILS>
+        <QID>45017</QID>
+        <TITLE>Operating System Detected</TITLE>
+        <SEVERITY>2</SEVERITY>
+        <THREAT>The OS was detected.</THREAT>
+        <IMPACT>None.</IMPACT>
+        <SOLUTION>None.</SOLUTION>
+      </VULN_DETAILS>
+    </VULN_DETAILS_LIST>
+  </GLOSSARY>
+</ASSET_DATA_REPORT>'''.encode('utf-8')
+
+
+@unittest.skipIf(sys.version_info[0] >= 3, 'qualysapi.contrib is Python 2 only')
+class KnowledgeBaseReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.kb = qualysapi.knowledgebase.KnowledgeBase(None, ':memory:')
+        self.kb.upsert([self.kb.row(etree.fromstring(vuln))])
+
+    def tearDown(self):
+        self.kb.close()
+
+    def test_matches_glossary(self):
+        glossary = qualysapi.contrib.qg_parse_informational_qids(report)
+        looked_up = qualysapi.contrib.qg_parse_informational_qids(report, knowledge_base=self.kb)
+        for name in ('title', 'severity', 'threat', 'impact', 'solution'):
+            self.assertEqual(looked_up['38170'][name], glossary['38170'][name])
+        self.assertEqual(looked_up['38170']['title'],
+                         'SSL Certificate - Subject Common Name Does Not Match Server FQDN  Cafe')
+
+    def test_qid_missing_from_knowledge_base_taken_from_glossary(self):
+        looked_up = qualysapi.contrib.qg_parse_informational_qids(report, knowledge_base=self.kb)
+        self.assertEqual(looked_up['45017']['title'], 'Operating System Detected')
+        self.assertEqual(looked_up['45017']['severity'], '2')
+        self.assertEqual([host['ip'] for host in looked_up['45017']['hosts']], ['10.0.0.1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import qualysapi.ratelimit
+
+api_call = 'api/2.0/fo/asset/host/'
+
+
+@unittest.skipUnless(hasattr(os, 'fork') and qualysapi.ratelimit.fcntl is not None, 'FileBackend requires POSIX')
+class FileBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'limiter.json')
+        self.limiter = qualysapi.ratelimit.RateLimiter(qualysapi.ratelimit.FileBackend(self.path, lease_timeout=60))
+        self.limiter.update(api_call, {'X-Concurrency-Limit-Limit': '1'})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_lease_of_dead_process_expires(self):
+        pid = os.fork()
+        if pid == 0:
+            # Child: take the only call and die without releasing it.
+            qualysapi.ratelimit.RateLimiter(qualysapi.ratelimit.FileBackend(self.path)).acquire(api_call)
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertTrue(self.limiter.acquire(api_call, blocking=False))
+        self.assertEqual(self.limiter.running, 1)
+        self.assertFalse(self.limiter.acquire(api_call, blocking=False))
+        self.limiter.release(api_call)
+        self.assertEqual(self.limiter.running, 0)
+
+    def test_live_lease_outlasts_timeout(self):
+        self.assertTrue(self.limiter.acquire(api_call, blocking=False))
+        # Held by this live process for longer than lease_timeout, e.g. a long streamed export.
+        with open(self.path) as f:
+            state = json.load(f)
+        for lease in state['leases'].values():
+            lease[2] = time.time() - 120
+        with open(self.path, 'w') as f:
+            json.dump(state, f)
+        self.assertFalse(self.limiter.acquire(api_call, blocking=False))
+        self.assertEqual(self.limiter.running, 1)
+        self.limiter.release(api_call)
+        self.assertEqual(self.limiter.running, 0)
+
+    def test_lease_of_other_host_expires_after_timeout(self):
+        with open(self.path) as f:
+            state = json.load(f)
+        state['leases']['other'] = ['otherhost', 1, time.time() - 30, api_call]
+        with open(self.path, 'w') as f:
+            json.dump(state, f)
+        self.assertFalse(self.limiter.acquire(api_call, blocking=False))
+        with open(self.path) as f:
+            state = json.load(f)
+        state['leases']['other'][2] = time.time() - 120
+        with open(self.path, 'w') as f:
+            json.dump(state, f)
+        self.assertTrue(self.limiter.acquire(api_call, blocking=False))
+        self.assertEqual(self.limiter.running, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+
+import qualysapi.connector
+import qualysapi.reports
+
+from fakes import FakeSession
+
+launched = b'''<?xml version="1.0" encoding="UTF-8" ?>
+<SIMPLE_RETURN>
+  <RESPONSE>
+    <TEXT>New report launched</TEXT>
+    <ITEM_LIST><ITEM><KEY>ID</KEY><VALUE>%d</VALUE></ITEM></ITEM_LIST>
+  </RESPONSE>
+</SIMPLE_RETURN>'''
+
+refused = b'''<?xml version="1.0" encoding="UTF-8" ?>
+<SIMPLE_RETURN>
+  <RESPONSE>
+    <CODE>1965</CODE>
+    <TEXT>You have reached the maximum number of concurrent running reports.</TEXT>
+  </RESPONSE>
+</SIMPLE_RETURN>'''
+
+
+class ReportServer(object):
+    """ Report API allowing limit reports to run at once, elsewhere of them launched by other clients. Each
+    report finishes once it has been listed, and each refused launch lets one report of the others finish.
+
+    """
+
+    def __init__(self, limit, elsewhere=0):
+        self.limit = limit
+        self.elsewhere = elsewhere
+        self.reports = {}
+        self.lists = []
+
+    def __call__(self, method, url, data):
+        data = dict((name, value[0] if isinstance(value, list) else value) for name, value in data.items())
+        if data['action'] == 'launch':
+            if list(self.reports.values()).count('Running') + self.elsewhere >= self.limit:
+                self.elsewhere = max(0, self.elsewhere - 1)
+                return 409, refused, {}
+            report_id = len(self.reports) + 1
+            self.reports[report_id] = 'Running'
+            return 200, launched % report_id, {}
+        if data['action'] == 'list':
+            self.lists.append(data)
+            body = b''.join(b'<REPORT><ID>%d</ID><STATUS><STATE>%s</STATE></STATUS></REPORT>' %
+                            (report_id, state.encode('ascii')) for report_id, state in sorted(self.reports.items())
+                            if state != 'Deleted')
+            for report_id, state in self.reports.items():
+                if state == 'Running':
+                    self.reports[report_id] = 'Finished'
+            return 200, b'<REPORT_LIST_OUTPUT><RESPONSE><REPORT_LIST>' + body + \
+                b'</REPORT_LIST></RESPONSE></REPORT_LIST_OUTPUT>', {}
+        return 200, b'report %s' % data['id'].encode('ascii'), {}
+
+
+class ReportPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ReportServer(2)
+        self.conn = qualysapi.connector.QGConnector(('user', 'password'), rate_limiter=False)
+        self.conn.session = FakeSession(self.server)
+
+    def launches(self):
+        return [data['action'] for method, url, data in self.conn.session.calls].count('launch')
+
+    def test_states_of_given_reports_only(self):
+        self.server.reports.update({1: 'Running', 2: 'Running', 3: 'Running'})
+        pipeline = qualysapi.reports.ReportPipeline(self.conn)
+        self.assertEqual(pipeline.states(['1', '3']), {'1': 'Running', '3': 'Running'})
+        self.assertEqual(self.server.lists, [{'action': 'list'}])
+
+    def test_run_within_concurrent_report_limit(self):
+        pipeline = qualysapi.reports.ReportPipeline(self.conn, max_running=3, initial_delay=0)
+        jobs = pipeline.run([{'template_id': 1}] * 5)
+        self.assertEqual([job.state for job in jobs], ['Fetched'] * 5)
+        self.assertEqual(pipeline.max_running, 3)
+        # Refused launches are retried once a report is done, and the limit is probed again after a launch.
+        self.assertEqual(self.launches(), 7)
+
+    def test_refused_launch_retried_while_limit_used_elsewhere(self):
+        self.server.elsewhere = 4
+        pipeline = qualysapi.reports.ReportPipeline(self.conn, max_running=2, initial_delay=0)
+        jobs = pipeline.run([{'template_id': 1}])
+        self.assertEqual([job.state for job in jobs], ['Fetched'])
+        self.assertEqual(self.launches(), 4)
+
+    def test_report_missing_from_list_fails(self):
+        def handler(method, url, data):
+            response = self.server(method, url, data)
+            # The report is deleted by another user as soon as it is launched.
+            self.server.reports[1] = 'Deleted'
+            return response
+        self.conn.session = FakeSession(handler)
+        pipeline = qualysapi.reports.ReportPipeline(self.conn, initial_delay=0, max_missing=2)
+        job, = pipeline.run([{'template_id': 1}])
+        self.assertEqual((job.state, job.error), ('Failed', 'Missing from the report list'))
+        self.assertEqual(len(self.server.lists), 2)
+
+if __name__ == '__main__':
+    unittest.main()
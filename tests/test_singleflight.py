@@ -0,0 +1,69 @@
+import threading
+import time
+import unittest
+
+import qualysapi.singleflight
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def run_concurrently(self, group, function, callers=4):
+        """ Return outcome of group.do('key', function) in each of callers threads, joined while the first
+        call is in flight.
+
+        """
+        outcomes = [None] * callers
+        release = threading.Event()
+
+        def leader():
+            release.wait(5)
+            return function()
+
+        def call(i):
+            try:
+                outcomes[i] = group.do('key', leader)
+            except Exception as e:
+                outcomes[i] = e
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+        for thread in threads:
+            thread.start()
+        # Wait until every other caller waits on the first call.
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            with group._lock:
+                call = group._calls.get('key')
+                if call is not None and call.waiters == callers - 1:
+                    break
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_result_shared_with_waiters(self):
+        calls = []
+
+        def function():
+            calls.append(1)
+            return 'response'
+        group = qualysapi.singleflight.SingleFlight()
+        outcomes = self.run_concurrently(group, function)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(outcomes), [('response', False)] + [('response', True)] * 3)
+        self.assertEqual(group.in_flight(), 0)
+
+    def test_error_raised_in_every_waiter(self):
+        error = ValueError('Call failed.')
+
+        def function():
+            raise error
+        group = qualysapi.singleflight.SingleFlight()
+        outcomes = self.run_concurrently(group, function)
+        self.assertEqual(outcomes, [error] * 4)
+        self.assertEqual(group.in_flight(), 0)
+        # The failure is not remembered, the next call is made again.
+        self.assertEqual(group.do('key', lambda: 'response'), ('response', False))
+
+
+if __name__ == '__main__':
+    unittest.main()
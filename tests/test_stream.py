@@ -0,0 +1,86 @@
+import gc
+import tempfile
+import unittest
+
+import requests
+
+import qualysapi.connector
+import qualysapi.exceptions
+import qualysapi.stream
+
+from fakes import FakeSession
+
+
+class ResponseStreamTest(unittest.TestCase):
+
+    def test_unclosed_stream_releases_its_lease(self):
+        body = b'<HOST_LIST_OUTPUT>' + b'x' * 100000 + b'</HOST_LIST_OUTPUT>'
+        conn = qualysapi.connector.QGConnector(('user', 'password'))
+        conn.session = FakeSession(lambda method, url, data: (200, body, {'X-Concurrency-Limit-Limit': '2'}))
+        # With a concurrency limit of 2, the third leaked stream would block forever.
+        for i in range(4):
+            response = conn.request('/api/2.0/fo/asset/host/', {'action': 'list'}, stream=True)
+            response.read(10)
+            del response
+            gc.collect()
+        self.assertEqual(conn.rate_limiter.running, 0)
+
+    def test_failed_stream_releases_its_lease(self):
+        def handler(method, url, data):
+            raise requests.ConnectionError('Connection refused.')
+        conn = qualysapi.connector.QGConnector(('user', 'password'))
+        conn.rate_limiter.update('api/2.0/fo/asset/host/', {'X-Concurrency-Limit-Limit': '2'})
+        conn.session = FakeSession(handler)
+        # Leaked leases would use up the concurrency limit of 2, and the next call would block forever.
+        for i in range(2):
+            self.assertRaises(requests.ConnectionError, conn.request, '/api/2.0/fo/asset/host/',
+                              {'action': 'list'}, stream=True)
+        self.assertEqual(conn.rate_limiter.running, 0)
+
+
+class SpooledResponseTest(unittest.TestCase):
+
+    def spool(self, body, memory_budget=10):
+        session = FakeSession(lambda method, url, data: (200, body, {'Content-Length': str(len(body))}))
+        return qualysapi.stream.read_response(session.get('url', stream=True), memory_budget, 4)
+
+    def test_spooled_response(self):
+        body = b'<HOST_LIST_OUTPUT>\xc3\xa9</HOST_LIST_OUTPUT>'
+        with self.spool(body) as response:
+            self.assertIsInstance(response, qualysapi.stream.SpooledResponse)
+            self.assertEqual(response.getvalue(), body)
+            self.assertEqual(response.head, body[:4])
+            self.assertIn(b'</HOST_LIST_OUTPUT>', response)
+            self.assertEqual(str(response), body if bytes is str else body.decode('utf-8'))
+
+    def test_empty_spooled_response(self):
+        with qualysapi.stream.SpooledResponse(tempfile.TemporaryFile(), b'') as response:
+            self.assertEqual(len(response), 0)
+            self.assertEqual(response.getvalue(), b'')
+            self.assertEqual(response.read(), b'')
+            self.assertEqual(response.find(b'<'), -1)
+
+    def test_error_closes_spooled_response(self):
+        body = (b'<SIMPLE_RETURN><RESPONSE><CODE>999</CODE><TEXT>Internal error</TEXT></RESPONSE></SIMPLE_RETURN>' +
+                b' ' * 1000)
+        spooled = []
+        read_response = qualysapi.stream.read_response
+
+        def spool(*args):
+            spooled.append(read_response(*args))
+            return spooled[-1]
+        conn = qualysapi.connector.QGConnector(('user', 'password'), rate_limiter=False, memory_budget=100)
+        conn.session = FakeSession(lambda method, url, data: (500, body, {}))
+        qualysapi.stream.read_response = spool
+        try:
+            self.assertRaises(qualysapi.exceptions.ServerError, conn.request, '/api/2.0/fo/scan/',
+                              {'action': 'launch'})
+        finally:
+            qualysapi.stream.read_response = read_response
+        self.assertEqual(len(spooled), 1)
+        self.assertIsNone(spooled[0].mm)
+        self.assertTrue(spooled[0].file.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()